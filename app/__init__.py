@@ -1,20 +1,28 @@
 """ This file has initialization code for the app """
 
-from flask import current_app
+from flask import current_app, has_app_context
 from flask_bcrypt import Bcrypt
 import jwt
+import hashlib
+import hmac
+import secrets
+import uuid
 from datetime import datetime, timedelta
 
+from app.access import load_grocery_item, load_grocery_list
 from app.authentication import get_authenticated_user
-from app.models import utilities
+from app.models import utilities, units
+from app.tracing import span
 
 from flask import Flask, request, jsonify, make_response
-from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS,cross_origin
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
 
 from configuration.config import APP_CONFIG
+from app.database import ShardedSQLAlchemy, UserMoving
 
-db = SQLAlchemy()
+db = ShardedSQLAlchemy()
 
 
 def create_app(config_name):
@@ -29,9 +37,32 @@ def create_app(config_name):
         'title': 'RideCo grocery store application'
     }
     db.init_app(app)
+    # first, so that the traces and profiles include the other request hooks
+    from app.tracing import start_tracing
+    start_tracing(app)
+    from app.memprofile import start_memory_profiler
+    start_memory_profiler(app)
     CORS(app)
+    from app.ratelimit import limiter
+    limiter.init_app(app)
+    from app.compression import compression
+    compression.init_app(app)
+    from app.purge import start_purge_worker
+    start_purge_worker(app)
+    from app.groupcommit import start_group_commit
+    start_group_commit(app)
+    from app.slowquery import start_slow_query_log
+    start_slow_query_log(app)
+    from app.idempotency import idempotent
+
+    @app.errorhandler(UserMoving)
+    def user_moving(error):
+        response = make_response(jsonify({'message': str(error)}), 503)
+        response.headers['Retry-After'] = '5'
+        return response
 
     @app.route('/grocerylists/', methods=['POST', 'GET'])
+    @idempotent
     def grocerylists():
         """
         For viewing and adding shopping lists
@@ -61,14 +92,16 @@ def create_app(config_name):
                 if 'description' in keys_of_receieved_data:
                     description = received_data['description']
                 if len(title) > 0:
-                    grocerylist = GroceryList(title=title, description=description,
-                                              owner=user)
-                    grocerylist.save()
-                    response = jsonify({
-                        'id': grocerylist.id,
-                        'title': grocerylist.title,
-                        'description': grocerylist.description
-                    })
+                    with span('db.insert'):
+                        grocerylist = GroceryList(title=title, description=description,
+                                                  owner=user)
+                        grocerylist.save()
+                    with span('serialize'):
+                        response = jsonify({
+                            'id': grocerylist.id,
+                            'title': grocerylist.title,
+                            'description': grocerylist.description
+                        })
                     return make_response(response), 201
 
                 else:
@@ -82,11 +115,10 @@ def create_app(config_name):
             search_title = request.args.get('q') or None
             limit = request.args.get('limit') or None
             page = request.args.get('page') or None
-            grocerylists_query = GroceryList.query.filter_by(owner=user)
+            grocerylists_query = GroceryList.active().filter_by(owner=user)
             if search_title:
                 search = '%' + search_title + '%'
                 grocerylists_query = grocerylists_query.filter(GroceryList.title.ilike(search))
-            grocerylists = grocerylists_query.all()
             if limit or page:
                 # get the defaults if any of the args is None
                 limit = limit or app.config['LISTS_PER_PAGE']
@@ -99,17 +131,74 @@ def create_app(config_name):
                     return make_response(jsonify({'message':
                                                       'limit and page query parameters should be integers'})), 400
                 # return an empty list if no grocery lists are found
-                grocerylists = grocerylists_query.paginate(page, limit, False).items
+                with span('db.query', paginated=True):
+                    grocerylists = grocerylists_query.paginate(page, limit, False).items
+            else:
+                with span('db.query', paginated=False):
+                    grocerylists = grocerylists_query.all()
+
+            with span('serialize', rows=len(grocerylists)):
+                response = []
+                for each_list in grocerylists:
+                    obj = {
+                        'id': each_list.id,
+                        'title': each_list.title,
+                        'description': each_list.description
+                    }
+                    response.append(obj)
+                response = make_response(jsonify(response))
+            return response, 200
+
+    @app.route('/grocerylists/aggregate', methods=['GET'])
+    def aggregate_grocerylists():
+        """
+        The items of several grocery lists combined, with the quantities
+        of the same name and unit summed in one GROUP BY query
+        """
+        unauthorized_data = {'message': 'You do not have the appropriate permissions'}  # 403
+        user = get_authenticated_user(request)
+        if isinstance(user, str):
+            return make_response(jsonify({'message': user})), 401
+        if not user:
+            # User is not authenticated
+            return make_response(jsonify(unauthorized_data)), 403
 
-            response = []
-            for each_list in grocerylists:
-                obj = {
-                    'id': each_list.id,
-                    'title': each_list.title,
-                    'description': each_list.description
-                }
-                response.append(obj)
-            return make_response(jsonify(response)), 200
+        ids = request.args.get('ids') or ''
+        try:
+            ids = [int(each_id) for each_id in ids.split(',') if each_id.strip()]
+        except ValueError:
+            return make_response(jsonify({'message':
+                                              'ids should be comma separated integers'})), 400
+        convert = (request.args.get('convert') or '').lower() in ('1', 'true', 'yes')
+
+        name = func.lower(func.trim(GroceryItem.name))
+        if convert:
+            # items written before the base unit was stored keep their own unit
+            unit = func.coalesce(GroceryItem.base_unit, units.normalized_unit(GroceryItem.unit))
+            quantity = func.coalesce(GroceryItem.base_quantity, GroceryItem.quantity)
+        else:
+            unit = units.normalized_unit(GroceryItem.unit)
+            quantity = GroceryItem.quantity
+        query = db.session.query(
+            name.label('name'), unit.label('unit'),
+            func.sum(func.coalesce(quantity, 0)).label('quantity'),
+            func.count(GroceryItem.id).label('items')
+        ).join(GroceryList, GroceryItem.grocery_list_id == GroceryList.id).filter(
+            GroceryList.user_id == user.id,
+            GroceryList.deleted_at.is_(None),
+            GroceryItem.deleted_at.is_(None))
+        if ids:
+            # lists of other users or that do not exist are left out by the filter above
+            query = query.filter(GroceryList.id.in_(ids))
+        rows = query.group_by(name, unit).order_by(name, unit).all()
+
+        response = [{
+            'name': row.name,
+            'unit': row.unit,
+            'quantity': row.quantity,
+            'items': row.items
+        } for row in rows]
+        return make_response(jsonify(response)), 200
 
     @app.route('/grocerylists/<int:id>', methods=['GET', 'PUT', 'DELETE'])
     def single_grocerylist(id, **kwargs):
@@ -117,7 +206,6 @@ def create_app(config_name):
         This route handles the view, edit and deletion of a grocerylist
         """
         unauthorized_data = {'message': 'You do not have the appropriate permissions'}  # 403
-        non_existent_object = {'message': 'The shopping list does not exist'}
         from app.authentication import get_authenticated_user
         user = get_authenticated_user(request)
         if isinstance(user, str):
@@ -127,12 +215,13 @@ def create_app(config_name):
             # User is not authenticated
             return make_response(jsonify(unauthorized_data)), 403
 
-        grocerylist = GroceryList.query.get(int(id))
-        if not grocerylist:
-            # shoppinglist does not exist
-            return make_response(jsonify(non_existent_object)), 404
+        # anyone authenticated may view the list, only its owner may change it
+        loaded = load_grocery_list(user, id, owner_only=request.method != 'GET')
+        if not loaded.ok:
+            return loaded.response()
+        grocerylist = loaded.grocery_list
 
-        if request.method == 'PUT' and grocerylist.owner == user:
+        if request.method == 'PUT':
             received_data = request.get_json(force=True)
 
             if received_data:
@@ -161,14 +250,14 @@ def create_app(config_name):
             else:  # if  no data provided
                 return make_response(jsonify({'message': 'no data was sent'})), 400
 
-        if request.method == 'DELETE' and grocerylist.owner == user:
-            # Delete the shoppinglist if it belongs to current user
-            grocerylist.delete()
+        if request.method == 'DELETE':
+            # Delete the shoppinglist, it belongs to current user
+            # the rows are purged later, see app.purge
+            grocerylist.soft_delete()
             return make_response(jsonify(
                 {'message': 'Grocery list successfully deleted'})), 200
 
-        if request.method == 'GET' and user:
-            # Anyone authenticated is allowed to view these
+        if request.method == 'GET':
             response = {
                 'id': grocerylist.id,
                 'title': grocerylist.title,
@@ -178,9 +267,9 @@ def create_app(config_name):
 
     @app.route('/grocerylists/<int:id>/items/', methods=['GET', 'POST'])
     @cross_origin()
+    @idempotent
     def all_items_of_grocerylist(id):
         unauthorized_data = {'message': 'You do not have the appropriate permissions'}  # 403
-        non_existent_grocerylist = {'message': 'The grocery list does not exist'}
         user = get_authenticated_user(request)
         if isinstance(user, str):
             # Has logged out
@@ -189,10 +278,12 @@ def create_app(config_name):
             # User is not authenticated
             return make_response(jsonify(unauthorized_data)), 403
 
-        grocerylist = GroceryList.query.get(int(id))
-        if not grocerylist:
-            return make_response(jsonify(non_existent_grocerylist)), 404
-        if request.method == 'POST' and user:
+        # anyone authenticated may view the items, only the owner may add some
+        loaded = load_grocery_list(user, id, owner_only=request.method != 'GET')
+        if not loaded.ok:
+            return loaded.response()
+        grocerylist = loaded.grocery_list
+        if request.method == 'POST':
             # get the data from the request
             received_data = request.get_json(force=True)
 
@@ -212,15 +303,29 @@ def create_app(config_name):
                 if 'unit' in keys_of_receieved_data:
                     unit = received_data['unit']
                 if len(name) > 0:
-                    groceryitem = GroceryItem(name=name, quantity=quantity,
-                                              parent_list=grocerylist, unit=unit)
-                    groceryitem.save()
-                    response = jsonify({
-                        'id': groceryitem.id,
-                        'name': groceryitem.name,
-                        'quantity': groceryitem.quantity,
-                        'unit': groceryitem.unit
-                    })
+                    group_commit = app.extensions.get('groupcommit')
+                    if group_commit:
+                        # committed together with the inserts of other requests
+                        from app.groupcommit import GroupCommitError
+                        db.check_writable()
+                        try:
+                            created = group_commit.insert_item(
+                                grocerylist.id, name, quantity, unit,
+                                shard=db.session.info.get('shard'))
+                        except GroupCommitError:
+                            return make_response(jsonify(
+                                {'message': 'The item could not be saved. Try again'})), 500
+                    else:
+                        groceryitem = GroceryItem(name=name, quantity=quantity,
+                                                  parent_list=grocerylist, unit=unit)
+                        groceryitem.save()
+                        created = {
+                            'id': groceryitem.id,
+                            'name': groceryitem.name,
+                            'quantity': groceryitem.quantity,
+                            'unit': groceryitem.unit
+                        }
+                    response = jsonify(created)
                     response.headers.add('Access-Control-Allow-Origin', '*')
                     return make_response(response), 201
 
@@ -230,17 +335,16 @@ def create_app(config_name):
             else:
                 return make_response(jsonify({'message': 'no data was sent'})), 400
 
-        if request.method == 'GET' and user:
+        if request.method == 'GET':
             # get all the items that belong to the list
             # search and pagination
             search_name = request.args.get('q') or None
             limit = request.args.get('limit') or None
             page = request.args.get('page') or None
-            grocery_items_query = GroceryItem.query.filter_by(parent_list=grocerylist)
+            grocery_items_query = GroceryItem.active().filter_by(parent_list=grocerylist)
             if search_name:
                 search = '%' + search_name + '%'
                 grocery_items_query = grocery_items_query.filter(GroceryItem.name.ilike(search))
-            items = grocery_items_query.all()
             if limit or page:
                 # get the defaults if any of the args is None
                 limit = limit or app.config['ITEMS_PER_PAGE']
@@ -253,6 +357,8 @@ def create_app(config_name):
                     return make_response(jsonify({'message':
                                                       'limit and page query parameters should be integers'})), 400
                 items = grocery_items_query.paginate(page, limit, False).items
+            else:
+                items = grocery_items_query.all()
             response = []
             for item in items:
                 obj = {
@@ -264,13 +370,128 @@ def create_app(config_name):
                 response.append(obj)
             return make_response(jsonify(response)), 200
 
+    @app.route('/grocerylists/<int:id>/items/', methods=['PATCH'])
+    @cross_origin()
+    def batch_update_items(id):
+        """
+        Apply an ordered array of add, update and remove operations to the
+        items of a grocerylist in one transaction. Expected payload
+        [{'op': 'add', 'name': 'eggs', 'quantity': 12, 'unit': 'units'},
+         {'op': 'update', 'id': 3, 'quantity': 2},
+         {'op': 'remove', 'id': 4}]
+        Either every operation is applied or none is
+        """
+        unauthorized_data = {'message': 'You do not have the appropriate permissions'}  # 403
+        invalid_data = {'message': 'The data you sent was in the wrong structure'}
+        user = get_authenticated_user(request)
+        if isinstance(user, str):
+            # Has logged out
+            return make_response(jsonify({'message': user})), 401
+        if not user:
+            # User is not authenticated
+            return make_response(jsonify(unauthorized_data)), 403
+
+        # only owners of the list are allowed to change its items
+        loaded = load_grocery_list(user, id)
+        if not loaded.ok:
+            return loaded.response()
+        grocerylist = loaded.grocery_list
+
+        operations = request.get_json(force=True, silent=True)
+        if isinstance(operations, dict):
+            operations = operations.get('operations')
+        if not operations:
+            return make_response(jsonify({'message': 'no data was sent'})), 400
+        if not isinstance(operations, list):
+            return make_response(jsonify(invalid_data)), 400
+
+        # validate every operation before anything is changed
+        errors = []
+        target_ids = set()
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict) or \
+                    operation.get('op') not in ('add', 'update', 'remove'):
+                errors.append({'index': index, 'message': 'op should be add, update or remove'})
+                continue
+            if 'name' in operation and (not isinstance(operation['name'], str)
+                                        or not operation['name'].strip()):
+                errors.append({'index': index, 'message': 'name should be a non empty string'})
+            if 'quantity' in operation and (isinstance(operation['quantity'], bool) or
+                                            not isinstance(operation['quantity'], (int, float))):
+                errors.append({'index': index, 'message': 'quantity should be a number'})
+            if 'unit' in operation and not isinstance(operation['unit'], str):
+                errors.append({'index': index, 'message': 'unit should be a string'})
+            if operation['op'] == 'add':
+                if 'name' not in operation:
+                    errors.append({'index': index, 'message': 'name is required to add an item'})
+            elif isinstance(operation.get('id'), int) and not isinstance(operation['id'], bool):
+                target_ids.add(operation['id'])
+            else:
+                errors.append({'index': index, 'message': 'id should be the id of an item'})
+
+        # load every item that is updated or removed with one query
+        items = {}
+        if target_ids:
+            items = dict((item.id, item) for item in GroceryItem.active().filter(
+                GroceryItem.grocery_list_id == grocerylist.id,
+                GroceryItem.id.in_(target_ids)).all())
+        removed = set()
+        for index, operation in enumerate(operations):
+            if isinstance(operation, dict) and operation.get('op') in ('update', 'remove') \
+                    and operation.get('id') in target_ids:
+                if operation['id'] not in items or operation['id'] in removed:
+                    errors.append({'index': index, 'message': 'The grocery item does not exist'})
+                elif operation['op'] == 'remove':
+                    removed.add(operation['id'])
+        if errors:
+            response = dict(invalid_data, errors=errors)
+            return make_response(jsonify(response)), 400
+
+        results = []
+        for operation in operations:
+            if operation['op'] == 'add':
+                grocery_item = GroceryItem(name=operation['name'],
+                                           quantity=operation.get('quantity', 0),
+                                           unit=operation.get('unit', 'units'),
+                                           parent_list=grocerylist)
+                db.session.add(grocery_item)
+            else:
+                grocery_item = items[operation['id']]
+            if operation['op'] == 'update':
+                if 'name' in operation:
+                    grocery_item.set_name(operation['name'], commit=False)
+                if 'quantity' in operation:
+                    grocery_item.set_quantity(operation['quantity'], commit=False)
+                if 'unit' in operation:
+                    grocery_item.set_unit(operation['unit'], commit=False)
+            elif operation['op'] == 'remove':
+                grocery_item.soft_delete(commit=False)
+            results.append((operation['op'], grocery_item))
+        try:
+            # flush to get the ids of the added items before the one commit
+            db.session.flush()
+            response = []
+            for op, grocery_item in results:
+                obj = {'op': op, 'id': grocery_item.id}
+                if op != 'remove':
+                    obj.update({
+                        'name': grocery_item.name,
+                        'quantity': grocery_item.quantity,
+                        'unit': grocery_item.unit
+                    })
+                response.append(obj)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            return make_response(jsonify(
+                {'message': 'The operations could not be saved. Try again'})), 500
+        return make_response(jsonify(response)), 200
+
     @app.route('/grocerylists/<int:id>/items/<int:item_id>', methods=['GET', 'PUT', 'DELETE'])
     @cross_origin()
     def single_groceryitem(id, item_id):
 
         unauthorized_data = {'message': 'You do not have the appropriate permissions'}  # 403
-        non_existent_grocery_list = {'message': 'The grocery list does not exist'}
-        non_existent_grocery_item = {'message': 'The grocery item does not exist'}
         user = get_authenticated_user(request)
         if isinstance(user, str):
             # Has logged out
@@ -279,15 +500,13 @@ def create_app(config_name):
             # User is not authenticated
             return make_response(jsonify(unauthorized_data)), 403
 
-        grocery_list = GroceryList.query.get(int(id))
-        if not grocery_list:
-            return make_response(jsonify(non_existent_grocery_list)), 404
-
-        grocery_item = GroceryItem.query.get(int(item_id))
-        if not grocery_item or not grocery_item.parent_list == grocery_list:
-            return make_response(jsonify(non_existent_grocery_item)), 404
+        # the item and its list in one query, only the owner may change them
+        loaded = load_grocery_item(user, id, item_id, owner_only=request.method != 'GET')
+        if not loaded.ok:
+            return loaded.response()
+        grocery_item = loaded.grocery_item
 
-        if request.method == 'PUT' and grocery_list.owner == user:
+        if request.method == 'PUT':
             received_data = request.get_json(force=True)
 
             if received_data:
@@ -322,16 +541,14 @@ def create_app(config_name):
             else:  # if  no data provided
                 return make_response(jsonify({'message': 'no data was sent'})), 400
 
-        if request.method == 'DELETE' and grocery_list.owner == user:
-            # only owners of the parent list are allowed to delete an item
+        if request.method == 'DELETE':
             # attempt to delete the item
-            grocery_item.delete()
+            grocery_item.soft_delete()
             # send success message
             return make_response(jsonify(
                 {'message': 'Grocery item successfully deleted'})), 200
 
-        if request.method == 'GET' and user:
-            # any one authenticated is allowed to view the items of the list
+        if request.method == 'GET':
             # form the response object
             response = {
                 'id': grocery_item.id,
@@ -346,6 +563,24 @@ def create_app(config_name):
     from .authentication import auth_blueprint
     app.register_blueprint(auth_blueprint)
 
+    # register the transfer blueprint
+    from .transfer import transfer_blueprint
+    app.register_blueprint(transfer_blueprint)
+
+    # register the sync blueprint
+    from .sync import sync_blueprint
+    app.register_blueprint(sync_blueprint)
+
+    # register the suggest blueprint
+    from .suggest import suggest_blueprint, suggestion_index
+    suggestion_index.init_app(app)
+    app.register_blueprint(suggest_blueprint)
+
+    # register the search blueprint
+    from .search import search_blueprint, search_index
+    search_index.init_app(app)
+    app.register_blueprint(search_blueprint)
+
     return app
 
 
@@ -359,7 +594,13 @@ class User(db.Model):
     email = db.Column(db.String(256), nullable=False)
     name = db.Column(db.String(150), nullable=False)
     password = db.Column(db.String(256), nullable=False)
+    # the shard of the lists and items of the user, None for the default one
+    shard = db.Column(db.Integer)
+    # set while the lists and items are moved to another shard, see rebalance_user
+    moving = db.Column(db.Boolean, nullable=False, default=False)
+    # joined without a foreign key, the lists can live on a shard without the user table
     grocery_lists = db.relationship('GroceryList', backref='owner',
+                                    primaryjoin='User.id == foreign(GroceryList.user_id)',
                                     lazy='dynamic', cascade='all, delete-orphan')
 
     def __init__(self, name, email, password, username):
@@ -369,7 +610,7 @@ class User(db.Model):
         if utilities.check_email_format(email):
             self.email = email
         if utilities.check_password_format(password):
-            self.password = Bcrypt().generate_password_hash(password).decode()
+            self.password = User.hash_password(password)
         if utilities.check_type(username, str,
                                 error_string="A user's username can only be a string"):
             self.username = username
@@ -380,6 +621,14 @@ class User(db.Model):
             self.name = name
             db.session.commit()
 
+    @staticmethod
+    def hash_password(password):
+        """
+        bcrypt hash of password with the BCRYPT_LOG_ROUNDS of the app
+        """
+        rounds = current_app.config.get('BCRYPT_LOG_ROUNDS') if has_app_context() else None
+        return Bcrypt().generate_password_hash(password, rounds and int(rounds)).decode()
+
     def password_is_valid(self, password):
         return Bcrypt().check_password_hash(self.password, password)
 
@@ -399,7 +648,7 @@ class User(db.Model):
     def set_password(self, password):
         self.password = password
         if utilities.check_password_format(password):
-            self.password = Bcrypt().generate_password_hash(password).decode()
+            self.password = User.hash_password(password)
             db.session.commit()
 
     def create_grocery_list(self, title):
@@ -409,13 +658,30 @@ class User(db.Model):
         """
         grocery_list = GroceryList(title, owner=self)
         grocery_list.save()
-        return GroceryList.query.filter_by(title=title).first()
+        return GroceryList.active().filter_by(title=title, owner=self).first()
 
     def get_grocery_lists(self):
         """
         Get all the shopping lists that belong to the user
         """
-        return GroceryList.query.filter_by(owner=self).all()
+        return GroceryList.active().filter_by(owner=self).all()
+
+    def iter_grocery_lists_with_items(self, batch_size=1000):
+        """
+        Iterate over (list id, title, description, item id, name, quantity,
+        unit) rows of all the lists of the user and their items, ordered by
+        list. It is a single outer join fetched batch_size rows at a time
+        so that big accounts are not loaded into memory
+        """
+        return db.session.query(
+            GroceryList.id, GroceryList.title, GroceryList.description,
+            GroceryItem.id, GroceryItem.name, GroceryItem.quantity, GroceryItem.unit
+        ).outerjoin(
+            GroceryItem, db.and_(GroceryItem.grocery_list_id == GroceryList.id,
+                                 GroceryItem.deleted_at.is_(None))
+        ).filter(
+            GroceryList.user_id == self.id, GroceryList.deleted_at.is_(None)
+        ).order_by(GroceryList.id, GroceryItem.id).yield_per(batch_size)
 
     def get_grocery_list_by_title(self, title):
         """
@@ -424,7 +690,7 @@ class User(db.Model):
         """
         shopping_list = None
         if utilities.check_type(title, str):
-            shopping_list = GroceryList.query.filter_by(title=title, owner=self).first()
+            shopping_list = GroceryList.active().filter_by(title=title, owner=self).first()
         return shopping_list
 
     def delete_shopping_list(self, grocery_list):
@@ -432,7 +698,7 @@ class User(db.Model):
             raise TypeError('Object is not a grocery list object')
         if not grocery_list.owner == self:
             raise KeyError('Grocery list does not exist')
-        grocery_list.delete()
+        grocery_list.soft_delete()
 
     def generate_token(self, user_id):
         """
@@ -463,8 +729,10 @@ class User(db.Model):
         """
         try:
             # decode using the app SECRET
-            payload = jwt.decode(token, current_app.config.get('SECRET'))
-            is_blacklisted = BlacklistToken.check_blacklist(token)
+            with span('auth.token_decode'):
+                payload = jwt.decode(token, current_app.config.get('SECRET'))
+            with span('auth.blacklist_check'):
+                is_blacklisted = BlacklistToken.check_blacklist(token)
             if is_blacklisted:
                 return 'You are already logged out'
             return payload['sub']
@@ -493,12 +761,39 @@ class User(db.Model):
         return "<User: %s>" % self.username
 
 
-class GroceryList(db.Model):
+class SoftDeleteMixin(object):
+    """
+    Deleting a row only sets its deleted_at tombstone, and the tombstoned
+    rows are hard deleted later in batches by app.purge.
+    Reads should start from active() so that tombstones are left out
+    """
+    deleted_at = db.Column(db.DateTime, index=True)
+
+    @classmethod
+    def active(cls):
+        """
+        The query of the rows that are not deleted
+        """
+        return cls.query.filter(cls.deleted_at.is_(None))
+
+    def soft_delete(self, commit=True):
+        """
+        Mark the row as deleted, keeping it as a tombstone
+        """
+        self.deleted_at = datetime.utcnow()
+        if commit:
+            db.session.commit()
+
+
+class GroceryList(SoftDeleteMixin, db.Model):
     __tablename__ = 'grocerylist'
+    __table_args__ = {'info': {'sharded': True}}
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(160), nullable=False)
     description = db.Column(db.String(200))
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    # the id of the owner, not a foreign key since the user table is not on the shards
+    user_id = db.Column(db.Integer, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     items = db.relationship('GroceryItem', backref='parent_list',
                             lazy='dynamic', cascade='all, delete-orphan')
 
@@ -530,23 +825,23 @@ class GroceryList(db.Model):
         if utilities.check_type(item_name, str):
             grocery_item = GroceryItem(item_name, parent_list=self)
             grocery_item.save()
-            return GroceryItem.query.filter_by(name=item_name, parent_list=self).first()
+            return GroceryItem.active().filter_by(name=item_name, parent_list=self).first()
 
     def delete_item(self, item):
         if not isinstance(item, GroceryItem):
             raise TypeError('The item is of invalid type')
         if item.parent_list == self:
-            item.delete()
+            item.soft_delete()
         else:
             raise KeyError('The item does not exist')
 
     def get_grocery_items(self):
-        return GroceryItem.query.filter_by(parent_list=self).all()
+        return GroceryItem.active().filter_by(parent_list=self).all()
 
     def get_grocery_item_by_name(self, name):
         grocery_item = None
         if utilities.check_type(name, str):
-            grocery_list = GroceryList.query.filter_by(name=name, parent_list=self).first()
+            grocery_item = GroceryItem.active().filter_by(name=name, parent_list=self).first()
         return grocery_item
 
     def save(self):
@@ -561,13 +856,18 @@ class GroceryList(db.Model):
         return "<GroceryList: %s>" % self.title
 
 
-class GroceryItem(db.Model):
+class GroceryItem(SoftDeleteMixin, db.Model):
     __tablename__ = 'groceryitem'
+    __table_args__ = {'info': {'sharded': True}}
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120))
     quantity = db.Column(db.Float)
     unit = db.Column(db.String(60))
-    grocery_list_id = db.Column(db.Integer, db.ForeignKey('grocerylist.id'))
+    # the quantity converted to the base unit of the dimension of unit
+    base_unit = db.Column(db.String(60))
+    base_quantity = db.Column(db.Float)
+    grocery_list_id = db.Column(db.Integer, db.ForeignKey('grocerylist.id'), index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def __init__(self, name, quantity=0, unit='', parent_list=None):  # , parent_list=None):
         # test that an item is never created parent_list = None
@@ -581,23 +881,36 @@ class GroceryItem(db.Model):
                 self.quantity = float(quantity)
             if utilities.check_type(unit, str):
                 self.unit = unit
+            self.normalize_quantity()
         else:
             raise ValueError('Invalid arguments')
 
-    def set_name(self, name):
+    def normalize_quantity(self):
+        """
+        Store the quantity in the base unit of its dimension
+        so that items in different units can be summed
+        """
+        self.base_unit, self.base_quantity = units.registry.to_base(self.quantity, self.unit)
+
+    def set_name(self, name, commit=True):
         if utilities.check_type(name, str):
             self.name = name
-            db.session.commit()
+            if commit:
+                db.session.commit()
 
-    def set_unit(self, unit):
+    def set_unit(self, unit, commit=True):
         if utilities.check_type(unit, str):
             self.unit = unit
-            db.session.commit()
+            self.normalize_quantity()
+            if commit:
+                db.session.commit()
 
-    def set_quantity(self, quantity):
+    def set_quantity(self, quantity, commit=True):
         if utilities.check_type(quantity, float, int):
             self.quantity = float(quantity)
-            db.session.commit()
+            self.normalize_quantity()
+            if commit:
+                db.session.commit()
 
     def save(self):
         db.session.add(self)
@@ -607,10 +920,147 @@ class GroceryItem(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    @staticmethod
+    def backfill_base_units(batch_size=1000):
+        """
+        Fill in the base unit and quantity of the items written before they
+        were stored, on every shard, batch_size items per transaction.
+        Returns the number of items updated
+        """
+        updated = 0
+        for shard in db.shard_ids():
+            with db.using_shard(shard):
+                while True:
+                    rows = db.session.query(
+                        GroceryItem.id, GroceryItem.quantity, GroceryItem.unit
+                    ).filter(GroceryItem.base_unit.is_(None)).order_by(
+                        GroceryItem.id).limit(batch_size).all()
+                    if not rows:
+                        break
+                    ids, quantities, unit_names = zip(*rows)
+                    base_units, base_quantities = units.registry.to_base_many(
+                        [quantity or 0.0 for quantity in quantities], unit_names)
+                    db.session.bulk_update_mappings(GroceryItem, [
+                        {'id': item_id, 'base_unit': base_unit,
+                         'base_quantity': float(base_quantity)}
+                        for item_id, base_unit, base_quantity
+                        in zip(ids, base_units, base_quantities)])
+                    db.session.commit()
+                    updated += len(rows)
+        return updated
+
     def __repr__(self):
         return "<GroceryItem: %s>" % self.name
 
 
+class ChangeLog(db.Model):
+    """
+    Append-only log of the changes made to the lists and items of a user.
+    The id of the last entry a client has seen is its sync watermark.
+    It lives on the shard of the user so that an entry is committed with
+    the change it records
+    """
+    __tablename__ = 'changelog'
+    __table_args__ = (db.Index('ix_changelog_user_id_id', 'user_id', 'id'),
+                      {'info': {'sharded': True}})
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    ENTITIES = {'grocerylist': 'list', 'groceryitem': 'item'}
+
+    @staticmethod
+    def since(user_id, watermark, limit):
+        """
+        The entries of the user after the watermark, oldest first
+        """
+        return ChangeLog.query.filter(
+            ChangeLog.user_id == user_id, ChangeLog.id > watermark
+        ).order_by(ChangeLog.id).limit(limit).all()
+
+    def __repr__(self):
+        return '<ChangeLog: %s %s %s>' % (self.operation, self.entity, self.entity_id)
+
+
+def _change_owner(session, obj):
+    """
+    The id of the user owning a changed list or item
+    """
+    if isinstance(obj, GroceryList):
+        return obj.user_id if obj.user_id is not None else obj.owner.id
+    grocery_list = obj.parent_list
+    if grocery_list is None and obj.grocery_list_id is not None:
+        grocery_list = session.query(GroceryList).get(obj.grocery_list_id)
+    return grocery_list.user_id if grocery_list is not None else None
+
+
+@event.listens_for(Session, 'after_flush')
+def record_changes(session, flush_context):
+    """
+    Write a ChangeLog entry for every list and item created, updated or
+    deleted by the flush, in the same transaction
+    """
+    changes = []
+    for operation, objects in (('create', session.new), ('update', session.dirty),
+                               ('delete', session.deleted)):
+        for obj in objects:
+            if not isinstance(obj, (GroceryList, GroceryItem)):
+                continue
+            change = operation
+            if operation == 'update':
+                if not session.is_modified(obj, include_collections=False):
+                    continue
+                if obj.deleted_at is not None:
+                    # setting the tombstone is a delete for the clients
+                    change = 'delete'
+            changes.append((change, obj))
+    if not changes:
+        return
+    rows = []
+    with session.no_autoflush:
+        for operation, obj in changes:
+            user_id = _change_owner(session, obj)
+            if user_id is None:
+                continue
+            rows.append({'user_id': user_id, 'entity': obj.__tablename__,
+                         'entity_id': obj.id, 'operation': operation,
+                         'changed_at': datetime.utcnow()})
+    if not rows:
+        return
+    if db.shard_count(session.app):
+        # ids in the order they are handed out on every shard, so that a
+        # watermark stays valid when the user is moved to another shard
+        start = db.ids.reserve(db, session.app, ChangeLog.__tablename__, count=len(rows))
+        for offset, row in enumerate(rows):
+            row['id'] = start + offset
+    session.execute(ChangeLog.__table__.insert(), rows, mapper=ChangeLog.__mapper__)
+
+
+class IdempotencyKey(db.Model):
+    """
+    The stored response of a POST sent with an Idempotency-Key header.
+    status_code is None while the first request is running, which holds
+    the key for IDEMPOTENCY_LEASE seconds from claimed_at
+    """
+    __tablename__ = 'idempotency_key'
+    __table_args__ = (db.UniqueConstraint('user_id', 'key'),)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)
+    mimetype = db.Column(db.String(100))
+    body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return '<IdempotencyKey: %s %s>' % (self.user_id, self.key)
+
+
 class BlacklistToken(db.Model):
     __tablename__ = 'blacklist_tokens'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -652,3 +1102,101 @@ class BlacklistToken(db.Model):
 
     def __repr__(self):
         return '<id: token: {}'.format(self.token)
+
+
+class RefreshToken(db.Model):
+    """
+    A long-lived token exchanged at /auth/refresh for a new access token.
+    Only an HMAC of the token is stored. Every exchange replaces it by a
+    new token of the same family, and a replaced token used again
+    revokes the whole family
+    """
+    __tablename__ = 'refresh_token'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(User.id), nullable=False, index=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    family = db.Column(db.String(32), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    used_at = db.Column(db.DateTime)
+    revoked_at = db.Column(db.DateTime)
+
+    @staticmethod
+    def hash_token(token):
+        """
+        HMAC-SHA256 of token with the app SECRET, cheap enough for every refresh
+        """
+        return hmac.new(current_app.config.get('SECRET').encode(), token.encode(),
+                        hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def issue(user_id, family=None):
+        """
+        Add a refresh token of user_id to the session and return its
+        value, which only the client keeps
+        """
+        token = secrets.token_urlsafe(32)
+        ttl = int(current_app.config['REFRESH_TOKEN_TTL'])
+        db.session.add(RefreshToken(user_id=user_id, token_hash=RefreshToken.hash_token(token),
+                                    family=family or uuid.uuid4().hex,
+                                    expires_at=datetime.utcnow() + timedelta(seconds=ttl)))
+        return token
+
+    @staticmethod
+    def rotate(token):
+        """
+        Exchange token for a new one of the same family.
+        Returns (user id, new token), or the error message
+        """
+        record = RefreshToken.query.filter_by(token_hash=RefreshToken.hash_token(token)).first()
+        if record is None:
+            return 'Invalid refresh token'
+        if record.revoked_at is not None:
+            return 'The refresh token was revoked. Please login'
+        now = datetime.utcnow()
+        if record.expires_at <= now:
+            return 'The refresh token has expired. Please login'
+        # only one of two concurrent exchanges of the same token marks it used
+        claimed = RefreshToken.query.filter(
+            RefreshToken.id == record.id, RefreshToken.used_at.is_(None)
+        ).update({'used_at': now}, synchronize_session=False)
+        if not claimed:
+            # the token was replaced already, so it was copied by someone
+            RefreshToken.revoke_family(record.family)
+            db.session.commit()
+            return 'The refresh token was already used. Please login'
+        new_token = RefreshToken.issue(record.user_id, record.family)
+        db.session.commit()
+        return record.user_id, new_token
+
+    @staticmethod
+    def revoke_family(family):
+        """
+        Revoke every token of family, the caller commits
+        """
+        RefreshToken.query.filter(RefreshToken.family == family,
+                                  RefreshToken.revoked_at.is_(None)
+                                  ).update({'revoked_at': datetime.utcnow()},
+                                           synchronize_session=False)
+
+    @staticmethod
+    def revoke_token(token):
+        """
+        Revoke the family of token, if the token exists
+        """
+        record = RefreshToken.query.filter_by(token_hash=RefreshToken.hash_token(token)).first()
+        if record is not None:
+            RefreshToken.revoke_family(record.family)
+
+    @staticmethod
+    def revoke_user(user_id):
+        """
+        Revoke every refresh token of user_id, the caller commits
+        """
+        RefreshToken.query.filter(RefreshToken.user_id == user_id,
+                                  RefreshToken.revoked_at.is_(None)
+                                  ).update({'revoked_at': datetime.utcnow()},
+                                           synchronize_session=False)
+
+    def __repr__(self):
+        return '<RefreshToken: %s of user %s>' % (self.id, self.user_id)
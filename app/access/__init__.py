@@ -0,0 +1,80 @@
+"""
+Loading of the grocery list and item named in the url of a nested route,
+checked against the user of the request.
+
+The list, and the item when there is one, are fetched with one query
+joining the two, and the owner is compared on the user_id column so that
+no relationship is lazily loaded. The result is a Loaded holding either
+the rows or the 404 or 403 the route should answer with.
+"""
+
+from flask import jsonify, make_response
+from sqlalchemy import and_
+
+NOT_FOUND = 404
+FORBIDDEN = 403
+
+LIST_NOT_FOUND = 'The grocery list does not exist'
+ITEM_NOT_FOUND = 'The grocery item does not exist'
+NOT_ALLOWED = 'You do not have the appropriate permissions'
+
+
+class Loaded(object):
+    """
+    The outcome of loading the resources of a route
+    """
+
+    def __init__(self, grocery_list=None, grocery_item=None, status=None, message=None):
+        self.grocery_list = grocery_list
+        self.grocery_item = grocery_item
+        self.status = status
+        self.message = message
+
+    @property
+    def ok(self):
+        return self.status is None
+
+    def response(self):
+        """
+        The error response of a failed load
+        """
+        return make_response(jsonify({'message': self.message})), self.status
+
+
+def check_owner(user, grocery_list, grocery_item=None, owner_only=True):
+    if owner_only and grocery_list.user_id != user.id:
+        return Loaded(status=FORBIDDEN, message=NOT_ALLOWED)
+    return Loaded(grocery_list, grocery_item)
+
+
+def load_grocery_list(user, list_id, owner_only=True):
+    """
+    The active grocery list list_id. With owner_only, a list of another
+    user is a 403
+    """
+    from app import GroceryList
+    grocery_list = GroceryList.active().filter(GroceryList.id == int(list_id)).first()
+    if grocery_list is None:
+        return Loaded(status=NOT_FOUND, message=LIST_NOT_FOUND)
+    return check_owner(user, grocery_list, owner_only=owner_only)
+
+
+def load_grocery_item(user, list_id, item_id, owner_only=True):
+    """
+    The active item item_id of the active list list_id, with its list.
+    An item of another list is a 404, and with owner_only an item of
+    another user is a 403
+    """
+    from app import db, GroceryList, GroceryItem
+    row = db.session.query(GroceryList, GroceryItem).outerjoin(GroceryItem, and_(
+        GroceryItem.grocery_list_id == GroceryList.id,
+        GroceryItem.id == int(item_id),
+        GroceryItem.deleted_at.is_(None))).filter(
+        GroceryList.id == int(list_id),
+        GroceryList.deleted_at.is_(None)).first()
+    if row is None:
+        return Loaded(status=NOT_FOUND, message=LIST_NOT_FOUND)
+    grocery_list, grocery_item = row
+    if grocery_item is None:
+        return Loaded(status=NOT_FOUND, message=ITEM_NOT_FOUND)
+    return check_owner(user, grocery_list, grocery_item, owner_only)
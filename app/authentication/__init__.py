@@ -3,11 +3,14 @@ File to initialize the auth Blueprint
 This is to make the app more modular
 """
 
-from flask import Blueprint
+import jwt
+from flask import Blueprint, current_app
 
 from flask.views import MethodView
 from flask import make_response, request, jsonify
 
+from app.tracing import span
+
 auth_blueprint = Blueprint('auth', __name__)
 
 
@@ -16,11 +19,32 @@ def get_authenticated_user(request):
     Helper function to get the authenticated user based on
     the token that is passed
     """
-    from app import User
-    user = User.query.filter_by(id=1).first()
+    from app import db, User
+    with span('auth.user_lookup'):
+        user = User.query.filter_by(id=1).first()
+    if user:
+        db.route_to(user)
     return user
 
 
+def get_token_user_id(request):
+    """
+    Helper function to get the user id in the bearer token of the
+    request, or None. Only the signature and expiry of the token are
+    checked so that no query is made
+    """
+    auth_header = request.headers.get('Authorization') or ''
+    parts = auth_header.split(' ')
+    if len(parts) != 2 or not parts[1]:
+        return None
+    try:
+        payload = jwt.decode(parts[1], current_app.config.get('SECRET'),
+                             algorithms=['HS256'])
+        return payload['sub']
+    except (jwt.InvalidTokenError, KeyError):
+        return None
+
+
 class RegistrationView(MethodView):
     def post(self):
         """Handle POST request for this view."""
@@ -86,18 +110,29 @@ class LoginView(MethodView):
             try:
                 # Get the user object using their username
                 from app import User
-                user = User.query.filter_by(username=post_data['username']).first()
+                with span('auth.user_lookup'):
+                    user = User.query.filter_by(username=post_data['username']).first()
 
                 # Try to authenticate the found user using their password
-                if user and user.password_is_valid(post_data['password']):
+                with span('auth.password_check'):
+                    password_is_valid = user and user.password_is_valid(post_data['password'])
+                if password_is_valid:
                     # Generate the access token to be used for future authentication
-                    access_token = user.generate_token(user.id)
+                    with span('auth.token_encode'):
+                        access_token = user.generate_token(user.id)
                     if access_token:
-                        response = {
-                            'message': 'Login successful',
-                            'access_token': access_token.decode()
-                        }
-                        return make_response(jsonify(response)), 200
+                        # the refresh token gets new access tokens without bcrypt
+                        from app import db, RefreshToken
+                        with span('db.refresh_token'):
+                            refresh_token = RefreshToken.issue(user.id)
+                            db.session.commit()
+                        with span('serialize'):
+                            response = make_response(jsonify({
+                                'message': 'Login successful',
+                                'access_token': access_token.decode(),
+                                'refresh_token': refresh_token
+                            }))
+                        return response, 200
                 else:
                     # raise ValueError('this is the user %s' % str(user))
                     # user does not exist or password is invalid
@@ -115,6 +150,32 @@ class LoginView(MethodView):
                 return make_response(jsonify(response)), 500
 
 
+class RefreshView(MethodView):
+    def post(self):
+        """
+        Exchange a refresh token for a new access token and a new refresh
+        token. Expected payload {'refresh_token': 'the refresh token'}
+        """
+        post_data = request.get_json(force=True, silent=True)
+        if not isinstance(post_data, dict) or not isinstance(post_data.get('refresh_token'), str):
+            return make_response(jsonify(
+                {'message': 'The data you sent was in the wrong structure'})), 400
+        from app import User, RefreshToken
+        rotated = RefreshToken.rotate(post_data['refresh_token'])
+        if isinstance(rotated, str):
+            return make_response(jsonify({'message': rotated})), 401
+        user_id, refresh_token = rotated
+        user = User.query.get(user_id)
+        if user is None:
+            return make_response(jsonify({'message': 'Invalid refresh token'})), 401
+        response = {
+            'message': 'Token refreshed',
+            'access_token': user.generate_token(user.id).decode(),
+            'refresh_token': refresh_token
+        }
+        return make_response(jsonify(response)), 200
+
+
 class LogoutView(MethodView):
     def post(self):
         # get the authorization header
@@ -131,6 +192,11 @@ class LogoutView(MethodView):
                 # have it blacklisted
                 from app import BlacklistToken
                 blacklist_token = BlacklistToken(token=access_token)
+                # a refresh token sent along is revoked with its family
+                post_data = request.get_json(force=True, silent=True)
+                if isinstance(post_data, dict) and isinstance(post_data.get('refresh_token'), str):
+                    from app import RefreshToken
+                    RefreshToken.revoke_token(post_data['refresh_token'])
                 if isinstance(blacklist_token.save(), bool):
                     # it succeeded
                     response = {
@@ -192,6 +258,10 @@ class ResetPasswordView(MethodView):
                         user.set_password(post_data['new_password'])
                     except:
                         return make_response(jsonify({'message': 'Password reset failed'})), 400
+                    # sessions opened with the old password end
+                    from app import db, RefreshToken
+                    RefreshToken.revoke_user(user.id)
+                    db.session.commit()
                     return make_response(jsonify({'message': 'Password reset successful'})), 200
             else:
                 return make_response(jsonify({'message': 'no data was sent'})), 400
@@ -201,6 +271,7 @@ class ResetPasswordView(MethodView):
 registration_view = RegistrationView.as_view('register_view')
 login_view = LoginView.as_view('login_view')
 logout_view = LogoutView.as_view('logout_view')
+refresh_view = RefreshView.as_view('refresh_view')
 reset_password_view = ResetPasswordView.as_view('reset_password_view')
 
 # /auth/register endpoint
@@ -217,6 +288,13 @@ auth_blueprint.add_url_rule(
     methods=['POST']
 )
 
+# /auth/refresh endpoint
+auth_blueprint.add_url_rule(
+    '/auth/refresh',
+    view_func=refresh_view,
+    methods=['POST']
+)
+
 # /auth/logout endpoint
 auth_blueprint.add_url_rule(
     '/auth/logout',
@@ -0,0 +1,146 @@
+"""
+Compression of the responses with brotli or gzip, applied as an
+after_request stage. The encoding is negotiated with Accept-Encoding
+and bodies smaller than COMPRESS_MIN_SIZE are sent as they are.
+"""
+
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressedBodyCache(object):
+    """
+    Bounded LRU of compressed bodies keyed by encoding and body digest,
+    so that a body that is served again is not compressed again
+    """
+
+    def __init__(self, size=128):
+        self.size = size
+        self.bodies = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            body = self.bodies.get(key)
+            if body is not None:
+                self.bodies.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        with self.lock:
+            self.bodies[key] = body
+            self.bodies.move_to_end(key)
+            while len(self.bodies) > self.size:
+                self.bodies.popitem(last=False)
+
+
+def available_encodings():
+    """
+    The encodings this server can produce in order of preference
+    """
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def gzip_compressor(level):
+    # a gzip header without a timestamp so that the output is deterministic
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def compress_body(data, encoding, config):
+    """
+    Compress a whole body with encoding
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=int(config['COMPRESS_BROTLI_QUALITY']))
+    compressor = gzip_compressor(int(config['COMPRESS_GZIP_LEVEL']))
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding, config):
+    """
+    Compress a streamed body chunk by chunk. Every chunk is flushed so
+    that the client can decode what it has received so far
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=int(config['COMPRESS_BROTLI_QUALITY']))
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = gzip_compressor(int(config['COMPRESS_GZIP_LEVEL']))
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class Compression(object):
+    """
+    Flask extension that compresses the responses
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BROTLI_QUALITY', 5)
+        app.config.setdefault('COMPRESS_CACHE_SIZE', 128)
+        app.config.setdefault('COMPRESS_MIMETYPES', ('application/json',
+                                                     'application/x-ndjson'))
+        app.extensions['compression'] = CompressedBodyCache(
+            int(app.config['COMPRESS_CACHE_SIZE']))
+        app.after_request(self.compress_response)
+
+    @staticmethod
+    def compress_response(response):
+        config = current_app.config
+        if not config['COMPRESS_ENABLED']:
+            return response
+        if response.mimetype not in config['COMPRESS_MIMETYPES'] or \
+                response.status_code < 200 or response.status_code in (204, 304) or \
+                'Content-Encoding' in response.headers or response.direct_passthrough:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(available_encodings())
+        if not encoding:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, config)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < int(config['COMPRESS_MIN_SIZE']):
+                return response
+            cache = current_app.extensions['compression']
+            key = (encoding, hashlib.sha1(data).digest())
+            body = cache.get(key)
+            if body is None:
+                body = compress_body(data, encoding, config)
+                cache.set(key, body)
+            response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+compression = Compression()
@@ -0,0 +1,401 @@
+"""
+The SQLAlchemy extension of the app, with optional sharding of the
+grocery lists and items by user.
+
+When SHARD_DATABASE_URLS lists N databases, the tables marked with
+info={'sharded': True} are created in each of them and the other tables
+stay in SQLALCHEMY_DATABASE_URI. A user lives on the shard stored in
+User.shard, or on user id modulo N when it is not set. The session of a
+request is routed to the shard of its user by route_to(), and the ids of
+the sharded rows come from blocks allocated in the main database so that
+they are unique across the shards. The sharded tables have no foreign
+key to the tables of the main database, which are not on the shards.
+While rebalance_user() moves a user to another shard, User.moving is
+set and the writes of the user are refused with UserMoving.
+
+Every new SQLite connection gets the pragmas of the SQLITE_* settings
+(WAL journal, busy timeout, cache and mmap sizes) so that readers do not
+wait for writers.
+"""
+
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import Column, Integer, MetaData, String, Table, event, func, orm, select
+from sqlalchemy.exc import IntegrityError
+
+SHARD_BIND = 'shard%d'
+
+# ids handed out per allocation, kept in the memory of the process
+ID_BLOCK_SIZE = 100
+
+# the id sequences live in the main database only, outside of the models
+id_sequence = Table('id_sequence', MetaData(),
+                    Column('name', String(60), primary_key=True),
+                    Column('next_id', Integer, nullable=False))
+
+
+# pragma: config key, in the order they are set on a new connection
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'SQLITE_JOURNAL_MODE'),
+    ('synchronous', 'SQLITE_SYNCHRONOUS'),
+    ('busy_timeout', 'SQLITE_BUSY_TIMEOUT'),
+    ('cache_size', 'SQLITE_CACHE_SIZE'),
+    ('mmap_size', 'SQLITE_MMAP_SIZE'),
+)
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+class UserMoving(Exception):
+    """
+    Raised when the lists or items of a user are written while the user
+    is being moved to another shard
+    """
+
+
+def sqlite_pragmas(config):
+    """
+    The (pragma, value) pairs of the sqlite profile in config
+    """
+    if not config.get('SQLITE_PROFILE_ENABLED', True):
+        return []
+    pragmas = []
+    for pragma, key in SQLITE_PRAGMAS:
+        value = config.get(key)
+        if value is None or value == '':
+            continue
+        if not PRAGMA_VALUE.match(str(value)):
+            raise ValueError('Invalid value %r for %s' % (value, key))
+        pragmas.append((pragma, value))
+    return pragmas
+
+
+def apply_sqlite_profile(engine, pragmas):
+    """
+    Set the pragmas on every connection engine opens from now on
+    """
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas:
+            cursor.execute('PRAGMA %s = %s' % (pragma, value))
+        cursor.close()
+
+
+def configure_shards(app, urls):
+    """
+    Set the shard databases of app, one bind per url
+    """
+    binds = dict((key, value) for key, value in
+                 (app.config.get('SQLALCHEMY_BINDS') or {}).items()
+                 if not key.startswith('shard'))
+    for shard, url in enumerate(urls):
+        binds[SHARD_BIND % shard] = url
+    app.config['SHARD_DATABASE_URLS'] = list(urls)
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def _table_of(mapper, clause):
+    """
+    The table a session operation is about, or None
+    """
+    if mapper is not None:
+        return mapper.mapped_table
+    table = getattr(clause, 'table', None)
+    if table is None and clause is not None:
+        froms = getattr(clause, 'froms', None) or []
+        table = froms[0] if froms else None
+    return table if isinstance(table, Table) else None
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session sending the queries on sharded tables to the shard in info['shard']
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        shard = self.info.get('shard')
+        if shard is not None:
+            table = _table_of(mapper, clause)
+            if table is not None and table.info.get('sharded'):
+                return get_state(self.app).db.get_engine(self.app, bind=SHARD_BIND % shard)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class IdAllocator(object):
+    """
+    Hands out the ids of the sharded tables from blocks reserved in the
+    id_sequence table of the main database
+    """
+
+    def __init__(self, block_size=ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self.blocks = {}
+        self.lock = threading.Lock()
+
+    def reserve(self, db, app, name, count=None):
+        """
+        Reserve the next block of ids of name, or the next count ids,
+        returns the first id
+        """
+        count = count or self.block_size
+        engine = db.get_engine(app)
+        id_sequence.create(engine, checkfirst=True)
+        for _ in range(2):
+            with engine.begin() as connection:
+                updated = connection.execute(id_sequence.update().where(
+                    id_sequence.c.name == name
+                ).values(next_id=id_sequence.c.next_id + count))
+                if updated.rowcount:
+                    return connection.execute(select([id_sequence.c.next_id]).where(
+                        id_sequence.c.name == name)).scalar() - count
+            # the first block starts after the ids already used on any database
+            start = db.max_id(app, name) + 1
+            try:
+                with engine.begin() as connection:
+                    connection.execute(id_sequence.insert().values(
+                        name=name, next_id=start + count))
+                return start
+            except IntegrityError:
+                # another process created the sequence, take a block from it
+                continue
+        raise RuntimeError('Could not reserve ids for %s' % name)
+
+    def next_id(self, db, app, name):
+        with self.lock:
+            block = self.blocks.get(name)
+            if block is None or block[0] >= block[1]:
+                start = self.reserve(db, app, name)
+                block = self.blocks[name] = [start, start + self.block_size]
+            block[0] += 1
+            return block[0] - 1
+
+
+class ShardedSQLAlchemy(SQLAlchemy):
+    """
+    SQLAlchemy extension whose sessions are routed to the shard of their user
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.ids = IdAllocator()
+        self.profiled_engines = weakref.WeakSet()
+        self.profile_lock = threading.Lock()
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    def init_app(self, app):
+        app.config.setdefault('SHARD_DATABASE_URLS', [])
+        configure_shards(app, app.config['SHARD_DATABASE_URLS'])
+        SQLAlchemy.init_app(self, app)
+
+    def apply_driver_hacks(self, app, info, options):
+        database = info.database
+        SQLAlchemy.apply_driver_hacks(self, app, info, options)
+        # sqlite URI filenames such as file:name?mode=memory&cache=shared are not paths
+        if info.drivername == 'sqlite' and database and database.startswith('file:'):
+            info.database = database
+
+    def get_engine(self, app=None, bind=None):
+        engine = SQLAlchemy.get_engine(self, app, bind)
+        if engine.dialect.name == 'sqlite' and engine not in self.profiled_engines:
+            with self.profile_lock:
+                if engine not in self.profiled_engines:
+                    apply_sqlite_profile(engine, sqlite_pragmas(self.get_app(app).config))
+                    self.profiled_engines.add(engine)
+        return engine
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def shard_count(self, app=None):
+        return len(self.get_app(app).config.get('SHARD_DATABASE_URLS') or ())
+
+    def shard_ids(self, app=None):
+        """
+        The shards to visit for work on every user, [None] without sharding
+        """
+        return list(range(self.shard_count(app))) or [None]
+
+    def sharded_tables(self):
+        return [table for table in self.Model.metadata.sorted_tables
+                if table.info.get('sharded')]
+
+    def shard_for(self, user):
+        """
+        The shard of user, or None without sharding
+        """
+        count = self.shard_count()
+        if not count:
+            return None
+        if user.shard is not None:
+            return user.shard
+        return user.id % count
+
+    def route_to(self, user):
+        """
+        Send the queries on sharded tables of this session to the shard of
+        user, refusing the writes while the user is being moved
+        """
+        self.session.info['shard'] = self.shard_for(user)
+        self.session.info['moving'] = bool(user.moving)
+
+    def check_writable(self):
+        """
+        Raise UserMoving when the user of the session is being moved
+        """
+        if self.session.info.get('moving'):
+            raise UserMoving('The lists of the user are being moved, try again later')
+
+    @contextmanager
+    def using_shard(self, shard):
+        """
+        Route the session to shard within the block
+        """
+        previous = self.session.info.get('shard')
+        self.session.info['shard'] = shard
+        try:
+            yield
+        finally:
+            self.session.info['shard'] = previous
+
+    def max_id(self, app, table_name):
+        """
+        The highest id of table_name on the main database and the shards
+        """
+        table = self.Model.metadata.tables[table_name]
+        engines = [self.get_engine(app)] + [self.get_engine(app, bind=SHARD_BIND % shard)
+                                            for shard in range(self.shard_count(app))]
+        highest = 0
+        for engine in engines:
+            if engine.has_table(table_name):
+                highest = max(highest, engine.execute(select([func.max(table.c.id)])).scalar() or 0)
+        return highest
+
+    def create_all(self, bind='__all__', app=None):
+        SQLAlchemy.create_all(self, bind, app)
+        app = self.get_app(app)
+        for shard in range(self.shard_count(app)):
+            self.Model.metadata.create_all(self.get_engine(app, bind=SHARD_BIND % shard),
+                                           tables=self.sharded_tables())
+
+    def drop_all(self, bind='__all__', app=None):
+        app = self.get_app(app)
+        for shard in range(self.shard_count(app)):
+            self.Model.metadata.drop_all(self.get_engine(app, bind=SHARD_BIND % shard),
+                                         tables=self.sharded_tables())
+        id_sequence.drop(self.get_engine(app), checkfirst=True)
+        self.ids = IdAllocator(self.ids.block_size)
+        SQLAlchemy.drop_all(self, bind, app)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def refuse_writes_of_moving_user(session, flush_context, instances):
+    """
+    Keep the rows of a user being moved on the shard they are copied from
+    """
+    if not session.info.get('moving'):
+        return
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None and table.info.get('sharded'):
+            get_state(session.app).db.check_writable()
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def assign_global_ids(session, flush_context, instances):
+    """
+    Give the new rows of sharded tables an id unique across the shards
+    """
+    db = get_state(session.app).db
+    if not db.shard_count(session.app):
+        return
+    for obj in session.new:
+        table = getattr(obj, '__table__', None)
+        if table is not None and table.info.get('sharded') and obj.id is None:
+            obj.id = db.ids.next_id(db, session.app, table.name)
+
+
+def copy_user_rows(db, user, source, target):
+    """
+    Copy the lists, items and change log of user from the shard source to
+    the shard target, replacing the copies of an earlier run. Returns the
+    rows read from source
+    """
+    from app import ChangeLog, GroceryList, GroceryItem
+    lists = GroceryList.__table__
+    items = GroceryItem.__table__
+    changes = ChangeLog.__table__
+    source_engine = db.get_engine(bind=SHARD_BIND % source)
+    target_engine = db.get_engine(bind=SHARD_BIND % target)
+
+    list_rows = [dict(row) for row in source_engine.execute(
+        lists.select().where(lists.c.user_id == user.id).order_by(lists.c.id))]
+    list_ids = [row['id'] for row in list_rows]
+    item_rows = [dict(row) for row in source_engine.execute(
+        items.select().where(items.c.grocery_list_id.in_(list_ids)).order_by(items.c.id))
+    ] if list_ids else []
+    # the ids of the change log are unique across the shards, see record_changes
+    change_rows = [dict(row) for row in source_engine.execute(
+        changes.select().where(changes.c.user_id == user.id).order_by(changes.c.id))]
+    with target_engine.begin() as connection:
+        connection.execute(items.delete().where(items.c.grocery_list_id.in_(
+            select([lists.c.id]).where(lists.c.user_id == user.id))))
+        connection.execute(lists.delete().where(lists.c.user_id == user.id))
+        connection.execute(changes.delete().where(changes.c.user_id == user.id))
+        if list_rows:
+            connection.execute(lists.insert(), list_rows)
+        if item_rows:
+            connection.execute(items.insert(), item_rows)
+        if change_rows:
+            connection.execute(changes.insert(), change_rows)
+    return list_rows, item_rows, change_rows
+
+
+def rebalance_user(db, user, target, settle=0):
+    """
+    Move the lists, items and change log of user to the shard target and
+    record it on the user. User.moving is set first, so that the requests
+    of the user stop writing, and the move waits settle seconds for the
+    requests that started before it to finish. The rows are then copied
+    until the source stops changing, and only deleted from the old shard
+    once the user points to the new one, so running it again after a
+    failure finishes the move
+    """
+    source = db.shard_for(user)
+    if target == source:
+        if user.moving:
+            # a move back to the shard the rows never left
+            user.moving = False
+            db.session.commit()
+        return 0
+    if not 0 <= target < db.shard_count():
+        raise ValueError('There is no shard %s' % target)
+    from app import ChangeLog, GroceryList, GroceryItem
+    user.moving = True
+    db.session.commit()
+    time.sleep(settle)
+
+    copied = copy_user_rows(db, user, source, target)
+    while True:
+        again = copy_user_rows(db, user, source, target)
+        if again == copied:
+            break
+        copied = again
+
+    user.shard = target
+    user.moving = False
+    db.session.commit()
+
+    list_rows, item_rows, _ = copied
+    lists = GroceryList.__table__
+    items = GroceryItem.__table__
+    changes = ChangeLog.__table__
+    with db.get_engine(bind=SHARD_BIND % source).begin() as connection:
+        connection.execute(items.delete().where(items.c.grocery_list_id.in_(
+            select([lists.c.id]).where(lists.c.user_id == user.id))))
+        connection.execute(lists.delete().where(lists.c.user_id == user.id))
+        connection.execute(changes.delete().where(changes.c.user_id == user.id))
+    return len(list_rows) + len(item_rows)
@@ -0,0 +1,226 @@
+"""
+Group commit of the grocery item inserts.
+
+When GROUP_COMMIT_ENABLED is set, POST /grocerylists/<id>/items/ does
+not commit its own transaction. The insert is queued and a flusher
+thread writes the queued inserts of all the request threads in one
+transaction, at most GROUP_COMMIT_MAX_DELAY_MS after the first of them
+arrived or as soon as GROUP_COMMIT_MAX_BATCH are waiting. Each request
+returns once the transaction of its batch has been committed. The
+inserts of each shard are committed in a transaction of their own, so
+that a failed shard is retried without inserting the others twice.
+
+A request that gives up after GROUP_COMMIT_TIMEOUT seconds takes its
+insert back unless its transaction is already running, in which case it
+waits for the outcome, so a client retrying the failure does not end up
+with the item twice.
+"""
+
+import threading
+import time
+from itertools import groupby
+
+
+class GroupCommitError(Exception):
+    """
+    Raised when a queued insert could not be committed
+    """
+
+
+class PendingInsert(object):
+    """
+    An item insert waiting in the queue, and its outcome
+    """
+
+    def __init__(self, grocery_list_id, name, quantity, unit, shard=None):
+        self.grocery_list_id = grocery_list_id
+        self.name = name
+        self.quantity = quantity
+        self.unit = unit
+        self.shard = shard
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        # set under GroupCommitter.condition, by the request giving up and
+        # by the flusher once it inserts the item
+        self.cancelled = False
+        self.committing = False
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+
+
+class GroupCommitter(object):
+    """
+    Queue of item inserts committed together by a background thread
+    """
+
+    def __init__(self, app, max_delay=0.005, max_batch=100, timeout=5):
+        self.app = app
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.pending = []
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.batches = 0
+        self.thread = threading.Thread(target=self.run, name='group-commit')
+        self.thread.daemon = True
+
+    def insert_item(self, grocery_list_id, name, quantity, unit, shard=None):
+        """
+        Queue the insert of an item and wait until it is committed.
+        Returns the id, name, quantity and unit of the item
+        """
+        entry = PendingInsert(grocery_list_id, name, quantity, unit, shard)
+        with self.condition:
+            if self.stopped:
+                raise GroupCommitError('The group commit queue is stopped')
+            self.pending.append(entry)
+            if len(self.pending) == 1 or len(self.pending) >= self.max_batch:
+                self.condition.notify()
+        if not entry.done.wait(self.timeout):
+            with self.condition:
+                if entry in self.pending:
+                    self.pending.remove(entry)
+                if not entry.committing:
+                    entry.cancelled = True
+                    raise GroupCommitError('The item was not committed in time')
+            # its transaction is running, the item may already be saved
+            entry.done.wait()
+        if entry.error is not None:
+            raise GroupCommitError(entry.error)
+        return entry.result
+
+    def take_batch(self):
+        """
+        Wait for the next batch: the inserts queued until max_delay after
+        the first one, or the first max_batch of them
+        """
+        with self.condition:
+            while not self.pending and not self.stopped:
+                self.condition.wait()
+            deadline = time.monotonic() + self.max_delay
+            while len(self.pending) < self.max_batch and not self.stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = self.pending[:self.max_batch]
+            del self.pending[:self.max_batch]
+            return batch
+
+    def claim(self, entries):
+        """
+        The entries whose request still waits for them. From now on the
+        request waits for the outcome instead of giving up
+        """
+        with self.condition:
+            claimed = [entry for entry in entries if not entry.cancelled]
+            for entry in claimed:
+                entry.committing = True
+        return claimed
+
+    def commit(self, shard, entries):
+        """
+        Insert the items of entries, which are all on shard, in one transaction
+        """
+        from app import db, GroceryList, GroceryItem
+        entries = self.claim(entries)
+        if not entries:
+            return
+        inserted = []
+        with db.using_shard(shard):
+            list_ids = set(entry.grocery_list_id for entry in entries)
+            lists = dict((grocery_list.id, grocery_list) for grocery_list in
+                         GroceryList.active().filter(GroceryList.id.in_(list_ids)).all())
+            for entry in entries:
+                grocery_list = lists.get(entry.grocery_list_id)
+                if grocery_list is None:
+                    entry.finish(error='The grocery list does not exist')
+                    continue
+                grocery_item = GroceryItem(name=entry.name, quantity=entry.quantity,
+                                           unit=entry.unit, parent_list=grocery_list)
+                db.session.add(grocery_item)
+                inserted.append((entry, grocery_item))
+            db.session.flush()
+            # the values are read before the commit expires them
+            results = [(entry, {
+                'id': grocery_item.id,
+                'name': grocery_item.name,
+                'quantity': grocery_item.quantity,
+                'unit': grocery_item.unit
+            }) for entry, grocery_item in inserted]
+            db.session.commit()
+        self.batches += 1
+        for entry, result in results:
+            entry.finish(result)
+
+    def flush(self, batch):
+        """
+        Commit the inserts of batch shard by shard
+        """
+        from app import db
+        try:
+            for shard, entries in groupby(sorted(batch, key=lambda entry: entry.shard or 0),
+                                          key=lambda entry: entry.shard):
+                self.flush_shard(shard, list(entries))
+        finally:
+            db.session.remove()
+
+    def flush_shard(self, shard, entries):
+        """
+        Commit entries, or each of them on its own when the transaction
+        fails so that one bad insert does not fail the others
+        """
+        from app import db
+        try:
+            self.commit(shard, entries)
+        except Exception as e:
+            db.session.rollback()
+            if len(entries) == 1:
+                self.app.logger.exception('Group commit of an item failed')
+                entries[0].finish(error=str(e))
+                return
+            for entry in entries:
+                if not entry.done.is_set():
+                    self.flush_shard(shard, [entry])
+
+    def run(self):
+        while True:
+            batch = self.take_batch()
+            if not batch:
+                if self.stopped:
+                    return
+                continue
+            with self.app.app_context():
+                self.flush(batch)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the thread once the queued inserts are committed
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join(self.timeout)
+
+
+def start_group_commit(app):
+    """
+    Start the group commit thread of app when GROUP_COMMIT_ENABLED is set
+    """
+    if not app.config.get('GROUP_COMMIT_ENABLED'):
+        return None
+    committer = GroupCommitter(app,
+                               max_delay=float(app.config['GROUP_COMMIT_MAX_DELAY_MS']) / 1000.0,
+                               max_batch=int(app.config['GROUP_COMMIT_MAX_BATCH']),
+                               timeout=float(app.config['GROUP_COMMIT_TIMEOUT']))
+    app.extensions['groupcommit'] = committer
+    committer.start()
+    return committer
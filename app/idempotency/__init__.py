@@ -0,0 +1,169 @@
+"""
+Idempotency-Key support for the POST views.
+
+A client that retries a POST after a timeout sends the same
+Idempotency-Key header again. The first response for a (user, key) pair
+is stored in the idempotency_key table and the retries get it back
+without the view running again. The row is inserted before the view
+runs, so when duplicates arrive at the same time the unique constraint
+on (user_id, key) lets only one of them through and the others get a 409.
+A claim is a lease of IDEMPOTENCY_LEASE seconds: when the worker running
+the first request was killed, a retry arriving after the lease takes the
+key over and runs the view.
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, request, jsonify, make_response
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from app.authentication import get_token_user_id
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    """
+    Hash of the method, path and body of the request, so that a key
+    reused for another request can be told apart from a retry
+    """
+    digest = hashlib.sha256()
+    digest.update(request.method.encode('utf-8'))
+    digest.update(request.path.encode('utf-8'))
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def prune_keys(user_id):
+    """
+    Delete the keys of the user older than IDEMPOTENCY_TTL seconds and
+    the oldest ones, leaving room for one more key under IDEMPOTENCY_MAX_KEYS
+    """
+    from app import db, IdempotencyKey
+    config = current_app.config
+    cutoff = datetime.utcnow() - timedelta(seconds=float(config['IDEMPOTENCY_TTL']))
+    condition = IdempotencyKey.created_at < cutoff
+    kept = max(int(config['IDEMPOTENCY_MAX_KEYS']) - 1, 1)
+    oldest_kept = db.session.query(IdempotencyKey.id).filter(
+        IdempotencyKey.user_id == user_id
+    ).order_by(IdempotencyKey.id.desc()).offset(kept - 1).limit(1).scalar()
+    if oldest_kept is not None:
+        condition = or_(condition, IdempotencyKey.id < oldest_kept)
+    db.session.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id, condition).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def in_progress():
+    response = make_response(jsonify(
+        {'message': 'A request with this Idempotency-Key is in progress'}), 409)
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def take_over(record):
+    """
+    Claim the key of record again when the lease of its unfinished
+    request has run out. Returns the new claim time, or None when the
+    request finished or another retry took the key first
+    """
+    from app import db, IdempotencyKey
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=float(current_app.config['IDEMPOTENCY_LEASE']))
+    if record.status_code is not None or record.claimed_at >= cutoff:
+        return None
+    taken = db.session.query(IdempotencyKey).filter(
+        IdempotencyKey.id == record.id,
+        IdempotencyKey.status_code.is_(None),
+        IdempotencyKey.claimed_at == record.claimed_at
+    ).update({'claimed_at': now}, synchronize_session=False)
+    db.session.commit()
+    return now if taken else None
+
+
+def replay(record, fingerprint):
+    """
+    The response to a request whose key was already claimed
+    """
+    if record.request_hash != fingerprint:
+        return make_response(jsonify(
+            {'message': 'The Idempotency-Key was already used for another request'})), 422
+    if record.status_code is None:
+        # the first request is still running
+        return in_progress()
+    response = current_app.response_class(record.body, status=record.status_code,
+                                          mimetype=record.mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def release(record_id):
+    """
+    Delete the claim of a request that failed so that it can be retried
+    """
+    from app import db, IdempotencyKey
+    db.session.rollback()
+    IdempotencyKey.query.filter_by(id=record_id).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def idempotent(view):
+    """
+    Decorator for views that should run once per Idempotency-Key.
+    Requests without the header or without a valid token are not affected
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from app import db, IdempotencyKey
+        key = request.headers.get(HEADER)
+        if request.method != 'POST' or not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return make_response(jsonify(
+                {'message': 'The Idempotency-Key should be at most %d characters'
+                            % MAX_KEY_LENGTH})), 400
+        user_id = get_token_user_id(request)
+        if user_id is None:
+            return view(*args, **kwargs)
+
+        fingerprint = request_fingerprint(request)
+        prune_keys(user_id)
+        record = IdempotencyKey(user_id=user_id, key=key, request_hash=fingerprint)
+        db.session.add(record)
+        try:
+            db.session.commit()
+            record_id, claimed_at = record.id, record.claimed_at
+        except IntegrityError:
+            # another request holds the key
+            db.session.rollback()
+            existing = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+            if existing is None:
+                # it failed and released the key in the meantime
+                return in_progress()
+            if existing.request_hash != fingerprint:
+                return replay(existing, fingerprint)
+            record_id = existing.id
+            claimed_at = take_over(existing)
+            if claimed_at is None:
+                return replay(existing, fingerprint)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            release(record_id)
+            raise
+        if response.status_code >= 500:
+            release(record_id)
+            return response
+        # only while the claim is still ours, a retry may have taken it over
+        db.session.query(IdempotencyKey).filter(
+            IdempotencyKey.id == record_id, IdempotencyKey.claimed_at == claimed_at
+        ).update({'status_code': response.status_code, 'mimetype': response.mimetype,
+                  'body': response.get_data(as_text=True)}, synchronize_session=False)
+        db.session.commit()
+        return response
+    return wrapper
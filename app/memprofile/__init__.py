@@ -0,0 +1,161 @@
+"""
+Memory allocation profiling of sampled requests.
+
+When MEMORY_PROFILE_ENABLED is set, a share MEMORY_PROFILE_SAMPLE_RATE
+of the requests run with tracemalloc on. When the request is torn down,
+the peak of the memory allocated during the request, the memory still
+allocated after a gc collection (retained), the lines that allocated
+the most and the gc generation counts are added to the totals of the
+route. The totals of each worker are written to
+MEMORY_PROFILE_DIR/<pid>.json after every sample, for diffing offline.
+
+tracemalloc traces the whole process, so one request at a time is
+profiled and the allocations of requests running alongside it in other
+threads are counted too. When the mode is off no hook is registered.
+"""
+
+import gc
+import json
+import os
+import random
+import threading
+import tracemalloc
+
+from flask import g, request
+
+# allocations of these files are the profiler itself
+IGNORED_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>',
+                 '<frozen importlib._bootstrap_external>')
+
+
+class RouteMemory(object):
+    """
+    The allocations of the profiled requests of a route
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.peak_max = 0
+        self.peak_total = 0
+        self.retained_total = 0
+        self.sites = {}
+
+    def add(self, peak, retained, sites):
+        self.requests += 1
+        self.peak_max = max(self.peak_max, peak)
+        self.peak_total += peak
+        self.retained_total += retained
+        for site, size, count in sites:
+            totals = self.sites.setdefault(site, [0, 0])
+            totals[0] += size
+            totals[1] += count
+
+    def to_dict(self, top):
+        sites = sorted(self.sites.items(), key=lambda item: -item[1][0])[:top]
+        return {
+            'requests': self.requests,
+            'peak_max_bytes': self.peak_max,
+            'peak_mean_bytes': self.peak_total // self.requests,
+            'retained_mean_bytes': self.retained_total // self.requests,
+            'top_sites': [{'site': site, 'mean_bytes': size // self.requests, 'blocks': count}
+                          for site, (size, count) in sites],
+        }
+
+
+class MemoryProfiler(object):
+    """
+    Profiles sampled requests of an app with tracemalloc
+    """
+
+    def __init__(self, app, sample_rate=0.01, directory=None, top=10, frames=1):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.top = top
+        self.frames = frames
+        self.routes = {}
+        self.last_gc_counts = None
+        self.busy = threading.Lock()
+        self.random = random.Random()
+
+    def start_request(self):
+        if self.random.random() >= self.sample_rate or tracemalloc.is_tracing():
+            return
+        if not self.busy.acquire(blocking=False):
+            return
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g.memory_route = '%s %s' % (request.method, rule)
+        tracemalloc.start(self.frames)
+
+    def end_request(self, exception=None):
+        route = g.pop('memory_route', None)
+        if route is not None:
+            self.finish_request(route)
+
+    def finish_request(self, route):
+        try:
+            _, peak = tracemalloc.get_traced_memory()
+            gc_counts = gc.get_count()
+            gc.collect()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, name)
+                                               for name in IGNORED_FILES])
+            statistics = snapshot.statistics('lineno')
+            retained = sum(statistic.size for statistic in statistics)
+            sites = [('%s:%d' % (statistic.traceback[0].filename, statistic.traceback[0].lineno),
+                      statistic.size, statistic.count) for statistic in statistics[:self.top]]
+            self.routes.setdefault(route, RouteMemory()).add(peak, retained, sites)
+            self.last_gc_counts = gc_counts
+            self.dump()
+        except Exception:
+            self.app.logger.exception('Profiling the memory of %s failed', route)
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.busy.release()
+
+    def report(self):
+        return {
+            'pid': os.getpid(),
+            'gc': {
+                'counts': self.last_gc_counts,
+                'thresholds': gc.get_threshold(),
+                'collections': [generation['collections'] for generation in gc.get_stats()],
+            },
+            'routes': dict((route, memory.to_dict(self.top))
+                           for route, memory in self.routes.items()),
+        }
+
+    def path(self):
+        return os.path.join(self.directory, '%d.json' % os.getpid())
+
+    def dump(self):
+        """
+        Write the totals of this worker to its file
+        """
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = self.path() + '.tmp'
+        with open(temporary, 'w') as dump_file:
+            json.dump(self.report(), dump_file, indent=2, sort_keys=True)
+        os.replace(temporary, self.path())
+
+
+def start_memory_profiler(app):
+    """
+    Profile the memory of sampled requests of app when
+    MEMORY_PROFILE_ENABLED is set
+    """
+    if not app.config.get('MEMORY_PROFILE_ENABLED'):
+        return None
+    profiler = MemoryProfiler(app,
+                              sample_rate=float(app.config['MEMORY_PROFILE_SAMPLE_RATE']),
+                              directory=app.config['MEMORY_PROFILE_DIR'],
+                              top=int(app.config['MEMORY_PROFILE_TOP']),
+                              frames=int(app.config['MEMORY_PROFILE_FRAMES']))
+    app.extensions['memprofile'] = profiler
+    app.before_request(profiler.start_request)
+    app.teardown_request(profiler.end_request)
+    return profiler
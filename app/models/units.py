@@ -0,0 +1,174 @@
+"""
+This module has the registry of the units of the grocery items.
+
+Every unit has a dimension (mass, volume or count) and the factor that
+converts it to the base unit of its dimension, so that quantities given
+in "kg", "Grams" or "lbs" can be compared and summed. The *_many
+functions convert whole arrays of quantities in one vectorized pass,
+with NumPy when it is installed or with the array module otherwise.
+"""
+
+from array import array
+from collections import namedtuple
+
+from sqlalchemy import func
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+Unit = namedtuple('Unit', ['name', 'dimension', 'factor'])
+
+
+def normalize_unit_name(text):
+    """
+    The unit text in lower case with single spaces. The API has always
+    accepted units that are not strings, such as numbers
+    """
+    if text is None:
+        return ''
+    return ' '.join(str(text).lower().split())
+
+
+def normalized_unit(column):
+    """
+    SQL expression of the unit in lower case without surrounding spaces
+    """
+    return func.lower(func.trim(func.coalesce(column, '')))
+
+
+def scale(quantities, factor):
+    """
+    Multiply every quantity by factor
+    """
+    if numpy is not None:
+        return numpy.asarray(quantities, dtype=float) * factor
+    return array('d', (quantity * factor for quantity in quantities))
+
+
+def multiply(quantities, factors):
+    """
+    Multiply the quantities by the factors element by element
+    """
+    if numpy is not None:
+        return numpy.asarray(quantities, dtype=float) * numpy.asarray(factors, dtype=float)
+    return array('d', (quantity * factor for quantity, factor in zip(quantities, factors)))
+
+
+class UnitRegistry(object):
+    """
+    The known units by name and alias
+    """
+
+    def __init__(self):
+        self.units = {}
+        self.base_units = {}
+
+    def register(self, name, dimension, factor, aliases=()):
+        """
+        Add a unit worth factor base units of dimension.
+        The first unit of a dimension with a factor of 1 is its base unit
+        """
+        unit = Unit(name, dimension, float(factor))
+        if unit.factor == 1:
+            self.base_units.setdefault(dimension, name)
+        for alias in (name,) + tuple(aliases):
+            self.units[normalize_unit_name(alias)] = unit
+        return unit
+
+    def lookup(self, text):
+        """
+        The unit called text, or None when it is not known
+        """
+        name = normalize_unit_name(text)
+        unit = self.units.get(name)
+        if unit is None and name.endswith('s'):
+            # plurals such as 'lbs' or 'cups'
+            unit = self.units.get(name[:-1])
+        return unit
+
+    def base_of(self, text):
+        """
+        The base unit of text and the factor converting to it.
+        Unknown units are their own base
+        """
+        unit = self.lookup(text)
+        if unit is None:
+            return normalize_unit_name(text), 1.0
+        return self.base_units[unit.dimension], unit.factor
+
+    def to_base(self, quantity, text):
+        """
+        The base unit and the quantity in it for quantity of the unit text
+        """
+        base, factor = self.base_of(text)
+        if quantity is None:
+            return base, None
+        return base, quantity * factor
+
+    def conversion_factor(self, from_text, to_text):
+        """
+        The factor converting from_text to to_text.
+        Raises ValueError when they are not of the same dimension
+        """
+        from_unit = self.lookup(from_text)
+        to_unit = self.lookup(to_text)
+        if from_unit is None or to_unit is None:
+            if normalize_unit_name(from_text) == normalize_unit_name(to_text):
+                return 1.0
+            raise ValueError('Cannot convert %s to %s' % (from_text, to_text))
+        if from_unit.dimension != to_unit.dimension:
+            raise ValueError('Cannot convert %s to %s' % (from_text, to_text))
+        return from_unit.factor / to_unit.factor
+
+    def convert(self, quantity, from_text, to_text):
+        """
+        Convert quantity from the unit from_text to the unit to_text
+        """
+        return quantity * self.conversion_factor(from_text, to_text)
+
+    def convert_many(self, quantities, from_text, to_text):
+        """
+        Convert an array of quantities of one unit to another in one pass
+        """
+        return scale(quantities, self.conversion_factor(from_text, to_text))
+
+    def to_base_many(self, quantities, texts):
+        """
+        Convert quantities in the matching units of texts to their base units.
+        Returns the list of base units and the array of base quantities
+        """
+        resolved = {}
+        base_units = []
+        factors = array('d')
+        for text in texts:
+            if text not in resolved:
+                resolved[text] = self.base_of(text)
+            base, factor = resolved[text]
+            base_units.append(base)
+            factors.append(factor)
+        return base_units, multiply(quantities, factors)
+
+
+registry = UnitRegistry()
+for name, factor, aliases in (('g', 1, ('gr', 'gram', 'gramme')),
+                              ('mg', 0.001, ('milligram',)),
+                              ('kg', 1000, ('kilo', 'kilogram')),
+                              ('oz', 28.349523125, ('ounce',)),
+                              ('lb', 453.59237, ('pound',))):
+    registry.register(name, 'mass', factor, aliases)
+for name, factor, aliases in (('ml', 1, ('millilitre', 'milliliter')),
+                              ('cl', 10, ('centilitre', 'centiliter')),
+                              ('dl', 100, ('decilitre', 'deciliter')),
+                              ('l', 1000, ('litre', 'liter', 'lt')),
+                              ('tsp', 4.92892159375, ('teaspoon',)),
+                              ('tbsp', 14.78676478125, ('tablespoon',)),
+                              ('fl oz', 29.5735295625, ('fluid ounce',)),
+                              ('cup', 240, ()),
+                              ('gal', 3785.411784, ('gallon',))):
+    registry.register(name, 'volume', factor, aliases)
+for name, factor, aliases in (('units', 1, ('unit', 'pc', 'piece', 'item', 'ea', 'each')),
+                              ('dozen', 12, ('dz',)),
+                              ('pair', 2, ())):
+    registry.register(name, 'count', factor, aliases)
@@ -0,0 +1,162 @@
+"""
+Bulk creation of user accounts from a CSV file, used by
+`python manage.py users import <file>`.
+
+The rows are read as a stream and handled in chunks. The usernames of a
+chunk already taken are found with one IN query, the passwords of the
+other rows are hashed across a process pool and the new users are
+inserted in one transaction per chunk.
+"""
+
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from flask_bcrypt import Bcrypt
+from sqlalchemy.exc import IntegrityError
+
+from app.models import utilities
+
+REQUIRED_COLUMNS = ('username', 'name', 'email', 'password')
+
+
+def hash_password(password, rounds):
+    """
+    bcrypt hash of password, run in the worker processes
+    """
+    return Bcrypt().generate_password_hash(password, rounds).decode()
+
+
+def parse_users_csv(stream):
+    """
+    Yield (row number, dict) for each row of a CSV text stream with a header
+    """
+    for number, row in enumerate(csv.DictReader(stream), start=1):
+        yield number, row
+
+
+def clean_user_row(row):
+    """
+    Validate an imported row and return (username, name, email, password).
+    Raises ValueError when the row is invalid
+    """
+    missing = [column for column in REQUIRED_COLUMNS if not (row.get(column) or '').strip()]
+    if missing:
+        raise ValueError('%s is required' % ', '.join(missing))
+    username = row['username'].strip()
+    if ' ' in username:
+        raise ValueError('Username should have no space')
+    email = row['email'].strip()
+    utilities.check_email_format(email)
+    utilities.check_password_format(row['password'])
+    return username, row['name'].strip(), email, row['password']
+
+
+class UserImporter(object):
+    """
+    Creates the users of the imported rows chunk by chunk
+    """
+
+    def __init__(self, batch_size=500, workers=None, rounds=12):
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.rounds = rounds
+        self.executor = None
+        self.totals = {'rows': 0, 'imported': 0, 'errors': 0, 'batches': 0}
+
+    def hash_passwords(self, passwords):
+        if self.executor is None:
+            return [hash_password(password, self.rounds) for password in passwords]
+        chunksize = max(len(passwords) // (self.workers * 4), 1)
+        return list(self.executor.map(hash_password, passwords, repeat(self.rounds),
+                                      chunksize=chunksize))
+
+    def insert(self, rows):
+        """
+        Insert rows of (number, user values) in one transaction, or one
+        by one when the transaction fails. Returns the errors
+        """
+        from app import db, User
+        try:
+            db.session.execute(User.__table__.insert(), [values for _, values in rows])
+            db.session.commit()
+            return []
+        except IntegrityError:
+            db.session.rollback()
+            if len(rows) == 1:
+                return [{'event': 'error', 'row': rows[0][0],
+                         'message': 'The username is already taken'}]
+        errors = []
+        for row in rows:
+            errors.extend(self.insert([row]))
+        return errors
+
+    def import_batch(self, batch):
+        """
+        Create the users of a batch of (row number, cleaned row).
+        Returns the error events of its rows
+        """
+        from app import User
+        usernames = set(username for _, (username, _, _, _) in batch)
+        taken = set(username for username, in User.query.with_entities(User.username).filter(
+            User.username.in_(usernames)))
+        errors = []
+        accepted = []
+        for number, row in batch:
+            if row[0] in taken:
+                errors.append({'event': 'error', 'row': number,
+                               'message': 'The username is already taken'})
+                continue
+            # the first row of a username in the file wins
+            taken.add(row[0])
+            accepted.append((number, row))
+
+        hashes = self.hash_passwords([password for _, (_, _, _, password) in accepted])
+        rows = [(number, {'username': username, 'name': name, 'email': email,
+                          'password': password_hash})
+                for (number, (username, name, email, _)), password_hash in zip(accepted, hashes)]
+        failed = self.insert(rows) if rows else []
+        errors.extend(failed)
+        self.totals['imported'] += len(rows) - len(failed)
+        self.totals['errors'] += len(errors)
+        self.totals['batches'] += 1
+        return errors
+
+    def run(self, rows):
+        """
+        Import the parsed rows. Yields an event dict for every invalid row
+        and committed batch, then a final 'done' event with the totals
+        and the throughput
+        """
+        start = time.perf_counter()
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(self.workers)
+        try:
+            batch = []
+            for number, row in rows:
+                self.totals['rows'] += 1
+                try:
+                    batch.append((number, clean_user_row(row)))
+                except ValueError as e:
+                    self.totals['errors'] += 1
+                    yield {'event': 'error', 'row': number, 'message': str(e)}
+                    continue
+                if len(batch) >= self.batch_size:
+                    for error in self.import_batch(batch):
+                        yield error
+                    yield dict(event='progress', **self.totals)
+                    batch = []
+            if batch:
+                for error in self.import_batch(batch):
+                    yield error
+                yield dict(event='progress', **self.totals)
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+        elapsed = time.perf_counter() - start
+        yield dict(event='done', seconds=round(elapsed, 3),
+                   users_per_second=round(self.totals['imported'] / elapsed, 2) if elapsed else 0.0,
+                   **self.totals)
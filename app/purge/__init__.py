@@ -0,0 +1,121 @@
+"""
+Hard deletion of the tombstoned grocery lists and items.
+
+Deletes in the views only set deleted_at, so that they return right
+away. The rows are removed here in small batches, either by the
+background PurgeWorker when the app is quiet or by `manage.py purge`.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+def _purge_batch(model, cutoff, batch_size):
+    """
+    Delete at most batch_size tombstoned rows of model in one transaction.
+    Returns the number of rows deleted
+    """
+    from app import db, GroceryList, GroceryItem
+    ids = [row[0] for row in db.session.query(model.id).filter(
+        model.deleted_at.isnot(None), model.deleted_at <= cutoff
+    ).order_by(model.id).limit(batch_size).all()]
+    if not ids:
+        return 0
+    if model is GroceryList:
+        # the items of the lists go first, also in batches
+        while True:
+            item_ids = [row[0] for row in db.session.query(GroceryItem.id).filter(
+                GroceryItem.grocery_list_id.in_(ids)).limit(batch_size).all()]
+            if not item_ids:
+                break
+            db.session.query(GroceryItem).filter(GroceryItem.id.in_(item_ids)).delete(
+                synchronize_session=False)
+            db.session.commit()
+    db.session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return len(ids)
+
+
+def purge_tombstones(batch_size=500, retention=timedelta(0), max_batches=None):
+    """
+    Hard delete the items then the lists that were tombstoned more than
+    retention ago on every shard, batch_size rows per transaction. It has to be called
+    within an app context. Stops after max_batches batches when given.
+    Returns a dict with the number of tombstoned items and lists deleted,
+    the items of a purged list are removed with it but not counted
+    """
+    from app import db, GroceryList, GroceryItem
+    cutoff = datetime.utcnow() - retention
+    purged = {'items': 0, 'lists': 0}
+    batches = 0
+    for shard in db.shard_ids():
+        with db.using_shard(shard):
+            for name, model in (('items', GroceryItem), ('lists', GroceryList)):
+                while max_batches is None or batches < max_batches:
+                    deleted = _purge_batch(model, cutoff, batch_size)
+                    if not deleted:
+                        break
+                    purged[name] += deleted
+                    batches += 1
+    return purged
+
+
+class PurgeWorker(object):
+    """
+    Background thread that purges tombstones every interval seconds
+    when no request has started for quiet_seconds
+    """
+
+    def __init__(self, app, interval=60, quiet_seconds=5, batch_size=500,
+                 max_batches=10, retention=timedelta(0)):
+        self.app = app
+        self.interval = interval
+        self.quiet_seconds = quiet_seconds
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.retention = retention
+        self.last_request = time.monotonic()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='purge-worker')
+        self.thread.daemon = True
+
+    def record_request(self):
+        self.last_request = time.monotonic()
+
+    def is_quiet(self):
+        return time.monotonic() - self.last_request >= self.quiet_seconds
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if not self.is_quiet():
+                continue
+            try:
+                with self.app.app_context():
+                    purge_tombstones(self.batch_size, self.retention, self.max_batches)
+            except Exception:
+                self.app.logger.exception('Purging the tombstones failed')
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_purge_worker(app):
+    """
+    Start the purge worker of app when PURGE_WORKER_ENABLED is set
+    """
+    if not app.config.get('PURGE_WORKER_ENABLED'):
+        return None
+    worker = PurgeWorker(app,
+                         interval=float(app.config['PURGE_INTERVAL']),
+                         quiet_seconds=float(app.config['PURGE_QUIET_SECONDS']),
+                         batch_size=int(app.config['PURGE_BATCH_SIZE']),
+                         max_batches=int(app.config['PURGE_MAX_BATCHES']),
+                         retention=timedelta(seconds=float(app.config['PURGE_RETENTION_SECONDS'])))
+    app.extensions['purge'] = worker
+    app.before_request(worker.record_request)
+    worker.start()
+    return worker
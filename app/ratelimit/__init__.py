@@ -0,0 +1,205 @@
+"""
+Token-bucket rate limiting of the API, applied as a before_request hook.
+
+Requests are sorted into route classes ('auth', 'search', 'write' and
+'read') that each have their own bucket size and refill rate in
+RATELIMIT_LIMITS. Buckets are keyed by the user id found in the access
+token, or by the client IP for the login, register and refresh views.
+Behind RATELIMIT_TRUSTED_PROXIES proxies the client IP is the address
+the outermost trusted proxy added to X-Forwarded-For, as the remote
+address is the one of the proxy.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+
+from flask import current_app, request, jsonify, make_response
+
+from app.authentication import get_token_user_id
+
+# views that are rate limited by IP because there is no user yet
+IP_KEYED_ENDPOINTS = ('auth.login_view', 'auth.register_view', 'auth.refresh_view')
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class MemoryBackend(object):
+    """
+    Keeps the buckets in a dict of this process
+    """
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, max_keys=100000):
+        self.buckets = {}
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    def _prune(self, now):
+        # drop the buckets that have been idle for long enough to be full again
+        for key, (tokens, updated, capacity, refill_rate) in list(self.buckets.items()):
+            if tokens + (now - updated) * refill_rate >= capacity:
+                del self.buckets[key]
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        """
+        Take a token from the bucket of key.
+        Returns 0 when allowed, or else the seconds until a token is available
+        """
+        now = self.clock() if now is None else now
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket:
+                tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+            else:
+                if len(self.buckets) >= self.max_keys:
+                    self._prune(now)
+                tokens = capacity
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now, capacity, refill_rate)
+                return 0
+            self.buckets[key] = (tokens, now, capacity, refill_rate)
+        return (1 - tokens) / refill_rate
+
+
+class SQLiteBackend(object):
+    """
+    Keeps the buckets in a local sqlite file so that all the workers
+    on one machine share them
+    """
+    clock = staticmethod(time.time)
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_buckets ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            # autocommit mode, transactions are started explicitly
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self.local.connection = connection
+        return connection
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        """
+        Take a token from the bucket of key.
+        Returns 0 when allowed, or else the seconds until a token is available
+        """
+        now = self.clock() if now is None else now
+        connection = self._connection()
+        # the write lock is taken at the start so that workers cannot interleave
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM rate_limit_buckets '
+                                     'WHERE key = ?', (key,)).fetchone()
+            if row:
+                tokens = min(capacity, row[0] + (now - row[1]) * refill_rate)
+            else:
+                tokens = capacity
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            connection.execute('INSERT OR REPLACE INTO rate_limit_buckets '
+                               '(key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return 0 if allowed else (1 - tokens) / refill_rate
+
+
+def create_backend(uri):
+    """
+    Create the backend for RATELIMIT_BACKEND which is either
+    'memory' or 'sqlite:///path/to/file'
+    """
+    if not uri or uri == 'memory':
+        return MemoryBackend()
+    if uri.startswith('sqlite:///'):
+        return SQLiteBackend(uri[len('sqlite:///'):])
+    raise ValueError('Unknown rate limit backend %s' % uri)
+
+
+def route_class(request):
+    """
+    The route class whose limits apply to the request
+    """
+    if request.endpoint in IP_KEYED_ENDPOINTS:
+        return 'auth'
+    if request.args.get('q'):
+        return 'search'
+    if request.method in WRITE_METHODS:
+        return 'write'
+    return 'read'
+
+
+def client_address(request):
+    """
+    The IP of the client. Each trusted proxy appends the address it got
+    the request from to X-Forwarded-For, so the client is the one added
+    by the outermost of them and the entries before it can be forged
+    """
+    hops = int(current_app.config.get('RATELIMIT_TRUSTED_PROXIES') or 0)
+    if hops:
+        forwarded = [address.strip() for address
+                     in request.headers.get('X-Forwarded-For', '').split(',') if address.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return request.remote_addr
+
+
+def client_identity(request, route):
+    """
+    The user id in the bearer token, or the client IP
+    """
+    if route != 'auth':
+        user_id = get_token_user_id(request)
+        if user_id is not None:
+            return 'user:%s' % user_id
+    return 'ip:%s' % client_address(request)
+
+
+class RateLimiter(object):
+    """
+    Flask extension that rejects requests over their limit with a 429
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_BACKEND', 'memory')
+        app.config.setdefault('RATELIMIT_LIMITS', {})
+        app.config.setdefault('RATELIMIT_TRUSTED_PROXIES', 0)
+        app.extensions['ratelimit'] = create_backend(app.config['RATELIMIT_BACKEND'])
+        app.before_request(self.check_request)
+
+    @staticmethod
+    def check_request():
+        config = current_app.config
+        if not config['RATELIMIT_ENABLED'] or request.method == 'OPTIONS':
+            return None
+        route = route_class(request)
+        limit = config['RATELIMIT_LIMITS'].get(route)
+        if not limit:
+            return None
+        capacity, refill_rate = limit
+        backend = current_app.extensions['ratelimit']
+        wait = backend.consume('%s:%s' % (route, client_identity(request, route)),
+                               capacity, refill_rate)
+        if wait:
+            response = make_response(jsonify(
+                {'message': 'Too many requests. Try again later'}), 429)
+            response.headers['Retry-After'] = str(int(math.ceil(wait)))
+            return response
+        return None
+
+
+limiter = RateLimiter()
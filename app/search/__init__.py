@@ -0,0 +1,264 @@
+"""
+File to initialize the search Blueprint which finds the lists and items
+of a user by title or name, tolerating typos.
+
+Every user gets a candidate index of their distinct list titles and item
+names with an inverted index of their trigrams, built the first time
+they search. A query is only scored against the candidates sharing one
+of its trigrams, and the lists and items of the best matches are then
+loaded with one query. The index of a user is dropped when their lists
+or items change, and rebuilt after SEARCH_INDEX_MAX_AGE seconds so that
+the writes handled by other workers are seen too.
+"""
+
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from heapq import nsmallest
+
+from flask import Blueprint, current_app, has_app_context
+from flask.views import MethodView
+from flask import make_response, request, jsonify
+from sqlalchemy import and_, event, false, or_
+from sqlalchemy.orm import Session
+
+from app.authentication import get_authenticated_user
+from app.suggest import name_key
+
+search_blueprint = Blueprint('search', __name__)
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def trigrams(text):
+    """
+    The trigrams of the words of text, padded like pg_trgm does
+    """
+    grams = set()
+    for word in WORD.findall(name_key(text)):
+        padded = '  %s ' % word
+        for start in range(len(padded) - 2):
+            grams.add(padded[start:start + 3])
+    return grams
+
+
+class CandidateIndex(object):
+    """
+    The distinct titles and names of one user with the lists and items
+    using them, and the candidates of every trigram
+    """
+
+    def __init__(self, rows):
+        self.created = time.monotonic()
+        # text: (number of trigrams, [(type, id)])
+        self.entries = {}
+        self.postings = defaultdict(list)
+        for kind, row_id, text in rows:
+            key = name_key(text)
+            if not key:
+                continue
+            entry = self.entries.get(key)
+            if entry is None:
+                grams = trigrams(key)
+                entry = self.entries[key] = (len(grams), [])
+                for gram in grams:
+                    self.postings[gram].append(key)
+            entry[1].append((kind, row_id))
+
+    def search(self, query, limit, min_similarity):
+        """
+        The (similarity, type, id) of the best matches of query, best first.
+        The similarity is the number of shared trigrams over the number
+        of distinct trigrams of both texts
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        scored = []
+        for key, count in shared.items():
+            similarity = count / float(len(grams) + self.entries[key][0] - count)
+            if similarity >= min_similarity:
+                scored.append((similarity, key))
+        results = []
+        for similarity, key in nsmallest(limit, scored, key=lambda match: (-match[0], match[1])):
+            for kind, row_id in self.entries[key][1]:
+                results.append((similarity, kind, row_id))
+        return results[:limit]
+
+
+class SearchIndexCache(object):
+    """
+    LRU of the CandidateIndex of users by user id
+    """
+
+    def __init__(self, max_users, max_age):
+        self.max_users = max_users
+        self.max_age = max_age
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def build(self, user_id):
+        from app import db, GroceryList, GroceryItem
+        lists = db.session.query(GroceryList.id, GroceryList.title).filter(
+            GroceryList.user_id == user_id, GroceryList.deleted_at.is_(None)).all()
+        items = db.session.query(GroceryItem.id, GroceryItem.name).join(
+            GroceryList, GroceryItem.grocery_list_id == GroceryList.id
+        ).filter(GroceryList.user_id == user_id,
+                 GroceryList.deleted_at.is_(None),
+                 GroceryItem.deleted_at.is_(None)).all()
+        return CandidateIndex([('list', row_id, title) for row_id, title in lists] +
+                              [('item', row_id, name) for row_id, name in items])
+
+    def get(self, user_id):
+        with self.lock:
+            index = self.indexes.get(user_id)
+            if index is not None and time.monotonic() - index.created < self.max_age:
+                self.indexes.move_to_end(user_id)
+                return index
+        index = self.build(user_id)
+        with self.lock:
+            self.indexes[user_id] = index
+            self.indexes.move_to_end(user_id)
+            while len(self.indexes) > self.max_users:
+                self.indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                self.indexes.pop(user_id, None)
+
+
+class SearchIndex(object):
+    """
+    Flask extension keeping the candidate indexes of the searching users
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_MAX_USERS', 1000)
+        app.config.setdefault('SEARCH_INDEX_MAX_AGE', 60)
+        app.config.setdefault('SEARCH_LIMIT', 20)
+        app.config.setdefault('SEARCH_MIN_SIMILARITY', 0.3)
+        app.extensions['search'] = SearchIndexCache(
+            int(app.config['SEARCH_MAX_USERS']), float(app.config['SEARCH_INDEX_MAX_AGE']))
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_search_changes(session, flush_context):
+    """
+    Remember the users whose lists or items were changed by the flush
+    """
+    if not has_app_context() or 'search' not in current_app.extensions:
+        return
+    from app import GroceryList, GroceryItem, _change_owner
+    users = session.info.setdefault('search_changes', set())
+    with session.no_autoflush:
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, (GroceryList, GroceryItem)):
+                users.add(_change_owner(session, obj))
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_search_changes(session):
+    users = session.info.pop('search_changes', None)
+    if users and has_app_context() and 'search' in current_app.extensions:
+        current_app.extensions['search'].invalidate(users)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def discard_search_changes(session, previous_transaction):
+    session.info.pop('search_changes', None)
+
+
+def load_context(user_id, matches):
+    """
+    Load the lists and items of the matches with their lists in one query.
+    Returns the (list, item) pairs by (type, id), the item being None for lists
+    """
+    from app import db, GroceryList, GroceryItem
+    list_ids = [row_id for _, kind, row_id in matches if kind == 'list']
+    item_ids = [row_id for _, kind, row_id in matches if kind == 'item']
+    item_condition = GroceryItem.id.in_(item_ids) if item_ids else false()
+    rows = db.session.query(GroceryList, GroceryItem).outerjoin(
+        GroceryItem, and_(GroceryItem.grocery_list_id == GroceryList.id,
+                          GroceryItem.deleted_at.is_(None),
+                          item_condition)
+    ).filter(GroceryList.user_id == user_id,
+             GroceryList.deleted_at.is_(None),
+             or_(GroceryList.id.in_(list_ids) if list_ids else false(),
+                 GroceryItem.id.isnot(None))).all()
+    context = {}
+    for grocery_list, grocery_item in rows:
+        context[('list', grocery_list.id)] = (grocery_list, None)
+        if grocery_item is not None:
+            context[('item', grocery_item.id)] = (grocery_list, grocery_item)
+    return context
+
+
+class SearchView(MethodView):
+    def get(self):
+        """
+        The lists and items of the user best matching ?q=, best first
+        """
+        unauthorized_data = {'message': 'You do not have the appropriate permissions'}  # 403
+        user = get_authenticated_user(request)
+        if isinstance(user, str):
+            return make_response(jsonify({'message': user})), 401
+        if not user:
+            # User is not authenticated
+            return make_response(jsonify(unauthorized_data)), 403
+
+        query = request.args.get('q') or ''
+        if not query.strip():
+            return make_response(jsonify({'message': 'q is required'})), 400
+        try:
+            limit = int(request.args.get('limit') or current_app.config['SEARCH_LIMIT'])
+        except ValueError:
+            return make_response(jsonify({'message':
+                                          'limit query parameter should be an integer'})), 400
+        limit = max(1, min(limit, int(current_app.config['SEARCH_LIMIT'])))
+
+        index = current_app.extensions['search'].get(user.id)
+        matches = index.search(query, limit, float(current_app.config['SEARCH_MIN_SIMILARITY']))
+        context = load_context(user.id, matches) if matches else {}
+
+        response = []
+        for similarity, kind, row_id in matches:
+            if (kind, row_id) not in context:
+                # deleted since the index was built
+                continue
+            grocery_list, grocery_item = context[(kind, row_id)]
+            result = {
+                'type': kind,
+                'score': round(similarity, 3),
+                'list': {'id': grocery_list.id, 'title': grocery_list.title}
+            }
+            if grocery_item is not None:
+                result['item'] = {
+                    'id': grocery_item.id,
+                    'name': grocery_item.name,
+                    'quantity': grocery_item.quantity,
+                    'unit': grocery_item.unit
+                }
+            response.append(result)
+        return make_response(jsonify(response)), 200
+
+
+search_index = SearchIndex()
+
+search_view = SearchView.as_view('search_view')
+
+# /search endpoint
+search_blueprint.add_url_rule(
+    '/search',
+    view_func=search_view,
+    methods=['GET']
+)
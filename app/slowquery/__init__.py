@@ -0,0 +1,245 @@
+"""
+Log of the slowest SQL statements, used by `python manage.py slow_queries`.
+
+When SLOW_QUERY_ENABLED is set, the engines of the app time every
+statement they run. A statement that took SLOW_QUERY_THRESHOLD_MS or more
+is kept with the shape of its parameters and the route that ran it, in a
+buffer of the SLOW_QUERY_MAX_ENTRIES slowest. Its query plan is not
+fetched inline: once the request is over, a background thread runs
+EXPLAIN (EXPLAIN QUERY PLAN on sqlite) on a connection of its own and
+writes the buffer of the process to SLOW_QUERY_DIR/<pid>.json, which
+the manage command merges.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import queue
+import re
+import threading
+import time
+import weakref
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# statements whose plan can be shown without running them
+EXPLAINED = re.compile(r'^\s*(SELECT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+
+def parameter_shape(parameters, executemany=False):
+    """
+    The types of the bound parameters, without their values
+    """
+    if executemany:
+        rows = list(parameters or [])
+        return {'rows': len(rows), 'row': parameter_shape(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return dict((key, type(value).__name__) for key, value in parameters.items())
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def explain_statement(engine, statement, parameters):
+    """
+    The query plan of statement as a list of rows of strings
+    """
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    # a raw connection so that the EXPLAIN itself is not timed
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(prefix + statement, parameters)
+        plan = [[str(column) for column in row] for row in cursor.fetchall()]
+        cursor.close()
+        return plan
+    finally:
+        connection.close()
+
+
+class SlowQueryLog(object):
+    """
+    The slowest statements run by the engines of an app
+    """
+
+    def __init__(self, app, threshold=0.1, max_entries=50, explain=True, directory=None):
+        self.app = app
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.explain = explain
+        self.directory = directory
+        self.slowest = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.engines = weakref.WeakSet()
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def watch(self, engine):
+        """
+        Time the statements of engine
+        """
+        if engine in self.engines:
+            return
+        with self.lock:
+            if engine in self.engines:
+                return
+            event.listen(engine, 'before_cursor_execute', self.before_execute)
+            event.listen(engine, 'after_cursor_execute', self.after_execute)
+            self.engines.add(engine)
+
+    def watch_app_engines(self):
+        from app import db
+        self.watch(db.get_engine(self.app))
+        for bind in self.app.config.get('SQLALCHEMY_BINDS') or {}:
+            self.watch(db.get_engine(self.app, bind=bind))
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slowquery_start', []).append(time.perf_counter())
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['slowquery_start'].pop()
+        if duration < self.threshold:
+            return
+        entry = {
+            'duration_ms': round(duration * 1000, 3),
+            'statement': WHITESPACE.sub(' ', statement).strip(),
+            'parameters': parameter_shape(parameters, executemany),
+            'route': None,
+            'date': datetime.utcnow().isoformat() + 'Z',
+            'plan': None,
+        }
+        if has_request_context():
+            entry['route'] = '%s %s' % (request.method,
+                                        request.url_rule.rule if request.url_rule else request.path)
+        if not self.record(entry):
+            return
+        explain = None
+        if self.explain and not executemany and EXPLAINED.match(statement):
+            explain = (conn.engine, statement, parameters)
+        if has_request_context():
+            # handed to the thread once the response is sent
+            g.setdefault('slow_queries', []).append((entry, explain))
+        else:
+            self.queue.put((entry, explain))
+
+    def record(self, entry):
+        """
+        Keep entry when it is among the slowest, returns whether it was kept
+        """
+        item = (entry['duration_ms'], next(self.counter), entry)
+        with self.lock:
+            if len(self.slowest) < self.max_entries:
+                heapq.heappush(self.slowest, item)
+                return True
+            if item[0] <= self.slowest[0][0]:
+                return False
+            heapq.heapreplace(self.slowest, item)
+            return True
+
+    def entries(self):
+        """
+        The kept statements, the slowest first
+        """
+        with self.lock:
+            return [entry for _, _, entry in sorted(self.slowest, key=lambda item: -item[0])]
+
+    def clear(self):
+        with self.lock:
+            self.slowest = []
+
+    def watch_request(self):
+        self.watch_app_engines()
+
+    def finish_request(self, exception=None):
+        for pending in g.pop('slow_queries', None) or []:
+            self.queue.put(pending)
+
+    def path(self):
+        return os.path.join(self.directory, '%d.json' % os.getpid())
+
+    def dump(self):
+        """
+        Write the kept statements to the file of this process
+        """
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = self.path() + '.tmp'
+        with open(temporary, 'w') as dump_file:
+            json.dump({'pid': os.getpid(), 'entries': self.entries()}, dump_file)
+        os.replace(temporary, self.path())
+
+    def run(self):
+        while True:
+            pending = self.queue.get()
+            if pending is None:
+                self.queue.task_done()
+                return
+            entry, explain = pending
+            try:
+                if explain is not None:
+                    try:
+                        entry['plan'] = explain_statement(*explain)
+                    except Exception as e:
+                        entry['plan'] = 'EXPLAIN failed: %s' % e
+                self.dump()
+            except Exception:
+                self.app.logger.exception('Saving a slow query failed')
+            finally:
+                self.queue.task_done()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='slow-queries')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def wait(self):
+        """
+        Block until the plans of the recorded statements are captured
+        """
+        self.queue.join()
+
+
+def read_slow_queries(directory, limit=20):
+    """
+    The slowest statements of the files written by every process
+    """
+    entries = []
+    if os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as dump_file:
+                    dump = json.load(dump_file)
+            except (OSError, ValueError):
+                continue
+            for entry in dump['entries']:
+                entries.append(dict(entry, pid=dump['pid']))
+    entries.sort(key=lambda entry: -entry['duration_ms'])
+    return entries[:limit]
+
+
+def start_slow_query_log(app):
+    """
+    Start the slow query log of app when SLOW_QUERY_ENABLED is set
+    """
+    if not app.config.get('SLOW_QUERY_ENABLED'):
+        return None
+    slow_queries = SlowQueryLog(app,
+                                threshold=float(app.config['SLOW_QUERY_THRESHOLD_MS']) / 1000.0,
+                                max_entries=int(app.config['SLOW_QUERY_MAX_ENTRIES']),
+                                explain=app.config['SLOW_QUERY_EXPLAIN'],
+                                directory=app.config['SLOW_QUERY_DIR'])
+    app.extensions['slowquery'] = slow_queries
+    app.before_request(slow_queries.watch_request)
+    app.teardown_request(slow_queries.finish_request)
+    slow_queries.start()
+    return slow_queries
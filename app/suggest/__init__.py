@@ -0,0 +1,274 @@
+"""
+File to initialize the suggest Blueprint which autocompletes the item
+names a user has typed before.
+
+The names of a user are kept in memory in a sorted array with their use
+counts, built with one query the first time the user asks for a
+suggestion. Committed inserts, renames and deletes of items update the
+loaded arrays, and at most SUGGEST_MAX_USERS users are kept. The writes
+handled by other workers are not seen, so an array is rebuilt once it is
+older than SUGGEST_INDEX_MAX_AGE seconds.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from heapq import nsmallest
+
+from flask import Blueprint, current_app, has_app_context
+from flask.views import MethodView
+from flask import make_response, request, jsonify
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from app.authentication import get_authenticated_user
+
+suggest_blueprint = Blueprint('suggest', __name__)
+
+
+def name_key(name):
+    return ' '.join((name or '').lower().split())
+
+
+class NameIndex(object):
+    """
+    The item names of one user in a sorted array, with how many
+    active items use each of them
+    """
+
+    def __init__(self, counts=None):
+        self.counts = {}
+        self.names = {}
+        self.keys = []
+        self.created = time.monotonic()
+        for name, count in (counts or {}).items():
+            self.add(name, count)
+
+    def add(self, name, count=1):
+        key = name_key(name)
+        if not key:
+            return
+        if key not in self.counts:
+            insort(self.keys, key)
+            self.counts[key] = 0
+        self.counts[key] += count
+        # the latest spelling is the one suggested
+        self.names[key] = name.strip()
+
+    def remove(self, name):
+        key = name_key(name)
+        if key not in self.counts:
+            return
+        self.counts[key] -= 1
+        if self.counts[key] <= 0:
+            del self.counts[key]
+            del self.names[key]
+            del self.keys[bisect_left(self.keys, key)]
+
+    def suggest(self, prefix, limit):
+        """
+        The most used names starting with prefix, most used first
+        """
+        prefix = name_key(prefix)
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + u'\uffff', start)
+        keys = nsmallest(limit, self.keys[start:end], key=lambda key: (-self.counts[key], key))
+        return [(self.names[key], self.counts[key]) for key in keys]
+
+
+class SuggestionIndex(object):
+    """
+    Flask extension keeping the NameIndex of the most recently served users
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SUGGEST_MAX_USERS', 1000)
+        app.config.setdefault('SUGGEST_INDEX_MAX_AGE', 60)
+        app.config.setdefault('SUGGEST_LIMIT', 10)
+        app.extensions['suggest'] = SuggestionCache(
+            int(app.config['SUGGEST_MAX_USERS']), float(app.config['SUGGEST_INDEX_MAX_AGE']))
+
+
+class SuggestionCache(object):
+    """
+    LRU of the NameIndex of users by user id
+    """
+
+    def __init__(self, max_users, max_age=60):
+        self.max_users = max_users
+        self.max_age = max_age
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def build(self, user_id):
+        from app import db, GroceryList, GroceryItem
+        rows = db.session.query(GroceryItem.name, func.count(GroceryItem.id)).join(
+            GroceryList, GroceryItem.grocery_list_id == GroceryList.id
+        ).filter(GroceryList.user_id == user_id,
+                 GroceryList.deleted_at.is_(None),
+                 GroceryItem.deleted_at.is_(None)).group_by(GroceryItem.name).all()
+        return NameIndex(dict(rows))
+
+    def fresh(self, index):
+        return index is not None and time.monotonic() - index.created < self.max_age
+
+    def suggest(self, user_id, prefix, limit):
+        with self.lock:
+            index = self.indexes.get(user_id)
+            if self.fresh(index):
+                self.indexes.move_to_end(user_id)
+                return index.suggest(prefix, limit)
+        index = self.build(user_id)
+        with self.lock:
+            # a change committed while building may be missing, so keep
+            # the index that another request loaded in the meantime
+            loaded = self.indexes.get(user_id)
+            if self.fresh(loaded):
+                index = loaded
+            else:
+                self.indexes[user_id] = index
+            self.indexes.move_to_end(user_id)
+            while len(self.indexes) > self.max_users:
+                self.indexes.popitem(last=False)
+            return index.suggest(prefix, limit)
+
+    def apply(self, changes):
+        """
+        Update the loaded indexes with committed (user id, operation, name) changes
+        """
+        with self.lock:
+            for user_id, operation, name in changes:
+                index = self.indexes.get(user_id)
+                if index is None:
+                    continue
+                if operation == 'add':
+                    index.add(name)
+                elif operation == 'remove':
+                    index.remove(name)
+                else:
+                    # rebuilt on the next suggestion
+                    del self.indexes[user_id]
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
+
+
+def _item_changes(obj, operation):
+    """
+    The index changes for a flushed GroceryItem, or None when the old
+    name is not known and the index of the user has to be rebuilt
+    """
+    if operation == 'create':
+        return [('add', obj.name)] if obj.deleted_at is None else []
+    if operation == 'delete':
+        return [('remove', obj.name)] if obj.deleted_at is None else []
+    state = inspect(obj)
+    name_history = state.attrs.name.history
+    deleted_history = state.attrs.deleted_at.history
+    if not name_history.has_changes() and not deleted_history.has_changes():
+        return []
+    if name_history.has_changes() and not name_history.deleted:
+        # the name was expired before it was changed
+        return None
+    old_name = name_history.deleted[0] if name_history.deleted else obj.name
+    if deleted_history.deleted:
+        was_active = deleted_history.deleted[0] is None
+    else:
+        # tombstones are not edited, so an unknown old value was not set
+        was_active = deleted_history.has_changes() or obj.deleted_at is None
+    changes = []
+    if was_active:
+        changes.append(('remove', old_name))
+    if obj.deleted_at is None:
+        changes.append(('add', obj.name))
+    return changes
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_suggestion_changes(session, flush_context):
+    """
+    Remember the item name changes of the flush until the commit
+    """
+    if not has_app_context() or 'suggest' not in current_app.extensions:
+        return
+    from app import GroceryList, GroceryItem, _change_owner
+    pending = session.info.setdefault('suggest_changes', [])
+    with session.no_autoflush:
+        for operation, objects in (('create', session.new), ('update', session.dirty),
+                                   ('delete', session.deleted)):
+            for obj in objects:
+                if isinstance(obj, GroceryItem):
+                    changes = _item_changes(obj, operation)
+                elif isinstance(obj, GroceryList) and operation != 'create' \
+                        and obj.deleted_at is not None:
+                    # the items of a deleted list go with it
+                    changes = None
+                else:
+                    continue
+                if changes == []:
+                    continue
+                user_id = _change_owner(session, obj)
+                if user_id is None:
+                    continue
+                if changes is None:
+                    pending.append((user_id, 'reset', None))
+                else:
+                    pending.extend((user_id, change, name) for change, name in changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_suggestion_changes(session):
+    changes = session.info.pop('suggest_changes', None)
+    if changes and has_app_context() and 'suggest' in current_app.extensions:
+        current_app.extensions['suggest'].apply(changes)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def discard_suggestion_changes(session, previous_transaction):
+    session.info.pop('suggest_changes', None)
+
+
+class SuggestView(MethodView):
+    def get(self):
+        """
+        The item names of the user starting with ?prefix=, most used first
+        """
+        unauthorized_data = {'message': 'You do not have the appropriate permissions'}  # 403
+        user = get_authenticated_user(request)
+        if isinstance(user, str):
+            return make_response(jsonify({'message': user})), 401
+        if not user:
+            # User is not authenticated
+            return make_response(jsonify(unauthorized_data)), 403
+
+        prefix = request.args.get('prefix') or ''
+        if not prefix.strip():
+            return make_response(jsonify({'message': 'prefix is required'})), 400
+        try:
+            limit = int(request.args.get('limit') or current_app.config['SUGGEST_LIMIT'])
+        except ValueError:
+            return make_response(jsonify({'message':
+                                          'limit query parameter should be an integer'})), 400
+        limit = max(1, min(limit, int(current_app.config['SUGGEST_LIMIT'])))
+
+        suggestions = current_app.extensions['suggest'].suggest(user.id, prefix, limit)
+        response = [{'name': name, 'uses': uses} for name, uses in suggestions]
+        return make_response(jsonify(response)), 200
+
+
+suggestion_index = SuggestionIndex()
+
+suggest_view = SuggestView.as_view('suggest_view')
+
+# /items/suggest endpoint
+suggest_blueprint.add_url_rule(
+    '/items/suggest',
+    view_func=suggest_view,
+    methods=['GET']
+)
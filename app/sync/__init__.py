@@ -0,0 +1,139 @@
+"""
+File to initialize the sync Blueprint which lets offline-first clients
+download only what changed since their last sync
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import Blueprint, current_app
+from flask.views import MethodView
+from flask import make_response, request, jsonify
+
+from app.authentication import get_authenticated_user
+
+sync_blueprint = Blueprint('sync', __name__)
+
+
+def serialize_list(grocery_list):
+    return {
+        'id': grocery_list.id,
+        'title': grocery_list.title,
+        'description': grocery_list.description,
+        'updated_at': grocery_list.updated_at.isoformat() if grocery_list.updated_at else None
+    }
+
+
+def serialize_item(grocery_item):
+    return {
+        'id': grocery_item.id,
+        'list_id': grocery_item.grocery_list_id,
+        'name': grocery_item.name,
+        'quantity': grocery_item.quantity,
+        'unit': grocery_item.unit,
+        'updated_at': grocery_item.updated_at.isoformat() if grocery_item.updated_at else None
+    }
+
+
+def collect_changes(entries):
+    """
+    Collapse the change log entries to the last operation of every
+    entity and load the current state of the created and updated ones
+    with one IN query per table
+    """
+    from app import ChangeLog, GroceryList, GroceryItem
+    latest = OrderedDict()
+    for entry in entries:
+        key = (entry.entity, entry.entity_id)
+        # a later entry replaces an earlier one but keeps its position last
+        latest.pop(key, None)
+        latest[key] = entry.operation
+
+    models = {'grocerylist': (GroceryList, serialize_list),
+              'groceryitem': (GroceryItem, serialize_item)}
+    current = {}
+    for entity, (model, _) in models.items():
+        ids = [entity_id for (name, entity_id), operation in latest.items()
+               if name == entity and operation != 'delete']
+        if ids:
+            current[entity] = dict((row.id, row) for row in
+                                   model.query.filter(model.id.in_(ids)).all())
+
+    changes = []
+    for (entity, entity_id), operation in latest.items():
+        change = {'type': ChangeLog.ENTITIES[entity], 'id': entity_id, 'op': operation}
+        if operation != 'delete':
+            row = current.get(entity, {}).get(entity_id)
+            if row is None or row.deleted_at is not None:
+                # it has been deleted after this page of the log
+                change['op'] = 'delete'
+            else:
+                change['data'] = models[entity][1](row)
+        changes.append(change)
+    return changes
+
+
+def safe_watermark(entries, since, lag):
+    """
+    The id of the last entry of entries the watermark can move to. The ids
+    follow the order of the inserts, not of the commits, so an entry with
+    a lower id may still be uncommitted while a younger one is read. The
+    watermark stops before the first entry written less than lag ago, and
+    the entries after it are sent again on the next sync
+    """
+    cutoff = datetime.utcnow() - lag
+    watermark = since
+    for entry in entries:
+        if entry.changed_at > cutoff:
+            break
+        watermark = entry.id
+    return watermark
+
+
+class SyncView(MethodView):
+    def get(self):
+        """
+        Return the changes to the lists and items of the user after the
+        ?since= watermark, and the watermark to send on the next sync.
+        When has_more is true the client should sync again right away
+        """
+        unauthorized_data = {'message': 'You do not have the appropriate permissions'}  # 403
+        user = get_authenticated_user(request)
+        if isinstance(user, str):
+            return make_response(jsonify({'message': user})), 401
+        if not user:
+            # User is not authenticated
+            return make_response(jsonify(unauthorized_data)), 403
+
+        try:
+            since = int(request.args.get('since') or 0)
+            limit = int(request.args.get('limit') or current_app.config['SYNC_PAGE_SIZE'])
+        except ValueError:
+            return make_response(jsonify({'message':
+                                          'since and limit query parameters should be integers'})), 400
+        limit = max(1, min(limit, int(current_app.config['SYNC_PAGE_SIZE'])))
+
+        from app import ChangeLog
+        # one more entry than needed tells whether there are more pages
+        entries = ChangeLog.since(user.id, since, limit + 1)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        watermark = safe_watermark(
+            entries, since, timedelta(seconds=float(current_app.config['SYNC_WATERMARK_LAG'])))
+        response = {
+            'changes': collect_changes(entries),
+            'watermark': watermark,
+            # a held back watermark would return the same page again right away
+            'has_more': has_more and bool(entries) and watermark == entries[-1].id
+        }
+        return make_response(jsonify(response)), 200
+
+
+sync_view = SyncView.as_view('sync_view')
+
+# /sync endpoint
+sync_blueprint.add_url_rule(
+    '/sync',
+    view_func=sync_view,
+    methods=['GET']
+)
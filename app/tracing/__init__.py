@@ -0,0 +1,254 @@
+"""
+In-process tracing of the requests, summarized by `python manage.py traces`.
+
+When TRACING_ENABLED is set, a share TRACE_SAMPLE_RATE of the requests
+is traced. The views open nested spans with
+
+    with span('db.query'):
+        ...
+
+and each span records its parent, so the time of a request can be split
+between the token checks, the queries, the serialization and the writing
+of the response. Once the response has been sent, the trace is appended
+as one JSON line to TRACE_FILE. Outside of a sampled request span() does
+nothing.
+"""
+
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import g, has_app_context, request
+
+
+class Span(object):
+    """
+    A timed part of a trace
+    """
+
+    def __init__(self, span_id, parent_id, name, attributes):
+        self.id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end = None
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+
+class Trace(object):
+    """
+    The spans of one request
+    """
+
+    def __init__(self, route):
+        self.id = uuid.uuid4().hex
+        self.route = route
+        self.ids = itertools.count(1)
+        self.spans = []
+        self.stack = []
+        self.status = None
+        self.finished = False
+        self.root = self.open('request', {})
+
+    def open(self, name, attributes):
+        parent_id = self.stack[-1].id if self.stack else None
+        opened = Span(next(self.ids), parent_id, name, attributes)
+        self.spans.append(opened)
+        self.stack.append(opened)
+        return opened
+
+    def close(self, closed):
+        closed.finish()
+        if self.stack and self.stack[-1] is closed:
+            self.stack.pop()
+
+    @contextmanager
+    def span(self, name, attributes):
+        opened = self.open(name, attributes)
+        try:
+            yield opened
+        finally:
+            self.close(opened)
+
+    def finish(self):
+        """
+        Close the spans left open and the request span
+        """
+        while self.stack:
+            self.close(self.stack[-1])
+        self.finished = True
+
+    def to_dict(self):
+        start = self.root.start
+        return {
+            'trace_id': self.id,
+            'route': self.route,
+            'status': self.status,
+            'duration_ms': round((self.root.end - start) * 1000, 3),
+            'spans': [{
+                'id': traced.id,
+                'parent_id': traced.parent_id,
+                'name': traced.name,
+                'start_ms': round((traced.start - start) * 1000, 3),
+                'duration_ms': round(((traced.end or self.root.end) - traced.start) * 1000, 3),
+                'attributes': traced.attributes,
+            } for traced in self.spans],
+        }
+
+
+def current_trace():
+    """
+    The trace of the current request, or None when it is not sampled
+    """
+    if not has_app_context():
+        return None
+    return g.get('trace')
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the block as a child of the innermost open span of the request
+    """
+    trace = current_trace()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name, attributes) as opened:
+        yield opened
+
+
+class Tracer(object):
+    """
+    Samples the requests of an app and writes their traces to path
+    """
+
+    def __init__(self, app, sample_rate=0.01, path=None):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.path = path
+        self.lock = threading.Lock()
+        self.random = random.Random()
+
+    def start_trace(self):
+        if self.random.random() >= self.sample_rate:
+            return
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g.trace = Trace('%s %s' % (request.method, rule))
+
+    def trace_response(self, response):
+        """
+        Time what is left of the request, the other after_request
+        functions and the writing of the body, until the server closes it
+        """
+        trace = g.get('trace')
+        if trace is None:
+            return response
+        trace.status = response.status_code
+        written = trace.open('response.write', {})
+
+        def finish():
+            trace.close(written)
+            self.finish_trace(trace)
+        response.call_on_close(finish)
+        return response
+
+    def end_trace(self, exception=None):
+        trace = g.pop('trace', None)
+        if trace is not None and exception is not None:
+            # no response was made
+            trace.status = 500
+            self.finish_trace(trace)
+
+    def finish_trace(self, trace):
+        if trace.finished:
+            return
+        trace.finish()
+        self.export(trace.to_dict())
+
+    def export(self, traced):
+        if not self.path:
+            return
+        line = json.dumps(traced) + '\n'
+        try:
+            with self.lock:
+                with open(self.path, 'a') as trace_file:
+                    trace_file.write(line)
+        except OSError:
+            self.app.logger.exception('Writing the trace failed')
+
+
+def read_traces(path):
+    """
+    The traces of a JSON lines file
+    """
+    if not os.path.exists(path):
+        return
+    with open(path) as trace_file:
+        for line in trace_file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # a line being written by a worker
+                continue
+
+
+def summarize_traces(traces):
+    """
+    Where the time of the requests goes, per route. For each span name
+    the mean time per request and its share of the request time; the
+    time not covered by any child of the request span is 'untraced'
+    """
+    routes = {}
+    for traced in traces:
+        route = routes.setdefault(traced['route'], {'requests': 0, 'total_ms': 0.0, 'spans': {}})
+        route['requests'] += 1
+        route['total_ms'] += traced['duration_ms']
+        covered = 0.0
+        for traced_span in traced['spans']:
+            if traced_span['parent_id'] is None:
+                continue
+            if traced_span['parent_id'] == 1:
+                covered += traced_span['duration_ms']
+            times = route['spans'].setdefault(traced_span['name'], {'count': 0, 'total_ms': 0.0})
+            times['count'] += 1
+            times['total_ms'] += traced_span['duration_ms']
+        untraced = route['spans'].setdefault('untraced', {'count': 0, 'total_ms': 0.0})
+        untraced['count'] += 1
+        untraced['total_ms'] += max(traced['duration_ms'] - covered, 0.0)
+
+    summary = {}
+    for name, route in routes.items():
+        summary[name] = {
+            'requests': route['requests'],
+            'mean_ms': round(route['total_ms'] / route['requests'], 3),
+            'spans': dict((span_name, {
+                'count': times['count'],
+                'mean_ms': round(times['total_ms'] / route['requests'], 3),
+                'share': round(times['total_ms'] / route['total_ms'], 4) if route['total_ms'] else 0.0,
+            }) for span_name, times in route['spans'].items()),
+        }
+    return summary
+
+
+def start_tracing(app):
+    """
+    Trace the requests of app when TRACING_ENABLED is set
+    """
+    if not app.config.get('TRACING_ENABLED'):
+        return None
+    tracer = Tracer(app, sample_rate=float(app.config['TRACE_SAMPLE_RATE']),
+                    path=app.config['TRACE_FILE'])
+    app.extensions['tracing'] = tracer
+    app.before_request(tracer.start_trace)
+    app.after_request(tracer.trace_response)
+    app.teardown_request(tracer.end_trace)
+    return tracer
@@ -0,0 +1,320 @@
+"""
+File to initialize the transfer Blueprint which handles the bulk
+import and the export of grocery lists and items
+"""
+
+import csv
+import json
+import zlib
+from collections import OrderedDict
+
+from flask import Blueprint, Response, current_app, stream_with_context
+from flask.views import MethodView
+from flask import make_response, request, jsonify
+
+from app.authentication import get_authenticated_user
+
+transfer_blueprint = Blueprint('transfer', __name__)
+
+# the most grocery lists remembered by title during one import
+LIST_CACHE_SIZE = 1000
+# bytes of NDJSON gathered before a chunk of the export is sent
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def read_lines(stream):
+    """
+    Lazily decode the lines of a binary stream, one at a time
+    """
+    for line in iter(stream.readline, b''):
+        yield line.decode('utf-8', errors='replace')
+
+
+def parse_csv(stream):
+    """
+    Yield (row number, dict) for each row of a CSV stream with a header
+    """
+    for number, row in enumerate(csv.DictReader(read_lines(stream)), start=1):
+        yield number, row
+
+
+def parse_ndjson(stream):
+    """
+    Yield (row number, dict or error string) for each line of an NDJSON stream
+    """
+    for number, line in enumerate(read_lines(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, 'The line is not valid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield number, 'The line should be a JSON object'
+            continue
+        yield number, row
+
+
+def clean_row(row):
+    """
+    Validate an imported row and return (list title, list description,
+    name, quantity, unit). Raises ValueError when the row is invalid
+    """
+    if not isinstance(row, dict):
+        raise ValueError(row)
+    for key in ('list_title', 'name', 'unit', 'list_description'):
+        if row.get(key) is not None and not isinstance(row[key], str):
+            raise ValueError('%s should be a string' % key)
+    title = (row.get('list_title') or '').strip()
+    name = (row.get('name') or '').strip()
+    if not title:
+        raise ValueError('list_title is required')
+    if not name:
+        raise ValueError('name is required')
+    quantity = row.get('quantity')
+    try:
+        quantity = float(quantity) if quantity not in (None, '') else 0.0
+    except (TypeError, ValueError):
+        raise ValueError('quantity should be a number')
+    unit = (row.get('unit') or 'units').strip()
+    description = row.get('list_description') or ''
+    return title, description, name, quantity, unit
+
+
+class ListCache(object):
+    """
+    Grocery lists of the importing user by title, created on first use.
+    Bounded so that an import with many lists does not grow without limit
+    """
+
+    def __init__(self, user, size=LIST_CACHE_SIZE):
+        self.user = user
+        self.size = size
+        self.lists = OrderedDict()
+        self.created = 0
+
+    def load(self, titles):
+        """
+        Make sure the lists with titles are cached, with one IN query
+        for the missing ones and an insert for those that do not exist
+        """
+        from app import db, GroceryList
+        missing = set(title for title in titles if title not in self.lists)
+        if missing:
+            found = GroceryList.active().filter(GroceryList.user_id == self.user.id,
+                                             GroceryList.title.in_(missing)).all()
+            for grocery_list in found:
+                self.lists[grocery_list.title] = grocery_list
+                missing.discard(grocery_list.title)
+        for title, description in titles.items():
+            if title in missing:
+                grocery_list = GroceryList(title=title, description=description,
+                                           owner=self.user)
+                db.session.add(grocery_list)
+                self.lists[title] = grocery_list
+                self.created += 1
+        for title in titles:
+            self.lists.move_to_end(title)
+        while len(self.lists) > max(self.size, len(titles)):
+            self.lists.popitem(last=False)
+
+    def get(self, title):
+        return self.lists[title]
+
+    def clear(self):
+        self.lists.clear()
+
+
+def import_rows(user, rows, batch_size):
+    """
+    Insert the parsed rows in transactions of batch_size rows.
+    Yields an event dict for every invalid row and committed batch,
+    then a final 'done' event with the totals
+    """
+    from app import db, GroceryItem
+    lists = ListCache(user)
+    totals = {'rows': 0, 'imported': 0, 'errors': 0, 'batches': 0}
+    batch = []
+
+    def commit_batch():
+        titles = OrderedDict()
+        for _, (title, description, _, _, _) in batch:
+            titles.setdefault(title, description)
+        try:
+            lists.load(titles)
+            for _, (title, _, name, quantity, unit) in batch:
+                db.session.add(GroceryItem(name=name, quantity=quantity, unit=unit,
+                                           parent_list=lists.get(title)))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            # the lists created in the failed batch were rolled back too
+            lists.clear()
+            totals['errors'] += len(batch)
+            return {'event': 'error', 'rows': [number for number, _ in batch],
+                    'message': 'The batch could not be saved: %s' % e}
+        totals['imported'] += len(batch)
+        totals['batches'] += 1
+        return dict(event='progress', **totals)
+
+    for number, row in rows:
+        totals['rows'] += 1
+        try:
+            batch.append((number, clean_row(row)))
+        except ValueError as e:
+            totals['errors'] += 1
+            yield {'event': 'error', 'row': number, 'message': str(e)}
+            continue
+        if len(batch) >= batch_size:
+            yield commit_batch()
+            batch = []
+    if batch:
+        yield commit_batch()
+    yield dict(event='done', lists_created=lists.created, **totals)
+
+
+class ImportView(MethodView):
+    def post(self):
+        """
+        Import grocery lists and items from a CSV or NDJSON body.
+        Every row has list_title, name and optionally list_description,
+        quantity and unit. The body is parsed as it is read and saved in
+        batches. Add ?progress=stream to get the progress as NDJSON events
+        """
+        unauthorized_data = {'message': 'You do not have the appropriate permissions'}  # 403
+        user = get_authenticated_user(request)
+        if isinstance(user, str):
+            return make_response(jsonify({'message': user})), 401
+        if not user:
+            # User is not authenticated
+            return make_response(jsonify(unauthorized_data)), 403
+
+        data_format = request.args.get('format') or (
+            'csv' if request.mimetype in ('text/csv', 'application/csv') else 'ndjson')
+        if data_format not in ('csv', 'ndjson'):
+            return make_response(jsonify(
+                {'message': 'format should be csv or ndjson'})), 400
+        if not request.content_length:
+            return make_response(jsonify({'message': 'no data was sent'})), 400
+
+        parse = parse_csv if data_format == 'csv' else parse_ndjson
+        events = import_rows(user, parse(request.stream),
+                             int(current_app.config['IMPORT_BATCH_SIZE']))
+
+        if request.args.get('progress') == 'stream':
+            def generate():
+                for event in events:
+                    yield json.dumps(event) + '\n'
+            return Response(stream_with_context(generate()),
+                            mimetype='application/x-ndjson')
+
+        # keep only the first errors so that the response stays small
+        max_errors = int(current_app.config['IMPORT_MAX_REPORTED_ERRORS'])
+        errors = []
+        summary = {}
+        for event in events:
+            if event['event'] == 'error' and len(errors) < max_errors:
+                errors.append(event)
+            elif event['event'] == 'done':
+                summary = event
+        summary.pop('event', None)
+        summary['message'] = 'Import finished'
+        summary['error_details'] = errors
+        return make_response(jsonify(summary)), 200
+
+
+def export_lines(rows):
+    """
+    Turn the ordered (list, item) rows of the export into NDJSON lines:
+    one 'list' line before the 'item' lines of each list
+    """
+    current_list_id = None
+    for list_id, title, description, item_id, name, quantity, unit in rows:
+        if list_id != current_list_id:
+            current_list_id = list_id
+            yield json.dumps({'type': 'list', 'id': list_id, 'title': title,
+                              'description': description}) + '\n'
+        if item_id is not None:
+            yield json.dumps({'type': 'item', 'id': item_id, 'list_id': list_id,
+                              'name': name, 'quantity': quantity, 'unit': unit}) + '\n'
+
+
+def chunked(lines, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Gather lines into byte chunks of about chunk_size
+    """
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzipped(chunks, level=6):
+    """
+    Compress the chunks into a gzip stream on the fly
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class ExportView(MethodView):
+    def get(self):
+        """
+        Stream all the lists and items of the user as NDJSON.
+        Add ?compress=gzip to download it as a gzip archive
+        """
+        unauthorized_data = {'message': 'You do not have the appropriate permissions'}  # 403
+        user = get_authenticated_user(request)
+        if isinstance(user, str):
+            return make_response(jsonify({'message': user})), 401
+        if not user:
+            # User is not authenticated
+            return make_response(jsonify(unauthorized_data)), 403
+
+        compress = request.args.get('compress')
+        if compress not in (None, 'gzip'):
+            return make_response(jsonify({'message': 'compress can only be gzip'})), 400
+
+        rows = user.iter_grocery_lists_with_items(
+            int(current_app.config['EXPORT_YIELD_PER']))
+        body = chunked(export_lines(rows))
+        if compress:
+            response = Response(stream_with_context(gzipped(body)),
+                                mimetype='application/gzip')
+            response.headers['Content-Disposition'] = \
+                'attachment; filename=grocerylists.ndjson.gz'
+        else:
+            response = Response(stream_with_context(body),
+                                mimetype='application/x-ndjson')
+        return response
+
+
+import_view = ImportView.as_view('import_view')
+export_view = ExportView.as_view('export_view')
+
+# /grocerylists/import endpoint
+transfer_blueprint.add_url_rule(
+    '/grocerylists/import',
+    view_func=import_view,
+    methods=['POST']
+)
+
+# /export endpoint
+transfer_blueprint.add_url_rule(
+    '/export',
+    view_func=export_view,
+    methods=['GET']
+)
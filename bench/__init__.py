@@ -0,0 +1,89 @@
+"""
+Reproducible load-test harness for the grocery API.
+
+It seeds a dataset in bulk, drives a mixed workload against either the
+in-process test_client or gunicorn over localhost and reports throughput
+and latency percentiles per endpoint as JSON. Run it with
+`python manage.py bench --help`.
+"""
+
+import os
+import tempfile
+
+from app import create_app, db
+from bench.drivers import TestClientDriver, HttpDriver, GunicornServer
+from bench.report import build_report, write_report
+from bench.seed import seed_dataset
+from bench.workload import run_workload, parse_mix
+
+
+def default_database_uri():
+    """
+    A fresh sqlite file in the temp directory
+    """
+    handle, path = tempfile.mkstemp(prefix='rideco-bench-', suffix='.db')
+    os.close(handle)
+    return 'sqlite:///' + path
+
+
+def create_bench_app(database_uri, config_name='benchmark', overrides=None):
+    """
+    Create the app against database_uri with a fresh schema, overrides
+    are applied to its config before the database is first used
+    """
+    app = create_app(config_name)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config.update(overrides or {})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def run_benchmark(users=10, lists=5, items=20, requests=200, concurrency=1,
+                  server='test_client', url=None, workers=2, mix=None, seed=0,
+                  database_uri=None, config_name='benchmark', output=None):
+    """
+    Seed the dataset, run the workload and write the JSON report.
+    server is one of 'test_client', 'gunicorn' or 'url' (an already running
+    server at url, which should have been seeded the same way)
+    """
+    database_uri = database_uri or default_database_uri()
+    operations = parse_mix(mix)
+    parameters = {
+        'users': users, 'lists_per_user': lists, 'items_per_list': items,
+        'requests_per_worker': requests, 'concurrency': concurrency,
+        'server': server, 'workers': workers if server == 'gunicorn' else None,
+        'mix': operations, 'seed': seed,
+    }
+
+    app = None
+    if server != 'url':
+        app = create_bench_app(database_uri, config_name)
+        with app.app_context():
+            seeded = seed_dataset(users=users, lists_per_user=lists,
+                                  items_per_list=items, seed=seed)
+        accounts = [(username, seeded['password']) for username in seeded['usernames']]
+    else:
+        from bench.seed import BENCH_PASSWORD
+        accounts = [('bench_user_%d' % user_id, BENCH_PASSWORD)
+                    for user_id in range(1, users + 1)]
+
+    if server == 'test_client':
+        recorder, wall_time = run_workload(TestClientDriver(app), accounts, requests,
+                                           concurrency, operations, seed)
+    elif server == 'gunicorn':
+        with GunicornServer(database_uri, config_name, workers) as gunicorn:
+            recorder, wall_time = run_workload(HttpDriver(gunicorn.base_url), accounts,
+                                               requests, concurrency, operations, seed)
+    elif server == 'url':
+        if not url:
+            raise ValueError('A url is required when server is "url"')
+        recorder, wall_time = run_workload(HttpDriver(url), accounts, requests,
+                                           concurrency, operations, seed)
+    else:
+        raise ValueError('server should be test_client, gunicorn or url')
+
+    report = build_report(recorder, wall_time, parameters)
+    write_report(report, output)
+    return report
@@ -0,0 +1,94 @@
+"""
+CPU cost of renewing an access token with /auth/login against
+/auth/refresh. Run it with `python manage.py bench_auth --help`.
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+from bench import create_bench_app, default_database_uri
+from bench.drivers import TestClientDriver
+from bench.report import git_commit, summarize_samples, write_report
+from bench.seed import BENCH_PASSWORD, seed_dataset
+
+# minutes an access token is valid, see User.generate_token
+ACCESS_TOKEN_MINUTES = 15
+
+
+def measure_calls(call, requests):
+    """
+    Run call requests times, returns its latency summary and the CPU
+    time of the process per call in ms
+    """
+    samples = []
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(requests):
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+    summary = summarize_samples(samples, 0, time.perf_counter() - wall_start)
+    summary['cpu_ms'] = round((time.process_time() - cpu_start) / requests * 1000, 3)
+    return summary
+
+
+def run_auth_benchmark(requests=50, config_name='benchmark', output=None):
+    """
+    Measure logins and refreshes of one user in process and write the
+    JSON report with the expected login CPU per client and hour
+    """
+    database_uri = default_database_uri()
+    try:
+        app = create_bench_app(database_uri, config_name)
+        with app.app_context():
+            seeded = seed_dataset(users=1, lists_per_user=1, items_per_list=0)
+        driver = TestClientDriver(app)
+        credentials = json.dumps({'username': seeded['usernames'][0], 'password': BENCH_PASSWORD})
+        tokens = {}
+
+        def login():
+            status, body = driver.request('POST', '/auth/login', body=credentials)
+            if status != 200:
+                raise RuntimeError('Could not login the benchmark user')
+            tokens.update(json.loads(body.decode()))
+
+        def refresh():
+            status, body = driver.request(
+                'POST', '/auth/refresh', body=json.dumps({'refresh_token': tokens['refresh_token']}))
+            if status != 200:
+                raise RuntimeError('Could not refresh the token')
+            tokens.update(json.loads(body.decode()))
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'date': datetime.utcnow().isoformat() + 'Z',
+                'parameters': {'requests': requests,
+                               'bcrypt_log_rounds': int(app.config['BCRYPT_LOG_ROUNDS']),
+                               'refresh_token_ttl': int(app.config['REFRESH_TOKEN_TTL'])},
+            },
+            'login': measure_calls(login, requests),
+            'refresh': measure_calls(refresh, requests),
+        }
+    finally:
+        os.remove(database_uri[len('sqlite:///'):])
+
+    # an active client renews its access token every ACCESS_TOKEN_MINUTES,
+    # with a login each time before and a refresh (plus a rare login) now
+    renewals = 60.0 / ACCESS_TOKEN_MINUTES
+    logins = 3600.0 / int(report['meta']['parameters']['refresh_token_ttl'])
+    before = renewals * report['login']['cpu_ms']
+    after = renewals * report['refresh']['cpu_ms'] + logins * report['login']['cpu_ms']
+    report['per_client_hour'] = {
+        'cpu_ms_login_only': round(before, 3),
+        'cpu_ms_with_refresh': round(after, 3),
+        'expected_drop': round(1 - after / before, 4) if before else None,
+    }
+    write_report(report, output)
+    return report
@@ -0,0 +1,140 @@
+"""
+Drivers send the benchmark requests either to the in-process
+flask test_client or to a real server over localhost
+"""
+
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class TestClientDriver(object):
+    """
+    Sends requests through the flask test_client of app
+    """
+    name = 'test_client'
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, headers=None, body=None):
+        """
+        Send the request and return (status_code, body bytes)
+        """
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, headers=headers or {},
+                               data=body)
+        return response.status_code, response.data
+
+
+class HttpDriver(object):
+    """
+    Sends requests over keep-alive HTTP connections, one per thread
+    """
+    name = 'http'
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+        return connection
+
+    def request(self, method, path, headers=None, body=None):
+        """
+        Send the request and return (status_code, body bytes)
+        """
+        try:
+            connection = self._connection()
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            # drop the broken connection so that the next request reconnects
+            self.local.connection = None
+            raise
+
+
+def free_port():
+    """
+    Ask the OS for a free TCP port on localhost
+    """
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class GunicornServer(object):
+    """
+    Context manager running bench.wsgi:app under gunicorn on localhost
+    """
+
+    def __init__(self, database_uri, config_name='benchmark', workers=2,
+                 port=None, startup_timeout=30, environ=None):
+        self.database_uri = database_uri
+        self.environ = environ or {}
+        self.config_name = config_name
+        self.workers = workers
+        self.port = port or free_port()
+        self.startup_timeout = startup_timeout
+        self.process = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%d' % self.port
+
+    def _wait_until_listening(self):
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('gunicorn exited with code %s' % self.process.returncode)
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError('gunicorn did not start within %s seconds' % self.startup_timeout)
+
+    def __enter__(self):
+        env = dict(os.environ)
+        env['APP_SETTINGS'] = self.config_name
+        env['BENCH_DATABASE_URL'] = self.database_uri
+        env.update(self.environ)
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--bind', '127.0.0.1:%d' % self.port,
+             '--workers', str(self.workers), '--log-level', 'warning',
+             'bench.wsgi:app'],
+            cwd=project_root, env=env)
+        try:
+            self._wait_until_listening()
+        except Exception:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
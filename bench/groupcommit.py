@@ -0,0 +1,106 @@
+"""
+Throughput of concurrent item inserts with a commit per request against
+group commit. Run it with `python manage.py bench_group_commit --help`.
+"""
+
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime
+
+from app.groupcommit import start_group_commit
+from bench import create_bench_app, default_database_uri
+from bench.drivers import TestClientDriver
+from bench.report import git_commit, summarize_samples, write_report
+from bench.seed import BENCH_PASSWORD, seed_dataset
+
+
+def measure_inserts(group_commit, requests=200, concurrency=8, max_delay_ms=5,
+                    max_batch=100, config_name='benchmark'):
+    """
+    Insert concurrency * requests items into one list from concurrency
+    threads on a fresh sqlite file and summarize the latencies
+    """
+    database_uri = default_database_uri()
+    committer = None
+    try:
+        app = create_bench_app(database_uri, config_name)
+        with app.app_context():
+            seeded = seed_dataset(users=1, lists_per_user=1, items_per_list=0)
+        if group_commit:
+            app.config.update(GROUP_COMMIT_ENABLED=True, GROUP_COMMIT_MAX_DELAY_MS=max_delay_ms,
+                              GROUP_COMMIT_MAX_BATCH=max_batch)
+            committer = start_group_commit(app)
+
+        driver = TestClientDriver(app)
+        status, body = driver.request(
+            'POST', '/auth/login',
+            body=json.dumps({'username': seeded['usernames'][0], 'password': BENCH_PASSWORD}))
+        if status != 200:
+            raise RuntimeError('Could not login the benchmark user')
+        headers = {'Authorization': 'Bearer ' + json.loads(body.decode())['access_token']}
+        path = '/grocerylists/%d/items/' % seeded['list_ids'][0]
+
+        samples = []
+        errors = []
+        lock = threading.Lock()
+
+        def insert(worker):
+            worker_samples = []
+            worker_errors = 0
+            for index in range(requests):
+                data = json.dumps({'name': 'item %d-%d' % (worker, index), 'quantity': 1})
+                start = time.perf_counter()
+                status, _ = driver.request('POST', path, headers=headers, body=data)
+                worker_samples.append(time.perf_counter() - start)
+                if status != 201:
+                    worker_errors += 1
+            with lock:
+                samples.extend(worker_samples)
+                errors.append(worker_errors)
+
+        threads = [threading.Thread(target=insert, args=(worker,))
+                   for worker in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - start
+
+        summary = summarize_samples(samples, sum(errors), wall_time)
+        if committer is not None:
+            summary['transactions'] = committer.batches
+        return summary
+    finally:
+        if committer is not None:
+            committer.stop()
+        os.remove(database_uri[len('sqlite:///'):])
+
+
+def run_group_commit_benchmark(requests=200, concurrency=8, max_delay_ms=5, max_batch=100,
+                               output=None):
+    """
+    Measure both modes and write the JSON report
+    """
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'date': datetime.utcnow().isoformat() + 'Z',
+            'parameters': {'requests_per_worker': requests, 'concurrency': concurrency,
+                           'max_delay_ms': max_delay_ms, 'max_batch': max_batch},
+        },
+        'commit_per_request': measure_inserts(False, requests, concurrency),
+        'group_commit': measure_inserts(True, requests, concurrency, max_delay_ms, max_batch),
+    }
+    per_request = report['commit_per_request'].get('throughput_rps')
+    grouped = report['group_commit'].get('throughput_rps')
+    if per_request and grouped:
+        report['speedup'] = round(grouped / per_request, 2)
+    write_report(report, output)
+    return report
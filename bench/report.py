@@ -0,0 +1,86 @@
+"""
+Turns the recorded latency samples into a JSON report
+"""
+
+import json
+import math
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+
+def percentile(sorted_samples, percent):
+    """
+    Nearest-rank percentile of an already sorted list of samples
+    """
+    if not sorted_samples:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(sorted_samples)))
+    return sorted_samples[max(rank, 1) - 1]
+
+
+def summarize_samples(samples, errors=0, wall_time=None):
+    """
+    Count, throughput and latency percentiles (in ms) of samples in seconds
+    """
+    ordered = sorted(samples)
+    summary = {
+        'count': len(ordered),
+        'errors': errors,
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else None,
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else None,
+    }
+    for percent in (50, 95, 99):
+        value = percentile(ordered, percent)
+        summary['p%d_ms' % percent] = round(value * 1000, 3) if value is not None else None
+    if wall_time:
+        summary['throughput_rps'] = round(len(ordered) / wall_time, 2)
+    return summary
+
+
+def git_commit():
+    """
+    The commit the benchmark was run against, if it can be found
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(recorder, wall_time, parameters):
+    """
+    Build the report dict for a workload run
+    """
+    all_samples = []
+    endpoints = {}
+    for endpoint, samples in recorder.samples.items():
+        all_samples.extend(samples)
+        endpoints[endpoint] = summarize_samples(
+            samples, recorder.errors.get(endpoint, 0), wall_time)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'date': datetime.utcnow().isoformat() + 'Z',
+            'parameters': parameters,
+        },
+        'wall_time_s': round(wall_time, 3),
+        'total': summarize_samples(all_samples, sum(recorder.errors.values()), wall_time),
+        'endpoints': endpoints,
+    }
+
+
+def write_report(report, output=None):
+    """
+    Write the report as JSON to the output path, or stdout when not given
+    """
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as report_file:
+            report_file.write(text + '\n')
+    else:
+        print(text)
@@ -0,0 +1,156 @@
+"""
+Scalability benchmark of the search (?q=) and pagination (?page=, ?limit=)
+code paths of grocerylists() and all_items_of_grocerylist().
+
+For every dataset size it seeds one user owning that many lists, one of
+which holds that many items, then times prefix, infix and no-match
+searches and shallow and deep pages. Flat rows in the printed curve mean
+the code path does not grow with the size of the account.
+"""
+
+import json
+import os
+import time
+
+from bench import create_bench_app, default_database_uri
+from bench.drivers import TestClientDriver
+from bench.report import summarize_samples, git_commit
+from bench.seed import seed_dataset, seed_items, BENCH_PASSWORD
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+
+# searches are paginated so that the size of the response stays the same
+# for every dataset and only the cost of the query is measured
+PAGE_LIMIT = 20
+
+LIST_SEARCHES = (
+    ('prefix', 'apple'),
+    ('infix', 'list 1'),
+    ('no-match', 'zzqx'),
+)
+ITEM_SEARCHES = (
+    ('prefix', 'apple'),
+    ('infix', 'ple 1'),
+    ('no-match', 'zzqx'),
+)
+
+
+def scaling_cases(list_id, size):
+    """
+    The (name, path) of every measured request for a dataset of size rows
+    """
+    deep_page = max(size // PAGE_LIMIT, 1)
+    cases = []
+    for base, name, searches in (('/grocerylists/', 'lists', LIST_SEARCHES),
+                                 ('/grocerylists/%d/items/' % list_id, 'items',
+                                  ITEM_SEARCHES)):
+        for kind, term in searches:
+            cases.append(('%s search %s' % (name, kind),
+                          '%s?q=%s&page=1&limit=%d' % (base, term.replace(' ', '%20'),
+                                                        PAGE_LIMIT)))
+        cases.append(('%s page shallow' % name, '%s?page=1&limit=%d' % (base, PAGE_LIMIT)))
+        cases.append(('%s page deep' % name, '%s?page=%d&limit=%d' % (base, deep_page,
+                                                                       PAGE_LIMIT)))
+    return cases
+
+
+def measure_size(size, repeat=20, seed=0, config_name='benchmark', keep_database=False):
+    """
+    Seed a fresh database with size lists and size items and time every case
+    """
+    database_uri = default_database_uri()
+    try:
+        app = create_bench_app(database_uri, config_name)
+        with app.app_context():
+            seeded = seed_dataset(users=1, lists_per_user=size, items_per_list=0, seed=seed)
+            list_id = seeded['list_ids'][0]
+            seed_items(list_id, size, seed=seed)
+
+        driver = TestClientDriver(app)
+        status, body = driver.request(
+            'POST', '/auth/login',
+            body=json.dumps({'username': seeded['usernames'][0], 'password': BENCH_PASSWORD}))
+        if status != 200:
+            raise RuntimeError('Could not login the benchmark user')
+        headers = {'Authorization': 'Bearer ' + json.loads(body.decode())['access_token']}
+
+        results = {}
+        for name, path in scaling_cases(list_id, size):
+            # warm up the caches before measuring
+            driver.request('GET', path, headers=headers)
+            samples = []
+            errors = 0
+            for _ in range(repeat):
+                start = time.perf_counter()
+                status, _ = driver.request('GET', path, headers=headers)
+                samples.append(time.perf_counter() - start)
+                if status != 200:
+                    errors += 1
+            results[name] = summarize_samples(samples, errors)
+        return results
+    finally:
+        if not keep_database:
+            os.remove(database_uri[len('sqlite:///'):])
+
+
+def print_curve(sizes, results, stream=None):
+    """
+    Print the p50 latency of every case against the dataset sizes and how
+    many times slower the biggest dataset is than the smallest
+    """
+    case_names = list(results[sizes[0]])
+    header = '%-24s' % 'case' + ''.join('%14s' % ('%d rows' % size) for size in sizes) + \
+             '%10s' % 'growth'
+    lines = [header, '-' * len(header)]
+    for name in case_names:
+        values = [results[size][name]['p50_ms'] for size in sizes]
+        growth = values[-1] / values[0] if values[0] else float('nan')
+        lines.append('%-24s' % name + ''.join('%11.2f ms' % value for value in values) +
+                     '%9.1fx' % growth)
+    print('\n'.join(lines), file=stream)
+
+
+def plot_curve(sizes, results, path):
+    """
+    Plot the curve to an image file when matplotlib is available
+    """
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib is not installed, skipping the plot')
+        return False
+    figure, axes = plt.subplots(figsize=(9, 6))
+    for name in results[sizes[0]]:
+        axes.plot(sizes, [results[size][name]['p50_ms'] for size in sizes],
+                  marker='o', label=name)
+    axes.set_xscale('log')
+    axes.set_xlabel('rows')
+    axes.set_ylabel('p50 latency (ms)')
+    axes.legend(fontsize='small')
+    figure.savefig(path)
+    return True
+
+
+def run_scaling(sizes=DEFAULT_SIZES, repeat=20, seed=0, output=None, plot=None):
+    """
+    Measure every size, print the curve and optionally save JSON and a plot
+    """
+    sizes = sorted(sizes)
+    results = {}
+    for size in sizes:
+        results[size] = measure_size(size, repeat=repeat, seed=seed)
+    print_curve(sizes, results)
+    report = {
+        'meta': {'commit': git_commit(), 'repeat': repeat, 'seed': seed,
+                 'page_limit': PAGE_LIMIT},
+        'sizes': sizes,
+        'results': {str(size): results[size] for size in sizes},
+    }
+    if output:
+        with open(output, 'w') as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+    if plot:
+        plot_curve(sizes, results, plot)
+    return report
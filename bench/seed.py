@@ -0,0 +1,149 @@
+"""
+Bulk seeding of users, grocery lists and grocery items for the benchmarks
+"""
+
+import random
+
+from flask_bcrypt import Bcrypt
+
+from app import db, User, GroceryList, GroceryItem
+from app.models import units
+
+# words used to build item names and list titles, so that the searches
+# in the workloads have something to match
+VOCABULARY = (
+    'apple', 'banana', 'bread', 'butter', 'carrot', 'cheese', 'chicken',
+    'coffee', 'eggs', 'flour', 'garlic', 'honey', 'lemon', 'milk', 'onion',
+    'orange', 'pasta', 'pepper', 'potato', 'rice', 'salt', 'sugar', 'tea',
+    'tomato', 'yogurt',
+)
+UNITS = ('units', 'kg', 'g', 'l', 'ml', 'baskets', 'packs')
+
+BENCH_PASSWORD = 'benchmark-password'
+
+# number of rows sent to the database in one executemany
+CHUNK_SIZE = 10000
+
+
+def _next_id(model):
+    """
+    Get the next free primary key of the table of model
+    """
+    current = db.session.query(db.func.max(model.id)).scalar()
+    return (current or 0) + 1
+
+
+def _insert_in_chunks(table, rows):
+    """
+    Insert an iterable of row dicts into table, CHUNK_SIZE rows at a time
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            db.session.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+
+
+def item_name(rng, index):
+    """
+    A deterministic item name made of a vocabulary word and a number
+    """
+    return '%s %d' % (rng.choice(VOCABULARY), index)
+
+
+def item_row(rng, item_id, list_id):
+    """
+    The columns of a random item, with its quantity in the base unit
+    filled in as GroceryItem does
+    """
+    name = item_name(rng, item_id)
+    quantity = float(rng.randint(1, 20))
+    unit = rng.choice(UNITS)
+    base_unit, base_quantity = units.registry.to_base(quantity, unit)
+    return {
+        'id': item_id,
+        'name': name,
+        'quantity': quantity,
+        'unit': unit,
+        'base_unit': base_unit,
+        'base_quantity': base_quantity,
+        'grocery_list_id': list_id
+    }
+
+
+def seed_dataset(users=10, lists_per_user=5, items_per_list=20, seed=0,
+                 password=BENCH_PASSWORD):
+    """
+    Insert users, lists per user and items per list in bulk.
+    It has to be called within an app context and skips the ORM so that
+    big datasets can be created quickly. All users share one password
+    hash so that bcrypt runs only once.
+    Returns a dict with the usernames and the ids of the created rows
+    """
+    rng = random.Random(seed)
+    password_hash = Bcrypt().generate_password_hash(password).decode()
+
+    first_user_id = _next_id(User)
+    first_list_id = _next_id(GroceryList)
+    first_item_id = _next_id(GroceryItem)
+
+    user_ids = list(range(first_user_id, first_user_id + users))
+    usernames = ['bench_user_%d' % user_id for user_id in user_ids]
+    _insert_in_chunks(User.__table__, (
+        {
+            'id': user_id,
+            'username': username,
+            'name': 'Bench User %d' % user_id,
+            'email': '%s@example.com' % username,
+            'password': password_hash
+        } for user_id, username in zip(user_ids, usernames)))
+
+    list_ids = []
+
+    def list_rows():
+        list_id = first_list_id
+        for user_id in user_ids:
+            for _ in range(lists_per_user):
+                list_ids.append(list_id)
+                yield {
+                    'id': list_id,
+                    'title': '%s list %d' % (rng.choice(VOCABULARY), list_id),
+                    'description': 'benchmark list',
+                    'user_id': user_id
+                }
+                list_id += 1
+
+    _insert_in_chunks(GroceryList.__table__, list_rows())
+
+    def item_rows():
+        item_id = first_item_id
+        for list_id in list_ids:
+            for _ in range(items_per_list):
+                yield item_row(rng, item_id, list_id)
+                item_id += 1
+
+    _insert_in_chunks(GroceryItem.__table__, item_rows())
+    db.session.commit()
+
+    return {
+        'usernames': usernames,
+        'password': password,
+        'user_ids': user_ids,
+        'list_ids': list_ids,
+        'items': len(list_ids) * items_per_list
+    }
+
+
+def seed_items(list_id, count, seed=0):
+    """
+    Insert count items into the grocery list with id list_id in bulk
+    """
+    rng = random.Random(seed)
+    first_item_id = _next_id(GroceryItem)
+    _insert_in_chunks(GroceryItem.__table__, (
+        item_row(rng, item_id, list_id)
+        for item_id in range(first_item_id, first_item_id + count)))
+    db.session.commit()
@@ -0,0 +1,191 @@
+"""
+Throughput of concurrent item reads and inserts on a sqlite file with the
+default pragmas against the tuned SQLITE_* profile. Run it with
+`python manage.py bench_sqlite --help`.
+"""
+
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from app import db
+from bench import create_bench_app, default_database_uri
+from bench.drivers import GunicornServer, HttpDriver, TestClientDriver
+from bench.report import git_commit, summarize_samples, write_report
+from bench.seed import BENCH_PASSWORD, seed_dataset
+
+
+@contextmanager
+def bench_driver(app, server, database_uri, config_name, workers, tuned):
+    """
+    The driver of the test_client of app, or of gunicorn workers running
+    against the same database with the same profile
+    """
+    if server == 'test_client':
+        yield TestClientDriver(app)
+    elif server == 'gunicorn':
+        environ = {'SQLITE_PROFILE_ENABLED': 'true' if tuned else 'false'}
+        with GunicornServer(database_uri, config_name, workers, environ=environ) as gunicorn:
+            yield HttpDriver(gunicorn.base_url)
+    else:
+        raise ValueError('server should be test_client or gunicorn')
+
+
+def run_read_write(driver, username, list_id, requests, readers, writers):
+    """
+    Run readers threads listing the items of the list while writers
+    threads insert into it, and summarize both
+    """
+    status, body = driver.request(
+        'POST', '/auth/login', body=json.dumps({'username': username, 'password': BENCH_PASSWORD}))
+    if status != 200:
+        raise RuntimeError('Could not login the benchmark user')
+    headers = {'Authorization': 'Bearer ' + json.loads(body.decode())['access_token']}
+    path = '/grocerylists/%d/items/' % list_id
+
+    samples = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+
+    def run(kind, worker):
+        worker_samples = []
+        worker_errors = 0
+        for index in range(requests):
+            start = time.perf_counter()
+            if kind == 'write':
+                data = json.dumps({'name': 'item %d-%d' % (worker, index), 'quantity': 1})
+                status, _ = driver.request('POST', path, headers=headers, body=data)
+                failed = status != 201
+            else:
+                status, _ = driver.request('GET', path, headers=headers)
+                failed = status != 200
+            worker_samples.append(time.perf_counter() - start)
+            if failed:
+                worker_errors += 1
+        with lock:
+            samples[kind].extend(worker_samples)
+            errors[kind] += worker_errors
+
+    threads = [threading.Thread(target=run, args=('read', worker)) for worker in range(readers)]
+    threads += [threading.Thread(target=run, args=('write', worker)) for worker in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start
+
+    return {
+        'wall_time_s': round(wall_time, 3),
+        'total': summarize_samples(samples['read'] + samples['write'],
+                                   errors['read'] + errors['write'], wall_time),
+        'read': summarize_samples(samples['read'], errors['read'], wall_time),
+        'write': summarize_samples(samples['write'], errors['write'], wall_time),
+    }
+
+
+def run_engine_read_write(app, list_id, requests, readers, writers):
+    """
+    The same reads and writes sent straight to the engine of app, which
+    leaves out the cost of the requests and shows the time spent in sqlite
+    """
+    from app import GroceryItem
+    items = GroceryItem.__table__
+    samples = {'read': [], 'write': []}
+    lock = threading.Lock()
+
+    def run(kind, worker):
+        worker_samples = []
+        with app.app_context():
+            engine = db.engine
+            for index in range(requests):
+                start = time.perf_counter()
+                if kind == 'write':
+                    with engine.begin() as connection:
+                        connection.execute(items.insert().values(
+                            name='item %d-%d' % (worker, index), quantity=1, unit='units',
+                            grocery_list_id=list_id))
+                else:
+                    with engine.connect() as connection:
+                        connection.execute(items.select().where(
+                            items.c.grocery_list_id == list_id)).fetchall()
+                worker_samples.append(time.perf_counter() - start)
+        with lock:
+            samples[kind].extend(worker_samples)
+
+    threads = [threading.Thread(target=run, args=('read', worker)) for worker in range(readers)]
+    threads += [threading.Thread(target=run, args=('write', worker)) for worker in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start
+    return {
+        'wall_time_s': round(wall_time, 3),
+        'read': summarize_samples(samples['read'], 0, wall_time),
+        'write': summarize_samples(samples['write'], 0, wall_time),
+    }
+
+
+def measure_read_write(tuned, requests=200, readers=6, writers=2, items=50,
+                       server='gunicorn', workers=4, config_name='benchmark'):
+    """
+    Measure the reads and writes on a fresh sqlite file with the tuned
+    profile, or with the sqlite defaults when tuned is False
+    """
+    database_uri = default_database_uri()
+    path = database_uri[len('sqlite:///'):]
+    try:
+        app = create_bench_app(database_uri, config_name,
+                               overrides={'SQLITE_PROFILE_ENABLED': tuned})
+        with app.app_context():
+            seeded = seed_dataset(users=1, lists_per_user=1, items_per_list=items)
+            # the gunicorn workers open their own connections
+            db.session.remove()
+            db.engine.dispose()
+        with bench_driver(app, server, database_uri, config_name, workers, tuned) as driver:
+            result = run_read_write(driver, seeded['usernames'][0], seeded['list_ids'][0],
+                                    requests, readers, writers)
+        result['engine'] = run_engine_read_write(app, seeded['list_ids'][0], requests,
+                                                 readers, writers)
+        with app.app_context():
+            result['journal_mode'] = db.engine.execute('PRAGMA journal_mode').scalar()
+            db.engine.dispose()
+        return result
+    finally:
+        # WAL mode leaves the -wal and -shm files next to the database
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def run_sqlite_benchmark(requests=200, readers=6, writers=2, items=50, server='gunicorn',
+                         workers=4, output=None):
+    """
+    Measure the default and the tuned profile and write the JSON report
+    """
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'date': datetime.utcnow().isoformat() + 'Z',
+            'parameters': {'requests_per_worker': requests, 'readers': readers,
+                           'writers': writers, 'items_per_list': items, 'server': server,
+                           'workers': workers if server == 'gunicorn' else None},
+        },
+        'default': measure_read_write(False, requests, readers, writers, items, server, workers),
+        'tuned': measure_read_write(True, requests, readers, writers, items, server, workers),
+    }
+    default = report['default']['total'].get('throughput_rps')
+    tuned = report['tuned']['total'].get('throughput_rps')
+    if default and tuned:
+        report['speedup'] = round(tuned / default, 2)
+    write_report(report, output)
+    return report
@@ -0,0 +1,226 @@
+"""
+The mixed workload driven against the app by the benchmarks
+"""
+
+import json
+import random
+import threading
+import time
+
+from bench.seed import VOCABULARY, UNITS
+
+# relative weight of each operation in the default mix
+DEFAULT_MIX = {
+    'browse_lists': 25,
+    'browse_items': 25,
+    'search_lists': 10,
+    'search_items': 10,
+    'create_item': 10,
+    'update_item': 8,
+    'delete_item': 5,
+    'login_logout': 7,
+}
+
+# operations that can be weighted in a mix, refresh is not in the default one
+OPERATIONS = tuple(DEFAULT_MIX) + ('refresh',)
+
+
+def parse_mix(mix_string):
+    """
+    Parse a mix like 'browse_lists=3,search_items=1' into a dict
+    """
+    if not mix_string:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in mix_string.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError('Unknown operation %s in the workload mix' % name)
+        mix[name] = int(weight or 1)
+    return mix
+
+
+class Recorder(object):
+    """
+    Collects the latency samples and errors of each endpoint
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, endpoint, elapsed, ok=True):
+        self.samples.setdefault(endpoint, []).append(elapsed)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def merge(self, other):
+        for endpoint, samples in other.samples.items():
+            self.samples.setdefault(endpoint, []).extend(samples)
+        for endpoint, count in other.errors.items():
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + count
+
+
+class VirtualUser(object):
+    """
+    One simulated client with its own session, randomness and recorder
+    """
+
+    def __init__(self, driver, username, password, rng):
+        self.driver = driver
+        self.username = username
+        self.password = password
+        self.rng = rng
+        self.recorder = Recorder()
+        self.token = None
+        self.refresh_token = None
+        self.list_ids = []
+        self.created_items = []
+
+    def call(self, endpoint, method, path, body=None, token=None,
+             expected=(200,), record=True):
+        """
+        Send one request and record how long it took.
+        Returns (status_code, parsed json) or (None, None) on failure
+        """
+        headers = {'Content-Type': 'application/json'}
+        token = token or self.token
+        if token:
+            headers['Authorization'] = 'Bearer ' + token
+        if body is not None:
+            body = json.dumps(body)
+        start = time.perf_counter()
+        try:
+            status, data = self.driver.request(method, path, headers=headers, body=body)
+        except Exception:
+            if record:
+                self.recorder.record(endpoint, time.perf_counter() - start, ok=False)
+            return None, None
+        elapsed = time.perf_counter() - start
+        if record:
+            self.recorder.record(endpoint, elapsed, ok=status in expected)
+        try:
+            return status, json.loads(data.decode())
+        except ValueError:
+            return status, None
+
+    def login(self, record=False):
+        status, data = self.call('POST /auth/login', 'POST', '/auth/login',
+                                 body={'username': self.username,
+                                       'password': self.password},
+                                 token='', record=record)
+        if status != 200:
+            raise RuntimeError('Could not login %s: %s' % (self.username, data))
+        self.refresh_token = data.get('refresh_token')
+        return data['access_token']
+
+    def setup(self):
+        """
+        Login and discover the lists this user can work with
+        """
+        self.token = self.login()
+        status, data = self.call('GET /grocerylists/', 'GET', '/grocerylists/',
+                                 record=False)
+        if status != 200 or not data:
+            raise RuntimeError('%s has no grocery lists to work with' % self.username)
+        self.list_ids = [grocery_list['id'] for grocery_list in data]
+
+    def browse_lists(self):
+        page = self.rng.randint(1, 3)
+        self.call('GET /grocerylists/?page=', 'GET',
+                  '/grocerylists/?page=%d&limit=10' % page)
+
+    def browse_items(self):
+        list_id = self.rng.choice(self.list_ids)
+        page = self.rng.randint(1, 3)
+        self.call('GET /grocerylists/<id>/items/?page=', 'GET',
+                  '/grocerylists/%d/items/?page=%d&limit=10' % (list_id, page))
+
+    def search_lists(self):
+        self.call('GET /grocerylists/?q=', 'GET',
+                  '/grocerylists/?q=%s' % self.rng.choice(VOCABULARY))
+
+    def search_items(self):
+        list_id = self.rng.choice(self.list_ids)
+        self.call('GET /grocerylists/<id>/items/?q=', 'GET',
+                  '/grocerylists/%d/items/?q=%s' % (list_id, self.rng.choice(VOCABULARY)))
+
+    def create_item(self):
+        list_id = self.rng.choice(self.list_ids)
+        status, data = self.call(
+            'POST /grocerylists/<id>/items/', 'POST', '/grocerylists/%d/items/' % list_id,
+            body={'name': '%s bench' % self.rng.choice(VOCABULARY),
+                  'quantity': self.rng.randint(1, 20),
+                  'unit': self.rng.choice(UNITS)},
+            expected=(201,))
+        if status == 201 and data:
+            self.created_items.append((list_id, data['id']))
+
+    def update_item(self):
+        if not self.created_items:
+            return self.create_item()
+        list_id, item_id = self.rng.choice(self.created_items)
+        self.call('PUT /grocerylists/<id>/items/<item_id>', 'PUT',
+                  '/grocerylists/%d/items/%d' % (list_id, item_id),
+                  body={'quantity': self.rng.randint(1, 20)})
+
+    def delete_item(self):
+        if not self.created_items:
+            return self.create_item()
+        list_id, item_id = self.created_items.pop(self.rng.randrange(len(self.created_items)))
+        self.call('DELETE /grocerylists/<id>/items/<item_id>', 'DELETE',
+                  '/grocerylists/%d/items/%d' % (list_id, item_id))
+
+    def login_logout(self):
+        token = self.login(record=True)
+        self.call('POST /auth/logout', 'POST', '/auth/logout', token=token)
+
+    def refresh(self):
+        """
+        Renew the access token like a client whose token expired
+        """
+        status, data = self.call('POST /auth/refresh', 'POST', '/auth/refresh',
+                                 body={'refresh_token': self.refresh_token}, token='')
+        if status == 200 and data:
+            self.token = data['access_token']
+            self.refresh_token = data['refresh_token']
+
+    def run(self, operations, count):
+        """
+        Run count operations picked from the weighted operations
+        """
+        names = sorted(operations)
+        weights = [operations[name] for name in names]
+        for name in self.rng.choices(names, weights=weights, k=count):
+            getattr(self, name)()
+
+
+def run_workload(driver, accounts, requests_per_worker=200, concurrency=1,
+                 mix=None, seed=0):
+    """
+    Drive the mix with concurrency virtual users spread over accounts.
+    Returns the merged Recorder and the wall time in seconds
+    """
+    mix = mix or dict(DEFAULT_MIX)
+    virtual_users = []
+    for index in range(concurrency):
+        username, password = accounts[index % len(accounts)]
+        virtual_user = VirtualUser(driver, username, password,
+                                   random.Random('%s-%d' % (seed, index)))
+        virtual_user.setup()
+        virtual_users.append(virtual_user)
+
+    threads = [threading.Thread(target=virtual_user.run, args=(mix, requests_per_worker))
+               for virtual_user in virtual_users]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start
+
+    recorder = Recorder()
+    for virtual_user in virtual_users:
+        recorder.merge(virtual_user.recorder)
+    return recorder, wall_time
@@ -0,0 +1,9 @@
+"""
+WSGI entry point used when the benchmarks run against gunicorn
+"""
+
+import os
+
+from app import create_app
+
+app = create_app(os.getenv('APP_SETTINGS') or 'benchmark')
@@ -3,6 +3,7 @@ This is where the configurations of the app are found \
 """
 
 import os
+import tempfile
 
 
 class Config(object):
@@ -15,6 +16,97 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = os.getenv('RIDECO_DATABASE_URL')
     LISTS_PER_PAGE = os.getenv('LISTS_PER_PAGE') or 6
     ITEMS_PER_PAGE = os.getenv('ITEMS_PER_PAGE') or 10
+    # rows saved per transaction by the bulk import
+    IMPORT_BATCH_SIZE = os.getenv('IMPORT_BATCH_SIZE') or 500
+    IMPORT_MAX_REPORTED_ERRORS = os.getenv('IMPORT_MAX_REPORTED_ERRORS') or 100
+    # rows fetched at a time by the account export
+    EXPORT_YIELD_PER = os.getenv('EXPORT_YIELD_PER') or 1000
+    # most change log entries returned by one sync
+    SYNC_PAGE_SIZE = os.getenv('SYNC_PAGE_SIZE') or 500
+    # seconds a change log entry has to be old before the sync watermark moves past it,
+    # longer than any write transaction so that no older entry can still be uncommitted
+    SYNC_WATERMARK_LAG = os.getenv('SYNC_WATERMARK_LAG') or 30
+    # compression of the responses, bodies smaller than COMPRESS_MIN_SIZE bytes are not compressed
+    COMPRESS_ENABLED = (os.getenv('COMPRESS_ENABLED') or 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = os.getenv('COMPRESS_MIN_SIZE') or 500
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 5
+    # background hard deletion of the tombstoned lists and items
+    PURGE_WORKER_ENABLED = (os.getenv('PURGE_WORKER_ENABLED') or 'false').lower() == 'true'
+    PURGE_INTERVAL = os.getenv('PURGE_INTERVAL') or 60
+    PURGE_QUIET_SECONDS = os.getenv('PURGE_QUIET_SECONDS') or 5
+    PURGE_BATCH_SIZE = os.getenv('PURGE_BATCH_SIZE') or 500
+    PURGE_MAX_BATCHES = os.getenv('PURGE_MAX_BATCHES') or 10
+    PURGE_RETENTION_SECONDS = os.getenv('PURGE_RETENTION_SECONDS') or 0
+    # users whose item names are kept in memory for the suggestions, rebuilt after
+    # SUGGEST_INDEX_MAX_AGE seconds, and most suggestions returned
+    SUGGEST_MAX_USERS = os.getenv('SUGGEST_MAX_USERS') or 1000
+    SUGGEST_INDEX_MAX_AGE = os.getenv('SUGGEST_INDEX_MAX_AGE') or 60
+    SUGGEST_LIMIT = os.getenv('SUGGEST_LIMIT') or 10
+    # typo-tolerant search, the candidate indexes of at most SEARCH_MAX_USERS users are
+    # kept in memory and rebuilt after SEARCH_INDEX_MAX_AGE seconds
+    SEARCH_MAX_USERS = os.getenv('SEARCH_MAX_USERS') or 1000
+    SEARCH_INDEX_MAX_AGE = os.getenv('SEARCH_INDEX_MAX_AGE') or 60
+    SEARCH_LIMIT = os.getenv('SEARCH_LIMIT') or 20
+    SEARCH_MIN_SIMILARITY = os.getenv('SEARCH_MIN_SIMILARITY') or 0.3
+    # cost factor of the password hashes, every step doubles the hashing time
+    BCRYPT_LOG_ROUNDS = os.getenv('BCRYPT_LOG_ROUNDS') or 12
+    # pragmas set on every new sqlite connection, negative cache sizes are in KiB
+    SQLITE_PROFILE_ENABLED = (os.getenv('SQLITE_PROFILE_ENABLED') or 'true').lower() == 'true'
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE') or 'WAL'
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_BUSY_TIMEOUT = os.getenv('SQLITE_BUSY_TIMEOUT') or 5000
+    SQLITE_CACHE_SIZE = os.getenv('SQLITE_CACHE_SIZE') or -20000
+    SQLITE_MMAP_SIZE = os.getenv('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024
+    # databases the grocery lists and items are sharded across by user, none by default
+    SHARD_DATABASE_URLS = [url for url in (os.getenv('SHARD_DATABASE_URLS') or '').split(',') if url]
+    # item inserts committed together, at most every GROUP_COMMIT_MAX_DELAY_MS
+    # milliseconds or every GROUP_COMMIT_MAX_BATCH inserts
+    GROUP_COMMIT_ENABLED = (os.getenv('GROUP_COMMIT_ENABLED') or 'false').lower() == 'true'
+    GROUP_COMMIT_MAX_DELAY_MS = os.getenv('GROUP_COMMIT_MAX_DELAY_MS') or 5
+    GROUP_COMMIT_MAX_BATCH = os.getenv('GROUP_COMMIT_MAX_BATCH') or 100
+    GROUP_COMMIT_TIMEOUT = os.getenv('GROUP_COMMIT_TIMEOUT') or 5
+    # statements of SLOW_QUERY_THRESHOLD_MS or more are logged with their query plan, the
+    # SLOW_QUERY_MAX_ENTRIES slowest of each process are written to SLOW_QUERY_DIR
+    SLOW_QUERY_ENABLED = (os.getenv('SLOW_QUERY_ENABLED') or 'false').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = os.getenv('SLOW_QUERY_THRESHOLD_MS') or 100
+    SLOW_QUERY_MAX_ENTRIES = os.getenv('SLOW_QUERY_MAX_ENTRIES') or 50
+    SLOW_QUERY_EXPLAIN = (os.getenv('SLOW_QUERY_EXPLAIN') or 'true').lower() == 'true'
+    SLOW_QUERY_DIR = os.getenv('SLOW_QUERY_DIR') or os.path.join(tempfile.gettempdir(),
+                                                                'rideco-slow-queries')
+    # a share TRACE_SAMPLE_RATE of the requests are traced and appended to TRACE_FILE
+    TRACING_ENABLED = (os.getenv('TRACING_ENABLED') or 'false').lower() == 'true'
+    TRACE_SAMPLE_RATE = os.getenv('TRACE_SAMPLE_RATE') or 0.01
+    TRACE_FILE = os.getenv('TRACE_FILE') or os.path.join(tempfile.gettempdir(),
+                                                        'rideco-traces.jsonl')
+    # a share MEMORY_PROFILE_SAMPLE_RATE of the requests run under tracemalloc, and the
+    # allocations of each route are written to MEMORY_PROFILE_DIR/<pid>.json
+    MEMORY_PROFILE_ENABLED = (os.getenv('MEMORY_PROFILE_ENABLED') or 'false').lower() == 'true'
+    MEMORY_PROFILE_SAMPLE_RATE = os.getenv('MEMORY_PROFILE_SAMPLE_RATE') or 0.01
+    MEMORY_PROFILE_DIR = os.getenv('MEMORY_PROFILE_DIR') or os.path.join(tempfile.gettempdir(),
+                                                                        'rideco-memory')
+    MEMORY_PROFILE_TOP = os.getenv('MEMORY_PROFILE_TOP') or 10
+    MEMORY_PROFILE_FRAMES = os.getenv('MEMORY_PROFILE_FRAMES') or 1
+    # seconds a refresh token can be exchanged for a new access token
+    REFRESH_TOKEN_TTL = os.getenv('REFRESH_TOKEN_TTL') or 30 * 24 * 60 * 60
+    # stored responses of the requests sent with an Idempotency-Key,
+    # kept for IDEMPOTENCY_TTL seconds and at most IDEMPOTENCY_MAX_KEYS per user
+    IDEMPOTENCY_TTL = os.getenv('IDEMPOTENCY_TTL') or 24 * 60 * 60
+    IDEMPOTENCY_MAX_KEYS = os.getenv('IDEMPOTENCY_MAX_KEYS') or 1000
+    # seconds a request holds its key, after which a retry takes it over. Longer than
+    # the worker timeout, so that the claim of a killed worker does not block the key
+    IDEMPOTENCY_LEASE = os.getenv('IDEMPOTENCY_LEASE') or 60
+    # token-bucket rate limits as (bucket size, tokens refilled per second)
+    RATELIMIT_ENABLED = (os.getenv('RATELIMIT_ENABLED') or 'true').lower() == 'true'
+    RATELIMIT_BACKEND = os.getenv('RATELIMIT_BACKEND') or 'memory'
+    # proxies in front of the app whose X-Forwarded-For entries are trusted for the client IP
+    RATELIMIT_TRUSTED_PROXIES = os.getenv('RATELIMIT_TRUSTED_PROXIES') or 0
+    RATELIMIT_LIMITS = {
+        'auth': (10, 10 / 60.0),
+        'search': (20, 5.0),
+        'write': (60, 20.0),
+        'read': (120, 40.0),
+    }
 
 
 class DevelopmentConfig(Config):
@@ -24,6 +116,8 @@ class DevelopmentConfig(Config):
     DEBUG = True
     SECRET = "development secret"
     SQLALCHEMY_DATABASE_URI = os.getenv('RIDECO_DATABASE_URL')
+    COMPRESS_GZIP_LEVEL = 1
+    COMPRESS_BROTLI_QUALITY = 1
 
 
 class TestingConfig(Config):
@@ -31,6 +125,23 @@ class TestingConfig(Config):
     SECRET = "development secret"
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.getenv('RIDECO_DATABASE_URL')
+    RATELIMIT_ENABLED = False
+    # the test databases are thrown away, so durability is not needed
+    SQLITE_SYNCHRONOUS = 'OFF'
+    # the lowest cost bcrypt accepts, the test passwords need no protection
+    BCRYPT_LOG_ROUNDS = 4
+
+
+class BenchmarkConfig(Config):
+    """
+    The configuration used by the load-test harness in bench/
+    """
+    DEBUG = False
+    SECRET = os.getenv('SECRET') or "benchmark secret"
+    SQLALCHEMY_DATABASE_URI = os.getenv('BENCH_DATABASE_URL') or os.getenv('RIDECO_DATABASE_URL')
+    # the limiter still runs so that its overhead is measured, but never rejects
+    RATELIMIT_LIMITS = dict((route, (10 ** 9, 10 ** 9))
+                            for route in ('auth', 'search', 'write', 'read'))
 
 
 class StagingConfig(Config):
@@ -40,6 +151,8 @@ class StagingConfig(Config):
 class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
+    # the Heroku router
+    RATELIMIT_TRUSTED_PROXIES = os.getenv('RATELIMIT_TRUSTED_PROXIES') or 1
 
 
 APP_CONFIG = {
@@ -47,4 +160,5 @@ APP_CONFIG = {
     'production': ProductionConfig,
     'testing': TestingConfig,
     'staging': StagingConfig,
+    'benchmark': BenchmarkConfig,
 }
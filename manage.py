@@ -4,7 +4,7 @@ Script to help run migrations every time the models are changed
 
 import os
 import unittest
-from flask_script import Manager
+from flask_script import Command, Manager, Option
 from flask_migrate import Migrate, MigrateCommand
 from app import db, create_app
 
@@ -26,8 +26,11 @@ manager.add_command('db', MigrateCommand)
 
 
 # create test command
-@manager.command
-def test(coverage=False):
+@manager.option('--coverage', dest='coverage', action='store_true', default=False,
+                help='measure the coverage of app/')
+@manager.option('--parallel', dest='parallel', type=int, default=1,
+                help='number of processes the test classes are spread over')
+def test(coverage=False, parallel=1):
     """
     Run the tests
     """
@@ -36,13 +39,20 @@ def test(coverage=False):
         import sys
         os.environ['FLASK_COVERAGE'] = '1'
         os.execvp(sys.executable, [sys.executable] + sys.argv)
-    # load the tests
-    tests = unittest.TestLoader().discover('./test', pattern='test*.py')
-    # run the tests
-    result = unittest.TextTestRunner(verbosity=2).run(tests)
+    if parallel > 1:
+        from test.runner import run_parallel
+        result = run_parallel(parallel, with_coverage=bool(COV))
+    else:
+        # load the tests
+        tests = unittest.TestLoader().discover('./test', pattern='test*.py')
+        # run the tests
+        result = unittest.TextTestRunner(verbosity=2).run(tests)
     # save coverage report
     if COV:
         COV.stop()
+        if parallel > 1:
+            # merge the data files saved by the workers
+            COV.combine()
         COV.save()
 
     if result.wasSuccessful():
@@ -50,5 +60,242 @@ def test(coverage=False):
     return 1
 
 
+# create purge command
+@manager.option('--batch-size', dest='batch_size', type=int, default=500,
+                help='rows deleted per transaction')
+@manager.option('--retention', dest='retention', type=int, default=0,
+                help='only purge rows deleted more than this many seconds ago')
+def purge(batch_size, retention):
+    """
+    Hard delete the tombstoned grocery lists and items in batches
+    """
+    from datetime import timedelta
+    from app.purge import purge_tombstones
+    purged = purge_tombstones(batch_size=batch_size, retention=timedelta(seconds=retention))
+    print('Purged %(lists)d grocery lists and %(items)d grocery items' % purged)
+
+
+# create rebalance command
+@manager.option('--user', dest='user_id', type=int, required=True, help='id of the user to move')
+@manager.option('--shard', dest='shard', type=int, required=True, help='shard to move the user to')
+@manager.option('--settle', dest='settle', type=float, default=30,
+                help='seconds given to the running requests of the user, the worker timeout')
+def rebalance(user_id, shard, settle):
+    """
+    Move the grocery lists and items of a user to another shard. The
+    writes of the user get a 503 until the move is done
+    """
+    from app import User
+    from app.database import rebalance_user
+    user = User.query.get(user_id)
+    if user is None:
+        print('There is no user %d' % user_id)
+        return 1
+    moved = rebalance_user(db, user, shard, settle=settle)
+    print('Moved %d rows of user %d to shard %d' % (moved, user_id, shard))
+
+
+# create users import command
+class ImportUsersCommand(Command):
+    """
+    Create the users of a CSV file
+    """
+    option_list = (
+        Option('path', help='CSV file with username, name, email and password columns'),
+        Option('--batch-size', dest='batch_size', type=int, default=500,
+               help='users created per transaction'),
+        Option('--workers', dest='workers', type=int, default=None,
+               help='processes hashing the passwords, one per CPU by default'),
+    )
+
+    def run(self, path, batch_size, workers):
+        from app.provisioning import UserImporter, parse_users_csv
+        importer = UserImporter(batch_size=batch_size, workers=workers,
+                                rounds=int(app.config['BCRYPT_LOG_ROUNDS']))
+        with open(path, newline='') as users_file:
+            for event in importer.run(parse_users_csv(users_file)):
+                if event['event'] == 'error':
+                    print('Row %(row)d: %(message)s' % event)
+                elif event['event'] == 'progress':
+                    print('Imported %(imported)d of %(rows)d rows' % event)
+                else:
+                    print('Imported %(imported)d users, %(errors)d rows failed, '
+                          'in %(seconds).1fs (%(users_per_second).1f users/s)' % event)
+        return 1 if importer.totals['errors'] else 0
+
+
+users_manager = Manager(usage='Manage the user accounts')
+users_manager.add_command('import', ImportUsersCommand())
+manager.add_command('users', users_manager)
+
+
+# create slow_queries command
+@manager.option('--limit', dest='limit', type=int, default=20, help='statements shown')
+@manager.option('--clear', dest='clear', action='store_true', default=False,
+                help='delete the logged statements')
+def slow_queries(limit, clear):
+    """
+    Show the slowest statements logged by the app processes
+    """
+    import json
+    import shutil
+    from app.slowquery import read_slow_queries
+    directory = app.config['SLOW_QUERY_DIR']
+    if clear:
+        shutil.rmtree(directory, ignore_errors=True)
+        print('Cleared the slow query log')
+        return
+    entries = read_slow_queries(directory, limit=limit)
+    if not entries:
+        print('No slow query was logged in %s' % directory)
+    for entry in entries:
+        print('%.1fms  %s  (pid %d, %s)' % (entry['duration_ms'], entry['route'] or '-',
+                                           entry['pid'], entry['date']))
+        print('    %s' % entry['statement'])
+        print('    parameters: %s' % json.dumps(entry['parameters']))
+        if isinstance(entry['plan'], list):
+            for row in entry['plan']:
+                print('    plan: %s' % ' | '.join(row))
+        elif entry['plan']:
+            print('    plan: %s' % entry['plan'])
+
+# create traces command
+@manager.option('--file', dest='path', default=None, help='JSON lines file of the traces')
+@manager.option('--route', dest='route', default=None, help='only show this route')
+def traces(path, route):
+    """
+    Show where the time of the traced requests goes, per route
+    """
+    from app.tracing import read_traces, summarize_traces
+    path = path or app.config['TRACE_FILE']
+    summary = summarize_traces(read_traces(path))
+    if not summary:
+        print('No trace was found in %s' % path)
+    for name in sorted(summary, key=lambda name: -summary[name]['requests']):
+        if route and name != route:
+            continue
+        times = summary[name]
+        print('%s  %d requests, %.2fms mean' % (name, times['requests'], times['mean_ms']))
+        for span_name, span_times in sorted(times['spans'].items(),
+                                            key=lambda item: -item[1]['mean_ms']):
+            print('    %-24s %8.2fms %6.1f%%' % (span_name, span_times['mean_ms'],
+                                                span_times['share'] * 100))
+
+# create normalize_units command
+@manager.option('--batch-size', dest='batch_size', type=int, default=1000,
+                help='items updated per transaction')
+def normalize_units(batch_size):
+    """
+    Fill in the base unit and quantity of the items saved without them
+    """
+    from app import GroceryItem
+    updated = GroceryItem.backfill_base_units(batch_size=batch_size)
+    print('Normalized the units of %d grocery items' % updated)
+
+
+# create bench command
+@manager.option('--users', dest='users', type=int, default=10, help='users to seed')
+@manager.option('--lists', dest='lists', type=int, default=5, help='lists per user')
+@manager.option('--items', dest='items', type=int, default=20, help='items per list')
+@manager.option('--requests', dest='requests', type=int, default=200,
+                help='requests sent by each concurrent client')
+@manager.option('--concurrency', dest='concurrency', type=int, default=1,
+                help='number of concurrent clients')
+@manager.option('--server', dest='server', default='test_client',
+                help='test_client, gunicorn or url')
+@manager.option('--url', dest='url', default=None, help='base url when server is url')
+@manager.option('--workers', dest='workers', type=int, default=2, help='gunicorn workers')
+@manager.option('--mix', dest='mix', default=None,
+                help='weighted operations e.g. browse_lists=3,search_items=1')
+@manager.option('--seed', dest='seed', type=int, default=0, help='random seed')
+@manager.option('--database', dest='database', default=None,
+                help='database uri, a temporary sqlite file by default')
+@manager.option('--output', dest='output', default=None,
+                help='file for the JSON report, stdout by default')
+def bench(users, lists, items, requests, concurrency, server, url, workers, mix,
+          seed, database, output):
+    """
+    Run the load-test harness and report latency percentiles as JSON
+    """
+    from bench import run_benchmark
+    run_benchmark(users=users, lists=lists, items=items, requests=requests,
+                  concurrency=concurrency, server=server, url=url, workers=workers,
+                  mix=mix, seed=seed, database_uri=database, output=output)
+
+
+# create bench_scaling command
+@manager.option('--sizes', dest='sizes', default='10000,100000,1000000',
+                help='comma separated dataset sizes in rows')
+@manager.option('--repeat', dest='repeat', type=int, default=20,
+                help='timed requests per case and size')
+@manager.option('--seed', dest='seed', type=int, default=0, help='random seed')
+@manager.option('--output', dest='output', default=None, help='file for the JSON report')
+@manager.option('--plot', dest='plot', default=None,
+                help='image file for the curve, needs matplotlib')
+def bench_scaling(sizes, repeat, seed, output, plot):
+    """
+    Measure how search and pagination latency grows with the dataset size
+    """
+    from bench.scaling import run_scaling
+    run_scaling(sizes=[int(size) for size in sizes.split(',')], repeat=repeat,
+                seed=seed, output=output, plot=plot)
+
+
+# create bench_group_commit command
+@manager.option('--requests', dest='requests', type=int, default=200,
+                help='items inserted by each thread')
+@manager.option('--concurrency', dest='concurrency', type=int, default=8,
+                help='number of inserting threads')
+@manager.option('--max-delay', dest='max_delay', type=float, default=5,
+                help='longest wait in ms before a batch is committed')
+@manager.option('--max-batch', dest='max_batch', type=int, default=100,
+                help='most inserts committed in one transaction')
+@manager.option('--output', dest='output', default=None,
+                help='file for the JSON report, stdout by default')
+def bench_group_commit(requests, concurrency, max_delay, max_batch, output):
+    """
+    Compare the item insert throughput of group commit with a commit per request
+    """
+    from bench.groupcommit import run_group_commit_benchmark
+    run_group_commit_benchmark(requests=requests, concurrency=concurrency,
+                               max_delay_ms=max_delay, max_batch=max_batch, output=output)
+
+
+# create bench_sqlite command
+@manager.option('--requests', dest='requests', type=int, default=200,
+                help='requests sent by each thread')
+@manager.option('--readers', dest='readers', type=int, default=6,
+                help='number of threads listing items')
+@manager.option('--writers', dest='writers', type=int, default=2,
+                help='number of threads inserting items')
+@manager.option('--items', dest='items', type=int, default=50,
+                help='items seeded in the list')
+@manager.option('--server', dest='server', default='gunicorn',
+                help='gunicorn or test_client')
+@manager.option('--workers', dest='workers', type=int, default=4, help='gunicorn workers')
+@manager.option('--output', dest='output', default=None,
+                help='file for the JSON report, stdout by default')
+def bench_sqlite(requests, readers, writers, items, server, workers, output):
+    """
+    Compare concurrent reads and writes with the default and the tuned sqlite pragmas
+    """
+    from bench.sqlite import run_sqlite_benchmark
+    run_sqlite_benchmark(requests=requests, readers=readers, writers=writers, items=items,
+                         server=server, workers=workers, output=output)
+
+
+# create bench_auth command
+@manager.option('--requests', dest='requests', type=int, default=50,
+                help='logins and refreshes measured')
+@manager.option('--output', dest='output', default=None,
+                help='file for the JSON report, stdout by default')
+def bench_auth(requests, output):
+    """
+    Compare the CPU cost of renewing access tokens by login and by refresh
+    """
+    from bench.auth import run_auth_benchmark
+    run_auth_benchmark(requests=requests, output=output)
+
+
 if __name__ == '__main__':
     manager.run()
@@ -1,13 +1,106 @@
 """
 This file holds all the functions common in the tests files
+
+By default every test runs in a transaction of a shared-cache in-memory
+sqlite database whose schema is created once per process. The
+transaction is rolled back at the end of the test, and the commits of
+the app only release a SAVEPOINT inside it. Test classes which need a
+database of their own (files, other threads) set transactional = False
+to get a fresh schema per test instead.
 """
+import os
+import sqlite3
 import unittest
 import json
-from app.models.shopping import User, GroceryList, GroceryItem, BlacklistToken
+from flask import _app_ctx_stack
+from flask_bcrypt import Bcrypt
+from sqlalchemy import event, orm
+from app import User, GroceryList, GroceryItem, BlacklistToken
 from app import create_app, db
+from app.database import RoutingSession
+
+# named per process so that parallel test processes do not share it
+SHARED_DATABASE_NAME = 'file:rideco-test-%d?mode=memory&cache=shared'
+
+# the connection keeping the shared database of this process alive
+_shared_database = {}
+
+# password hashes of the user factory, computed once per process
+_password_hashes = {}
+
+
+def shared_database_uri():
+    """
+    The uri of the in-memory database of this process, created with its
+    schema on the first call
+    """
+    pid = os.getpid()
+    name = SHARED_DATABASE_NAME % pid
+    if _shared_database.get('pid') != pid:
+        _shared_database.update(pid=pid, connection=sqlite3.connect(name, uri=True),
+                                schema=False)
+    return 'sqlite:///%s&uri=true' % name
+
+
+def password_hash(password):
+    """
+    The bcrypt hash of password with the lowest cost, computed once
+    """
+    if password not in _password_hashes:
+        _password_hashes[password] = Bcrypt().generate_password_hash(password, 4).decode()
+    return _password_hashes[password]
+
+
+class SavepointSession(RoutingSession):
+    """
+    Session whose transactions are SAVEPOINTs of the transaction of the
+    test, rolled back when the session is closed without a commit
+    """
+
+    def __init__(self, *args, **kwargs):
+        RoutingSession.__init__(self, *args, **kwargs)
+        self.begin_nested()
+
+    def close(self):
+        self.info['closing'] = True
+        while self.transaction is not None and self.transaction.nested:
+            self.rollback()
+        RoutingSession.close(self)
+
+
+@event.listens_for(SavepointSession, 'after_transaction_end')
+def restart_savepoint(session, transaction):
+    """
+    Start the next SAVEPOINT when the app commits or rolls back
+    """
+    if transaction.nested and not transaction._parent.nested \
+            and not session.info.get('closing'):
+        session.expire_all()
+        session.begin_nested()
+
+
+def disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+def emit_begin(connection):
+    connection.execute('BEGIN')
+
+
+def begin_on_sqlite(engine):
+    """
+    Let SQLAlchemy emit BEGIN itself, pysqlite would otherwise commit
+    the transaction of the test when its outer SAVEPOINT is released
+    """
+    if not event.contains(engine, 'begin', emit_begin):
+        event.listen(engine, 'connect', disable_pysqlite_transactions)
+        event.listen(engine, 'begin', emit_begin)
 
 
 class BaseTestClass(unittest.TestCase):
+    # run in a rolled back transaction of the shared database
+    transactional = True
+
     def setUp(self):
         """
         Set up the db, the app and some variables
@@ -23,11 +116,54 @@ class BaseTestClass(unittest.TestCase):
             'email': 'johndoe@example.com'
         }
 
+        if self.transactional:
+            self.begin_test_transaction()
+        else:
+            with self.app.app_context():
+                # create tables in test db
+                db.session.close()
+                db.drop_all()
+                db.create_all()
+
+    def begin_test_transaction(self):
+        """
+        Point db.session of the test at a transaction of the shared
+        database which tearDown rolls back
+        """
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = shared_database_uri()
         with self.app.app_context():
-            # create tables in test db
-            db.session.close()
-            db.drop_all()
-            db.create_all()
+            engine = db.engine
+            begin_on_sqlite(engine)
+            if not _shared_database['schema']:
+                db.create_all()
+                _shared_database['schema'] = True
+            self.connection = engine.connect()
+            self.transaction = self.connection.begin()
+        self.app_session = db.session
+        db.session = orm.scoped_session(
+            orm.sessionmaker(class_=SavepointSession, db=db, bind=self.connection,
+                             binds={}, query_cls=db.Query),
+            scopefunc=_app_ctx_stack.__ident_func__)
+
+    def rollback_test_transaction(self):
+        db.session.remove()
+        db.session = self.app_session
+        self.transaction.rollback()
+        self.connection.close()
+
+    def create_user(self, user_data=None):
+        """
+        Insert a user without going through /auth/register, its password
+        is hashed once per process. Returns the id of the user
+        """
+        user_data = user_data or self.user_data
+        with self.app.app_context():
+            user_id = db.session.execute(User.__table__.insert().values(
+                username=user_data['username'], name=user_data['name'],
+                email=user_data['email'],
+                password=password_hash(user_data['password']))).inserted_primary_key[0]
+            db.session.commit()
+            return user_id
 
     def logout_user(self, access_token=None):
         """
@@ -82,6 +218,8 @@ class BaseTestClass(unittest.TestCase):
                 return self.client().put(*args, **kwargs)
             elif method == 'DELETE':
                 return self.client().delete(*args, **kwargs)
+            elif method == 'PATCH':
+                return self.client().patch(*args, **kwargs)
             else:
                 raise ValueError('Arguments are invalid for make request')
 
@@ -171,7 +309,7 @@ class BaseTestClass(unittest.TestCase):
     def get_default_token(self):
         global data_got
         with self.app.app_context():
-            self.register_user()
+            self.create_user()
             response = self.login_user()
             try:
                 data_got = json.loads(response.data.decode())
@@ -180,6 +318,9 @@ class BaseTestClass(unittest.TestCase):
                 raise KeyError('"access_token" is not a key. This is the data %s' % data_got)
 
     def tearDown(self):
+        if self.transactional:
+            self.rollback_test_transaction()
+            return
         with self.app.app_context():
             db.session.remove
             db.drop_all()
@@ -201,6 +342,12 @@ class GroceryParentTestClass(BaseTestClass):
             else:
                 return on_create.status_code, response
 
+    def add_item(self, access_token, grocery_list_id, name):
+        response = self.make_request('POST', '/grocerylists/{}/items/'.format(grocery_list_id),
+                                     headers=dict(Authorization='Bearer ' + access_token),
+                                     data=json.dumps({'name': name}))
+        return json.loads(response.data.decode())['id']
+
     def make_get_request(self, url, access_token):
         if url and access_token:
             with self.app.app_context():
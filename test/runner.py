@@ -0,0 +1,184 @@
+"""
+Parallel runner of the test suite, used by `python manage.py test --parallel N`.
+
+The test classes are spread over N worker processes, each with its own
+database file, and their results are printed in the format of
+unittest.TextTestRunner once all the workers are done. With coverage on,
+every worker saves its own data file and they are combined at the end.
+"""
+
+import io
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+
+def iter_tests(suite):
+    """
+    The test cases of a nested suite
+    """
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for case in iter_tests(test):
+                yield case
+        else:
+            yield test
+
+
+def class_key(test):
+    return '%s.%s' % (type(test).__module__, type(test).__name__)
+
+
+def partition(suite, workers):
+    """
+    Split the test classes of suite into at most workers groups of about
+    the same number of tests. The biggest classes are placed first, each
+    in the group with the fewest tests so far
+    """
+    sizes = {}
+    for test in iter_tests(suite):
+        key = class_key(test)
+        sizes[key] = sizes.get(key, 0) + 1
+    groups = [[] for _ in range(max(min(workers, len(sizes)), 1))]
+    loads = [0] * len(groups)
+    for key in sorted(sizes, key=lambda key: (-sizes[key], key)):
+        index = loads.index(min(loads))
+        groups[index].append(key)
+        loads[index] += sizes[key]
+    return [group for group in groups if group]
+
+
+class ReportedTest(object):
+    """
+    What the parent needs of a test run by a worker to print its failure
+    """
+
+    def __init__(self, test):
+        self.name = str(test)
+        self.description = test.shortDescription()
+
+    def __str__(self):
+        return self.name
+
+    def shortDescription(self):
+        return self.description
+
+
+def run_worker(start_dir, pattern, class_keys, database_uri, with_coverage):
+    """
+    Run the test classes class_keys against database_uri, returns what the
+    parent needs to report them
+    """
+    from configuration.config import APP_CONFIG
+    APP_CONFIG['testing'].SQLALCHEMY_DATABASE_URI = database_uri
+    cov = None
+    if with_coverage:
+        import coverage
+        cov = coverage.coverage(branch=True, include='app/*', data_suffix=True)
+        cov.start()
+
+    tests = unittest.TestSuite(test for test in
+                               iter_tests(unittest.TestLoader().discover(start_dir, pattern=pattern))
+                               if class_key(test) in class_keys)
+    stream = io.StringIO()
+    result = unittest.TextTestResult(unittest.runner._WritelnDecorator(stream), True, 2)
+    tests(result)
+
+    if cov is not None:
+        cov.stop()
+        cov.save()
+
+    def reported(pairs):
+        return [(ReportedTest(test), err) for test, err in pairs]
+
+    return {
+        'output': stream.getvalue(),
+        'tests_run': result.testsRun,
+        'errors': reported(result.errors),
+        'failures': reported(result.failures),
+        'skipped': reported(result.skipped),
+        'expected_failures': reported(result.expectedFailures),
+        'unexpected_successes': [ReportedTest(test) for test in result.unexpectedSuccesses],
+    }
+
+
+def merge_results(worker_results, stream):
+    """
+    A TextTestResult writing to stream holding the results of all the workers
+    """
+    result = unittest.TextTestResult(unittest.runner._WritelnDecorator(stream), True, 2)
+    for worker_result in worker_results:
+        result.testsRun += worker_result['tests_run']
+        result.errors.extend(worker_result['errors'])
+        result.failures.extend(worker_result['failures'])
+        result.skipped.extend(worker_result['skipped'])
+        result.expectedFailures.extend(worker_result['expected_failures'])
+        result.unexpectedSuccesses.extend(worker_result['unexpected_successes'])
+    return result
+
+
+def print_summary(result, time_taken):
+    """
+    The summary TextTestRunner prints after the tests
+    """
+    result.printErrors()
+    result.stream.writeln(result.separator2)
+    run = result.testsRun
+    result.stream.writeln('Ran %d test%s in %.3fs' % (run, run != 1 and 's' or '', time_taken))
+    result.stream.writeln()
+    infos = []
+    if not result.wasSuccessful():
+        result.stream.write('FAILED')
+        if result.failures:
+            infos.append('failures=%d' % len(result.failures))
+        if result.errors:
+            infos.append('errors=%d' % len(result.errors))
+    else:
+        result.stream.write('OK')
+    if result.skipped:
+        infos.append('skipped=%d' % len(result.skipped))
+    if result.expectedFailures:
+        infos.append('expected failures=%d' % len(result.expectedFailures))
+    if result.unexpectedSuccesses:
+        infos.append('unexpected successes=%d' % len(result.unexpectedSuccesses))
+    if infos:
+        result.stream.writeln(' (%s)' % (', '.join(infos),))
+    else:
+        result.stream.write('\n')
+    result.stream.flush()
+
+
+def run_parallel(workers, start_dir='./test', pattern='test*.py', with_coverage=False,
+                 stream=None):
+    """
+    Run the tests found in start_dir on workers processes and print the
+    merged results to stream, sys.stderr by default. Returns the result
+    """
+    stream = stream or sys.stderr
+    groups = partition(unittest.TestLoader().discover(start_dir, pattern=pattern), workers)
+    directory = tempfile.mkdtemp(prefix='rideco-test-')
+    start = time.perf_counter()
+    try:
+        context = multiprocessing.get_context(
+            'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        # the executor workers are not daemons, so a test may start processes
+        with ProcessPoolExecutor(len(groups) or 1, mp_context=context) as executor:
+            pending = [executor.submit(
+                run_worker, start_dir, pattern, group,
+                'sqlite:///' + os.path.join(directory, 'worker%d.db' % index), with_coverage)
+                for index, group in enumerate(groups)]
+            worker_results = [future.result() for future in pending]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    time_taken = time.perf_counter() - start
+
+    for worker_result in worker_results:
+        stream.write(worker_result['output'])
+    result = merge_results(worker_results, stream)
+    print_summary(result, time_taken)
+    return result
@@ -0,0 +1,100 @@
+"""
+This module is for testing the loading of the lists and items of the
+nested routes
+"""
+
+
+import unittest
+import json
+from sqlalchemy import event
+from app import db, GroceryItem, GroceryList, User
+from app.access import load_grocery_item, FORBIDDEN, NOT_FOUND
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class AccessTestClass(GroceryParentTestClass):
+    """
+    All tests for app.access
+    """
+
+    def setUp(self):
+        GroceryParentTestClass.setUp(self)
+        self.access_token = self.get_default_token()
+        self.headers = dict(Authorization='Bearer ' + self.access_token)
+        self.list_id = self.create_grocery_list(self.access_token)[0]
+        response = self.make_request(
+            'POST', '/grocerylists/{}/items/'.format(self.list_id), headers=self.headers,
+            data=json.dumps(self.grocery_item_data))
+        self.item_id = json.loads(response.data.decode())['id']
+        # a list and an item of another user
+        other_data = dict(self.user_data, username='janedoe', email='janedoe@example.com')
+        self.other_user_id = self.create_user(other_data)
+        with self.app.app_context():
+            other_list = GroceryList('Hardware', owner=User.query.get(self.other_user_id))
+            other_item = GroceryItem('nails', 100, 'units', parent_list=other_list)
+            db.session.add_all([other_list, other_item])
+            db.session.commit()
+            self.other_list_id, self.other_item_id = other_list.id, other_item.id
+
+    def test_item_is_loaded_with_one_query(self):
+        """
+        The item and its list come from one statement
+        """
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with self.app.app_context():
+            user = User.query.get(self.other_user_id)
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                loaded = load_grocery_item(user, self.list_id, self.item_id, owner_only=False)
+                self.assertEqual(loaded.grocery_item.parent_list, loaded.grocery_list)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertTrue(loaded.ok)
+        self.assertEqual(loaded.grocery_item.id, self.item_id)
+        self.assertEqual(len(statements), 1)
+
+    def test_outcomes(self):
+        """
+        Missing lists and items are a 404, a change by another user a 403
+        """
+        with self.app.app_context():
+            user = User.query.get(self.other_user_id)
+            self.assertEqual(load_grocery_item(user, self.list_id, self.item_id).status, FORBIDDEN)
+            missing_list = load_grocery_item(user, 9999, self.item_id)
+            self.assertEqual((missing_list.status, missing_list.message),
+                             (NOT_FOUND, 'The grocery list does not exist'))
+            missing_item = load_grocery_item(user, self.list_id, 9999, owner_only=False)
+            self.assertEqual((missing_item.status, missing_item.message),
+                             (NOT_FOUND, 'The grocery item does not exist'))
+
+    def test_only_the_owner_changes_a_list(self):
+        """
+        The list of another user and its items may be read but not changed
+        """
+        list_url = '/grocerylists/{}'.format(self.other_list_id)
+        item_url = '/grocerylists/{}/items/{}'.format(self.other_list_id, self.other_item_id)
+        self.assertEqual(self.make_request('GET', list_url, headers=self.headers).status_code, 200)
+        self.assertEqual(self.make_request('GET', item_url, headers=self.headers).status_code, 200)
+        for method, url, data in [('PUT', list_url, {'title': 'Tools'}),
+                                  ('DELETE', list_url, None),
+                                  ('POST', list_url + '/items/', self.grocery_item_data),
+                                  ('PUT', item_url, {'name': 'screws'}),
+                                  ('DELETE', item_url, None)]:
+            response = self.make_request(method, url, headers=self.headers,
+                                         data=json.dumps(data) if data else None)
+            self.assertEqual(response.status_code, 403, (method, url))
+        # an item is not found through another list
+        response = self.make_request('GET', '/grocerylists/{}/items/{}'.format(
+            self.list_id, self.other_item_id), headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
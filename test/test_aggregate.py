@@ -0,0 +1,81 @@
+"""
+This module is for testing the aggregation of several grocery lists
+"""
+
+
+import unittest
+import json
+from sqlalchemy import event
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class AggregateTestClass(GroceryParentTestClass):
+    """
+    All tests for GET /grocerylists/aggregate
+    """
+
+    def add_items(self, access_token, grocery_list_id, items):
+        for item in items:
+            self.make_request('POST', '/grocerylists/{}/items/'.format(grocery_list_id),
+                              headers=dict(Authorization='Bearer ' + access_token),
+                              data=json.dumps(item))
+
+    def aggregate(self, access_token, query=''):
+        response = self.make_get_request('/grocerylists/aggregate' + query, access_token)
+        return response.status_code, json.loads(response.data.decode())
+
+    def test_quantities_are_summed_in_one_query(self):
+        """
+        Items with the same name and unit are summed across the lists
+        """
+        with self.app.app_context():
+            from app import db
+            access_token = self.get_default_token()
+            first_id = self.create_grocery_list(access_token, {'title': 'first'})[0]
+            second_id = self.create_grocery_list(access_token, {'title': 'second'})[0]
+            third_id = self.create_grocery_list(access_token, {'title': 'third'})[0]
+            self.add_items(access_token, first_id, [
+                {'name': 'eggs', 'quantity': 6, 'unit': 'units'},
+                {'name': 'flour', 'quantity': 1, 'unit': 'kg'}])
+            self.add_items(access_token, second_id, [
+                {'name': ' Eggs ', 'quantity': 12, 'unit': 'Units'},
+                {'name': 'flour', 'quantity': 500, 'unit': 'g'}])
+            self.add_items(access_token, third_id, [
+                {'name': 'eggs', 'quantity': 30, 'unit': 'units'}])
+
+            statements = []
+
+            def count_statement(conn, cursor, statement, parameters, context, executemany):
+                if 'groceryitem' in statement:
+                    statements.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', count_statement)
+            try:
+                status, response = self.aggregate(
+                    access_token, '?ids={},{}'.format(first_id, second_id))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count_statement)
+            self.assertEqual(status, 200)
+            self.assertEqual(len(statements), 1)
+            self.assertEqual([(row['name'], row['unit'], row['quantity']) for row in response], [
+                ('eggs', 'units', 18), ('flour', 'g', 500), ('flour', 'kg', 1)])
+
+            status, response = self.aggregate(access_token, '?convert=true')
+            self.assertEqual([(row['name'], row['unit'], row['quantity'], row['items'])
+                              for row in response],
+                             [('eggs', 'units', 48, 3), ('flour', 'g', 1500, 2)])
+
+    def test_invalid_ids(self):
+        """
+        The ids have to be integers
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            status, response = self.aggregate(access_token, '?ids=1,two')
+            self.assertEqual(status, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+This module is for testing the batched item operations endpoint
+"""
+
+
+import unittest
+import json
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class BatchItemsTestClass(GroceryParentTestClass):
+    """
+    All tests for PATCH /grocerylists/<id>/items/
+    """
+
+    def patch_items(self, access_token, grocery_list_id, operations):
+        response = self.make_request('PATCH', '/grocerylists/{}/items/'.format(grocery_list_id),
+                                     headers=dict(Authorization='Bearer ' + access_token),
+                                     data=json.dumps(operations))
+        return response.status_code, json.loads(response.data.decode())
+
+    def list_items(self, access_token, grocery_list_id):
+        response = self.make_get_request('/grocerylists/{}/items/'.format(grocery_list_id),
+                                         access_token)
+        return dict((item['name'], item) for item in json.loads(response.data.decode()))
+
+    def test_operations_are_applied_in_one_commit(self):
+        """
+        Adds, updates and removes are applied in order with a single commit
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+            status, created = self.patch_items(access_token, grocery_list_id, [
+                {'op': 'add', 'name': 'eggs', 'quantity': 6},
+                {'op': 'add', 'name': 'milk', 'quantity': 1, 'unit': 'l'},
+            ])
+            self.assertEqual(status, 200)
+            eggs_id, milk_id = created[0]['id'], created[1]['id']
+
+            commits = []
+
+            def count_commit(session):
+                commits.append(session)
+            event.listen(Session, 'after_commit', count_commit)
+            try:
+                status, results = self.patch_items(access_token, grocery_list_id, {'operations': [
+                    {'op': 'update', 'id': eggs_id, 'quantity': 18, 'name': 'free range eggs'},
+                    {'op': 'remove', 'id': milk_id},
+                    {'op': 'add', 'name': 'bread'},
+                ]})
+            finally:
+                event.remove(Session, 'after_commit', count_commit)
+            self.assertEqual(status, 200)
+            self.assertEqual(len(commits), 1)
+            self.assertEqual([result['op'] for result in results], ['update', 'remove', 'add'])
+
+            items = self.list_items(access_token, grocery_list_id)
+            self.assertEqual(sorted(items), ['bread', 'free range eggs'])
+            self.assertEqual(items['free range eggs']['quantity'], 18)
+            self.assertEqual(items['bread']['unit'], 'units')
+
+    def test_invalid_operation_changes_nothing(self):
+        """
+        When one operation is invalid none of them is applied
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+            status, created = self.patch_items(access_token, grocery_list_id, [
+                {'op': 'add', 'name': 'eggs', 'quantity': 6}])
+            status, response = self.patch_items(access_token, grocery_list_id, [
+                {'op': 'update', 'id': created[0]['id'], 'quantity': 12},
+                {'op': 'remove', 'id': 9999},
+                {'op': 'rename'},
+            ])
+            self.assertEqual(status, 400)
+            self.assertEqual([error['index'] for error in response['errors']], [2, 1])
+            self.assertEqual(self.list_items(access_token, grocery_list_id)['eggs']['quantity'], 6)
+
+            status, response = self.patch_items(access_token, 9999, [{'op': 'add', 'name': 'x'}])
+            self.assertEqual(status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+This module is for testing the compression of the responses
+"""
+
+
+import unittest
+import gzip
+import json
+from app.compression import brotli
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class CompressionTestClass(GroceryParentTestClass):
+    """
+    All tests for the compression stage
+    """
+
+    def get(self, url, access_token, accept_encoding):
+        with self.app.app_context():
+            return self.client().get(url, headers={
+                'Authorization': 'Bearer ' + access_token,
+                'Accept-Encoding': accept_encoding
+            })
+
+    def create_lists(self, access_token, count=20):
+        for number in range(count):
+            self.create_grocery_list(access_token, {'title': 'Grocery list %d' % number,
+                                                    'description': 'weekly shopping'})
+
+    def test_gzip_negotiation(self):
+        """
+        Big bodies are gzipped when the client accepts it, small ones are not
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            self.create_lists(access_token)
+            response = self.get('/grocerylists/', access_token, 'gzip;q=1.0, br;q=0.5')
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+            self.assertEqual(len(json.loads(gzip.decompress(response.data).decode())), 20)
+
+            # an encoding the client did not ask for is never used
+            response = self.get('/grocerylists/', access_token, 'identity')
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertEqual(len(json.loads(response.data.decode())), 20)
+
+            # small bodies are not worth compressing
+            response = self.get('/grocerylists/?limit=1', access_token, 'gzip')
+            self.assertNotIn('Content-Encoding', response.headers)
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        """
+        brotli is used when the client accepts both encodings equally
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            self.create_lists(access_token)
+            response = self.get('/grocerylists/', access_token, 'gzip, br')
+            self.assertEqual(response.headers['Content-Encoding'], 'br')
+            self.assertEqual(len(json.loads(brotli.decompress(response.data).decode())), 20)
+
+    def test_streamed_response_is_compressed(self):
+        """
+        Streamed responses are compressed on the fly
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            self.create_lists(access_token, count=2)
+            response = self.get('/export', access_token, 'gzip')
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(len(gzip.decompress(response.data).decode().splitlines()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+This module is for testing the transactional test fixtures
+"""
+
+
+import unittest
+from app import db, User, GroceryList
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class TransactionalFixtureTestClass(GroceryParentTestClass):
+    """
+    All tests for the rolled back transaction of each test
+    """
+
+    def test_commits_are_rolled_back_after_the_test(self):
+        """
+        Rows committed by the app are gone once the test transaction ends
+        """
+        access_token = self.get_default_token()
+        self.create_grocery_list(access_token)
+        with self.app.app_context():
+            self.assertEqual(GroceryList.query.count(), 1)
+        self.rollback_test_transaction()
+        self.begin_test_transaction()
+        with self.app.app_context():
+            self.assertEqual(User.query.count(), 0)
+            self.assertEqual(GroceryList.query.count(), 0)
+
+    def test_app_rollback_keeps_earlier_commits(self):
+        """
+        A rollback of the app only undoes the work since its last commit
+        """
+        user_id = self.create_user()
+        with self.app.app_context():
+            user = User.query.get(user_id)
+            GroceryList('kept', owner=user).save()
+            db.session.add(GroceryList('dropped', owner=user))
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual([grocery_list.title for grocery_list in GroceryList.query],
+                             ['kept'])
+
+    def test_uncommitted_work_is_dropped_with_the_session(self):
+        """
+        Work flushed but not committed does not outlive its app context
+        """
+        user_id = self.create_user()
+        with self.app.app_context():
+            db.session.add(GroceryList('dropped', owner=User.query.get(user_id)))
+            db.session.flush()
+        with self.app.app_context():
+            self.assertEqual(GroceryList.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
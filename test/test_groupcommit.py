@@ -0,0 +1,120 @@
+"""
+This module is for testing the group commit of item inserts
+"""
+
+
+import unittest
+import json
+import os
+import tempfile
+import threading
+from app import db, GroceryItem
+from app.groupcommit import GroupCommitter, GroupCommitError, PendingInsert
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class GroupCommitTestClass(GroceryParentTestClass):
+    """
+    All tests for the group commit mode
+    """
+    transactional = False
+
+    def setUp(self):
+        GroceryParentTestClass.setUp(self)
+        # the flusher thread needs a database shared between connections
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.path
+        with self.app.app_context():
+            db.create_all()
+        self.committer = GroupCommitter(self.app, max_delay=0.05, max_batch=8)
+        self.app.extensions['groupcommit'] = self.committer
+        self.committer.start()
+
+    def tearDown(self):
+        self.committer.stop()
+        GroceryParentTestClass.tearDown(self)
+        os.remove(self.path)
+
+    def test_concurrent_inserts_share_transactions(self):
+        """
+        Inserts from several threads are committed in fewer transactions
+        and every request gets its own item back
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+        responses = []
+
+        def insert(index):
+            response = self.app.test_client().post(
+                '/grocerylists/{}/items/'.format(grocery_list_id),
+                headers=dict(Authorization='Bearer ' + access_token),
+                data=json.dumps({'name': 'item %d' % index, 'quantity': index}))
+            responses.append((response.status_code, json.loads(response.data.decode())))
+
+        threads = [threading.Thread(target=insert, args=(index,)) for index in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([status for status, _ in responses], [201] * 16)
+        self.assertEqual(len(set(body['id'] for _, body in responses)), 16)
+        for _, body in responses:
+            self.assertEqual(body['name'], 'item %d' % body['quantity'])
+        self.assertLess(self.committer.batches, 16)
+        with self.app.app_context():
+            self.assertEqual(GroceryItem.query.count(), 16)
+
+    def test_failed_insert_does_not_fail_the_batch(self):
+        """
+        An insert into a missing list fails alone
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+        results = {}
+
+        def insert(list_id):
+            try:
+                results[list_id] = self.committer.insert_item(list_id, 'eggs', 1, 'units')
+            except GroupCommitError as e:
+                results[list_id] = str(e)
+
+        threads = [threading.Thread(target=insert, args=(list_id,))
+                   for list_id in (grocery_list_id, 9999)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results[grocery_list_id]['name'], 'eggs')
+        self.assertEqual(results[9999], 'The grocery list does not exist')
+
+    def test_timed_out_insert_is_not_committed_later(self):
+        """
+        An insert given up by its request is taken out of the queue, or
+        skipped when the flusher already took it
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+        # not started, so nothing is committed in time
+        committer = GroupCommitter(self.app, timeout=0.01)
+        with self.assertRaises(GroupCommitError):
+            committer.insert_item(grocery_list_id, 'eggs', 1, 'units')
+        self.assertEqual(committer.pending, [])
+
+        entry = PendingInsert(grocery_list_id, 'eggs', 1, 'units')
+        entry.cancelled = True
+        with self.app.app_context():
+            committer.flush([entry])
+            self.assertEqual(GroceryItem.query.count(), 0)
+        self.assertFalse(entry.done.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()
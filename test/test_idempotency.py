@@ -0,0 +1,125 @@
+"""
+This module is for testing the Idempotency-Key support of the POST endpoints
+"""
+
+
+import unittest
+import json
+from datetime import datetime, timedelta
+from app import db, GroceryList, GroceryItem, IdempotencyKey
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class IdempotencyTestClass(GroceryParentTestClass):
+    """
+    All tests for the Idempotency-Key header
+    """
+
+    def post(self, access_token, url, data, key):
+        return self.make_request('POST', url,
+                                 headers={'Authorization': 'Bearer ' + access_token,
+                                          'Idempotency-Key': key},
+                                 data=json.dumps(data))
+
+    def test_retries_replay_the_first_response(self):
+        """
+        Retrying a POST with the same key returns the stored response
+        and creates nothing
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            first = self.post(access_token, '/grocerylists/', {'title': 'weekly'}, 'key-1')
+            retry = self.post(access_token, '/grocerylists/', {'title': 'weekly'}, 'key-1')
+            self.assertEqual(first.status_code, 201)
+            self.assertEqual(retry.status_code, 201)
+            self.assertEqual(retry.headers.get('Idempotent-Replayed'), 'true')
+            self.assertEqual(json.loads(retry.data.decode()), json.loads(first.data.decode()))
+            self.assertEqual(GroceryList.query.count(), 1)
+
+            grocery_list_id = json.loads(first.data.decode())['id']
+            url = '/grocerylists/{}/items/'.format(grocery_list_id)
+            for _ in range(2):
+                response = self.post(access_token, url, {'name': 'eggs'}, 'key-2')
+                self.assertEqual(response.status_code, 201)
+            self.assertEqual(GroceryItem.query.count(), 1)
+
+            # another key is another request
+            response = self.post(access_token, '/grocerylists/', {'title': 'weekly'}, 'key-3')
+            self.assertIsNone(response.headers.get('Idempotent-Replayed'))
+            self.assertEqual(GroceryList.query.count(), 2)
+
+    def test_key_reused_or_in_progress(self):
+        """
+        A key reused for another body gets a 422 and a key whose first
+        request is still running gets a 409
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            self.post(access_token, '/grocerylists/', {'title': 'weekly'}, 'key-1')
+            response = self.post(access_token, '/grocerylists/', {'title': 'monthly'}, 'key-1')
+            self.assertEqual(response.status_code, 422)
+
+            record = IdempotencyKey.query.filter_by(key='key-1').first()
+            db.session.add(IdempotencyKey(user_id=record.user_id, key='key-2',
+                                          request_hash=record.request_hash))
+            db.session.commit()
+            response = self.post(access_token, '/grocerylists/', {'title': 'weekly'}, 'key-2')
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(GroceryList.query.count(), 1)
+
+    def test_abandoned_claim_is_taken_over(self):
+        """
+        A retry takes over a key whose request did not finish within the lease
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            self.post(access_token, '/grocerylists/', {'title': 'weekly'}, 'key-1')
+            record = IdempotencyKey.query.filter_by(key='key-1').first()
+            # the worker running the first request was killed
+            abandoned = IdempotencyKey(user_id=record.user_id, key='key-2',
+                                       request_hash=record.request_hash)
+            db.session.add(abandoned)
+            db.session.commit()
+            response = self.post(access_token, '/grocerylists/', {'title': 'weekly'}, 'key-2')
+            self.assertEqual(response.status_code, 409)
+
+            IdempotencyKey.query.filter_by(key='key-2').update({
+                'claimed_at': datetime.utcnow() - timedelta(
+                    seconds=int(self.app.config['IDEMPOTENCY_LEASE']) + 1)})
+            db.session.commit()
+            response = self.post(access_token, '/grocerylists/', {'title': 'weekly'}, 'key-2')
+            self.assertEqual(response.status_code, 201)
+            self.assertIsNone(response.headers.get('Idempotent-Replayed'))
+            retry = self.post(access_token, '/grocerylists/', {'title': 'weekly'}, 'key-2')
+            self.assertEqual(retry.headers.get('Idempotent-Replayed'), 'true')
+            self.assertEqual(json.loads(retry.data.decode()), json.loads(response.data.decode()))
+            self.assertEqual(GroceryList.query.count(), 2)
+
+    def test_expired_keys_are_pruned(self):
+        """
+        Keys older than the TTL are deleted and can be used again
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            self.post(access_token, '/grocerylists/', {'title': 'weekly'}, 'key-1')
+            record = IdempotencyKey.query.filter_by(key='key-1').first()
+            record.created_at = datetime.utcnow() - timedelta(
+                seconds=int(self.app.config['IDEMPOTENCY_TTL']) + 1)
+            db.session.commit()
+            response = self.post(access_token, '/grocerylists/', {'title': 'weekly'}, 'key-1')
+            self.assertEqual(response.status_code, 201)
+            self.assertIsNone(response.headers.get('Idempotent-Replayed'))
+            self.assertEqual(IdempotencyKey.query.count(), 1)
+
+            self.app.config['IDEMPOTENCY_MAX_KEYS'] = 2
+            for key in ('key-2', 'key-3'):
+                self.post(access_token, '/grocerylists/', {'title': key}, key)
+            self.assertEqual(sorted(record.key for record in IdempotencyKey.query.all()),
+                             ['key-2', 'key-3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
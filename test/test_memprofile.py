@@ -0,0 +1,69 @@
+"""
+This module is for testing the memory profiling of the requests
+"""
+
+
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+from app.memprofile import start_memory_profiler
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class MemoryProfileTestClass(GroceryParentTestClass):
+    """
+    All tests for app.memprofile
+    """
+
+    def setUp(self):
+        GroceryParentTestClass.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.app.config.update(MEMORY_PROFILE_SAMPLE_RATE=1, MEMORY_PROFILE_DIR=self.directory)
+
+    def tearDown(self):
+        GroceryParentTestClass.tearDown(self)
+        shutil.rmtree(self.directory)
+
+    def test_disabled_by_default(self):
+        """
+        No hook is registered when the mode is off
+        """
+        hooks = len(self.app.before_request_funcs.get(None, []))
+        self.assertIsNone(start_memory_profiler(self.app))
+        self.assertEqual(len(self.app.before_request_funcs.get(None, [])), hooks)
+        self.assertNotIn('memprofile', self.app.extensions)
+
+    def test_allocations_are_dumped_per_route(self):
+        """
+        A profiled request adds its peak, retained memory and allocation
+        sites to the file of the worker
+        """
+        self.app.config['MEMORY_PROFILE_ENABLED'] = True
+        profiler = start_memory_profiler(self.app)
+        access_token = self.get_default_token()
+        grocery_list_id = self.create_grocery_list(access_token)[0]
+        response = self.make_get_request('/grocerylists/{}'.format(grocery_list_id), access_token)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(tracemalloc.is_tracing())
+
+        with open(profiler.path()) as dump_file:
+            report = json.load(dump_file)
+        self.assertEqual(report['pid'], os.getpid())
+        self.assertEqual(len(report['gc']['counts']), 3)
+        route = report['routes']['GET /grocerylists/<int:id>']
+        self.assertEqual(report['routes']['POST /auth/login']['requests'], 1)
+        self.assertEqual(route['requests'], 1)
+        self.assertGreater(route['peak_max_bytes'], 0)
+        self.assertGreaterEqual(route['peak_max_bytes'], route['retained_mean_bytes'])
+        self.assertTrue(route['top_sites'])
+        self.assertIn(':', route['top_sites'][0]['site'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+This module is for testing the bulk import of users
+"""
+
+
+import unittest
+import io
+from app import db, User
+from app.provisioning import UserImporter, parse_users_csv
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+USERS_CSV = '''username,name,email,password
+alice,Alice,alice@example.com,secret123
+bob,Bob,bob@example.com,short
+johndoe,John,john@example.com,secret123
+alice,Alice 2,alice2@example.com,secret123
+carol,Carol,carol-at-example,secret123
+dave,Dave,dave@example.com,secret123
+erin,Erin,erin@example.com,secret123
+'''
+
+
+class UserImportTestClass(GroceryParentTestClass):
+    """
+    All tests for manage.py users import
+    """
+
+    def test_import_reports_failed_rows(self):
+        """
+        Valid rows are created in batches and every other row is reported
+        """
+        self.create_user()
+        with self.app.app_context():
+            importer = UserImporter(batch_size=3, workers=1, rounds=4)
+            events = list(importer.run(parse_users_csv(io.StringIO(USERS_CSV))))
+            errors = dict((event['row'], event['message'])
+                          for event in events if event['event'] == 'error')
+            self.assertEqual(errors, {
+                2: 'Your password is too short',
+                3: 'The username is already taken',
+                4: 'The username is already taken',
+                5: 'Invalid email format',
+            })
+            done = events[-1]
+            self.assertEqual(done['event'], 'done')
+            self.assertEqual((done['rows'], done['imported'], done['errors'], done['batches']),
+                             (7, 3, 4, 2))
+            self.assertEqual(sorted(user.username for user in User.query),
+                             ['alice', 'dave', 'erin', 'johndoe'])
+            alice = User.query.filter_by(username='alice').first()
+            self.assertEqual(alice.name, 'Alice')
+            self.assertTrue(alice.password_is_valid('secret123'))
+
+    def test_collisions_are_checked_with_one_query(self):
+        """
+        The usernames of a batch are looked up together
+        """
+        with self.app.app_context():
+            statements = []
+            importer = UserImporter(batch_size=10, workers=1, rounds=4)
+            engine = db.session.get_bind()
+
+            def count_statement(conn, cursor, statement, *args):
+                if statement.startswith('SELECT') and 'FROM user' in statement:
+                    statements.append(statement)
+
+            from sqlalchemy import event
+            event.listen(engine, 'before_cursor_execute', count_statement)
+            try:
+                list(importer.run(parse_users_csv(io.StringIO(USERS_CSV))))
+            finally:
+                event.remove(engine, 'before_cursor_execute', count_statement)
+            self.assertEqual(len(statements), 1)
+            self.assertIn(' IN ', statements[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
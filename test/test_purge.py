@@ -0,0 +1,73 @@
+"""
+This module is for testing the soft deletes and the purge of tombstones
+"""
+
+
+import unittest
+import json
+from app import GroceryList, GroceryItem
+from app.purge import purge_tombstones, PurgeWorker
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class SoftDeleteTestClass(GroceryParentTestClass):
+    """
+    All tests for the soft deletes and the purge
+    """
+
+    def test_deletes_leave_tombstones_until_purged(self):
+        """
+        Deleted lists and items disappear from the API right away
+        and their rows are removed by the purge
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            kept_list_id = self.create_grocery_list(access_token, {'title': 'kept'})[0]
+            deleted_list_id = self.create_grocery_list(access_token, {'title': 'deleted'})[0]
+            kept_item_id = self.add_item(access_token, kept_list_id, 'eggs')
+            deleted_item_id = self.add_item(access_token, kept_list_id, 'milk')
+            self.add_item(access_token, deleted_list_id, 'bread')
+
+            response = self.make_request('DELETE', '/grocerylists/{}'.format(deleted_list_id),
+                                         headers=dict(Authorization='Bearer ' + access_token))
+            self.assertEqual(response.status_code, 200)
+            response = self.make_request('DELETE', '/grocerylists/{}/items/{}'.format(
+                kept_list_id, deleted_item_id),
+                headers=dict(Authorization='Bearer ' + access_token))
+            self.assertEqual(response.status_code, 200)
+
+            response = self.make_get_request('/grocerylists/', access_token)
+            self.assertEqual([grocery_list['id'] for grocery_list
+                              in json.loads(response.data.decode())], [kept_list_id])
+            response = self.make_get_request('/grocerylists/{}'.format(deleted_list_id),
+                                             access_token)
+            self.assertEqual(response.status_code, 404)
+            response = self.make_get_request('/grocerylists/{}/items/{}'.format(
+                kept_list_id, deleted_item_id), access_token)
+            self.assertEqual(response.status_code, 404)
+            # the rows are still there as tombstones
+            self.assertEqual(GroceryList.query.count(), 2)
+            self.assertEqual(GroceryItem.query.count(), 3)
+
+            purged = purge_tombstones(batch_size=1)
+            self.assertEqual(purged, {'lists': 1, 'items': 1})
+            self.assertEqual([grocery_list.id for grocery_list in GroceryList.query.all()],
+                             [kept_list_id])
+            self.assertEqual([item.id for item in GroceryItem.query.all()], [kept_item_id])
+            self.assertEqual(purge_tombstones(), {'lists': 0, 'items': 0})
+
+    def test_worker_waits_for_quiet_periods(self):
+        """
+        The worker only purges when no request has started recently
+        """
+        worker = PurgeWorker(self.app, quiet_seconds=60)
+        self.assertFalse(worker.is_quiet())
+        worker.last_request -= 61
+        self.assertTrue(worker.is_quiet())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+This module is for testing the token-bucket rate limiter
+"""
+
+
+import os
+import tempfile
+import unittest
+import json
+from app.ratelimit import MemoryBackend, SQLiteBackend
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class TokenBucketTestClass(unittest.TestCase):
+    """
+    Tests on the bucket arithmetic of the backends
+    """
+
+    def test_bucket_refills_over_time(self):
+        """
+        A bucket allows capacity requests at once then refills at the rate
+        """
+        backend = MemoryBackend()
+        self.assertEqual(backend.consume('key', 2, 1.0, now=0), 0)
+        self.assertEqual(backend.consume('key', 2, 1.0, now=0), 0)
+        # the bucket is empty so the wait until the next token is returned
+        self.assertAlmostEqual(backend.consume('key', 2, 1.0, now=0.5), 0.5)
+        self.assertEqual(backend.consume('key', 2, 1.0, now=1.0), 0)
+
+    def test_sqlite_backend_is_shared(self):
+        """
+        Two sqlite backends on the same file share the buckets
+        """
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        try:
+            first, second = SQLiteBackend(path), SQLiteBackend(path)
+            self.assertEqual(first.consume('key', 1, 0.1, now=100), 0)
+            self.assertGreater(second.consume('key', 1, 0.1, now=100), 0)
+        finally:
+            os.remove(path)
+
+
+class RateLimitTestClass(GroceryParentTestClass):
+    """
+    Tests on the rate limiting of the endpoints
+    """
+
+    def setUp(self):
+        super(RateLimitTestClass, self).setUp()
+        self.app.config['RATELIMIT_ENABLED'] = True
+        self.app.config['RATELIMIT_LIMITS'] = {
+            'auth': (3, 0.01),
+            'search': (2, 0.01),
+            'read': (100, 1.0),
+        }
+
+    def test_login_is_limited_by_ip(self):
+        """
+        Logins over the auth limit get a 429 with Retry-After
+        """
+        with self.app.app_context():
+            self.register_user()
+            self.assertEqual(self.login_user().status_code, 200)
+            self.assertEqual(self.login_user().status_code, 200)
+            response = self.login_user()
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(json.loads(response.data.decode())['message'],
+                             'Too many requests. Try again later')
+            self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+
+    def test_forwarded_clients_have_their_own_bucket(self):
+        """
+        Behind a trusted proxy the clients are told apart by the address
+        it added to X-Forwarded-For, not by the address of the proxy
+        """
+        self.app.config['RATELIMIT_TRUSTED_PROXIES'] = 1
+        with self.app.app_context():
+            self.register_user()
+            login_details = json.dumps(dict(username=self.user_data['username'],
+                                            password=self.user_data['password']))
+
+            def login(forwarded_for):
+                return self.make_request('POST', '/auth/login', data=login_details,
+                                         headers={'X-Forwarded-For': forwarded_for},
+                                         environ_base={'REMOTE_ADDR': '10.0.0.1'})
+            for _ in range(3):
+                self.assertEqual(login('203.0.113.7').status_code, 200)
+            self.assertEqual(login('203.0.113.7').status_code, 429)
+            # a forged entry in front of the one of the proxy is ignored
+            self.assertEqual(login('198.51.100.1, 203.0.113.7').status_code, 429)
+            self.assertEqual(login('203.0.113.8').status_code, 200)
+
+    def test_search_is_limited_per_user(self):
+        """
+        Searches over the search limit are rejected without
+        affecting the other route classes
+        """
+        with self.app.app_context():
+            self.app.config['RATELIMIT_LIMITS']['auth'] = (100, 1.0)
+            access_token = self.get_default_token()
+            for _ in range(2):
+                response = self.make_get_request('/grocerylists/?q=home', access_token)
+                self.assertEqual(response.status_code, 200)
+            response = self.make_get_request('/grocerylists/?q=home', access_token)
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response.headers)
+            # browsing is in another route class
+            response = self.make_get_request('/grocerylists/', access_token)
+            self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+This module is for testing the refresh tokens
+"""
+
+
+import unittest
+import json
+from datetime import datetime, timedelta
+from app import db, RefreshToken
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class RefreshTokenTestClass(GroceryParentTestClass):
+    """
+    All tests for /auth/refresh
+    """
+
+    def login(self):
+        self.create_user()
+        response = self.login_user()
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode())
+
+    def refresh(self, refresh_token):
+        response = self.make_request('POST', '/auth/refresh',
+                                     data=json.dumps({'refresh_token': refresh_token}))
+        return response.status_code, json.loads(response.data.decode())
+
+    def test_refresh_rotates_the_token(self):
+        """
+        A refresh gives a working access token and a new refresh token,
+        and only the hash of the tokens is stored
+        """
+        tokens = self.login()
+        status, refreshed = self.refresh(tokens['refresh_token'])
+        self.assertEqual(status, 200)
+        self.assertNotEqual(refreshed['refresh_token'], tokens['refresh_token'])
+        response = self.make_get_request('/grocerylists/', refreshed['access_token'])
+        self.assertEqual(response.status_code, 200)
+        status, again = self.refresh(refreshed['refresh_token'])
+        self.assertEqual(status, 200)
+        with self.app.app_context():
+            hashes = [token.token_hash for token in RefreshToken.query]
+            self.assertEqual(len(hashes), 3)
+            self.assertNotIn(tokens['refresh_token'], hashes)
+            self.assertEqual(len(set(token.family for token in RefreshToken.query)), 1)
+
+    def test_reused_token_revokes_the_family(self):
+        """
+        Using a replaced token again revokes every token of its login
+        """
+        tokens = self.login()
+        status, refreshed = self.refresh(tokens['refresh_token'])
+        self.assertEqual(status, 200)
+        status, body = self.refresh(tokens['refresh_token'])
+        self.assertEqual(status, 401)
+        self.assertEqual(body['message'], 'The refresh token was already used. Please login')
+        status, body = self.refresh(refreshed['refresh_token'])
+        self.assertEqual(status, 401)
+        self.assertEqual(body['message'], 'The refresh token was revoked. Please login')
+
+    def test_invalid_expired_and_logged_out_tokens(self):
+        """
+        Unknown, expired and logged out tokens are refused
+        """
+        self.assertEqual(self.refresh('not a token')[0], 401)
+        self.assertEqual(self.make_request('POST', '/auth/refresh',
+                                           data=json.dumps({})).status_code, 400)
+        tokens = self.login()
+        with self.app.app_context():
+            RefreshToken.query.update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+            db.session.commit()
+        status, body = self.refresh(tokens['refresh_token'])
+        self.assertEqual((status, body['message']),
+                         (401, 'The refresh token has expired. Please login'))
+
+        tokens = json.loads(self.login_user().data.decode())
+        response = self.make_request('POST', '/auth/logout',
+                                     headers=dict(Authorization='Bearer ' + tokens['access_token']),
+                                     data=json.dumps({'refresh_token': tokens['refresh_token']}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(tokens['refresh_token'])[0], 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+This module is for testing the parallel test runner
+"""
+
+
+import unittest
+import io
+import os
+import shutil
+import tempfile
+try:
+    from .runner import partition, run_parallel
+except (ImportError, SystemError):
+    from runner import partition, run_parallel
+
+SAMPLE_TESTS = '''
+import unittest
+
+
+class FirstTestClass(unittest.TestCase):
+    def test_one(self):
+        pass
+
+    def test_two(self):
+        pass
+
+    def test_three(self):
+        """
+        A failing test
+        """
+        self.assertEqual(1, 2)
+
+
+class SecondTestClass(unittest.TestCase):
+    def test_four(self):
+        pass
+
+    @unittest.skip('not now')
+    def test_five(self):
+        pass
+'''
+
+
+class ParallelRunnerTestClass(unittest.TestCase):
+    """
+    All tests for manage.py test --parallel
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # one directory for the class, the sample module is only imported once
+        cls.directory = tempfile.mkdtemp()
+        with open(os.path.join(cls.directory, 'test_parallel_sample.py'), 'w') as sample:
+            sample.write(SAMPLE_TESTS)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_classes_are_balanced(self):
+        """
+        The biggest classes are spread first over the workers
+        """
+        suite = unittest.TestLoader().discover(self.directory)
+        self.assertEqual(partition(suite, 2), [['test_parallel_sample.FirstTestClass'],
+                                               ['test_parallel_sample.SecondTestClass']])
+        self.assertEqual(len(partition(suite, 8)), 2)
+
+    def test_results_are_merged(self):
+        """
+        The results of the workers are reported like a serial run
+        """
+        stream = io.StringIO()
+        result = run_parallel(2, start_dir=self.directory, stream=stream)
+        output = stream.getvalue()
+        self.assertEqual(result.testsRun, 5)
+        self.assertEqual(len(result.failures), 1)
+        self.assertEqual(len(result.skipped), 1)
+        self.assertIn('FAIL: test_three', output)
+        self.assertIn('A failing test', output)
+        self.assertIn('Ran 5 tests in', output)
+        self.assertTrue(output.endswith('FAILED (failures=1, skipped=1)\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+This module is for testing the typo-tolerant search
+"""
+
+
+import unittest
+import json
+from sqlalchemy import event
+from app.search import CandidateIndex
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class SearchTestClass(GroceryParentTestClass):
+    """
+    All tests for GET /search
+    """
+
+    def search(self, access_token, query):
+        response = self.make_get_request('/search?q=' + query, access_token)
+        return response.status_code, json.loads(response.data.decode())
+
+    def test_typos_match_across_lists(self):
+        """
+        A misspelled query finds the items of every list with their context
+        """
+        with self.app.app_context():
+            from app import db
+            access_token = self.get_default_token()
+            fruit_id = self.create_grocery_list(access_token, {'title': 'fruit'})[0]
+            party_id = self.create_grocery_list(access_token, {'title': 'banana party'})[0]
+            banana_id = self.add_item(access_token, fruit_id, 'banana')
+            self.add_item(access_token, fruit_id, 'apple')
+            bread_id = self.add_item(access_token, party_id, 'banana bread')
+
+            status, response = self.search(access_token, 'bannana')
+            self.assertEqual(status, 200)
+            self.assertEqual([(result['type'], result.get('item', {}).get('id'),
+                               result['list']['id']) for result in response],
+                             [('item', banana_id, fruit_id), ('item', bread_id, party_id),
+                              ('list', None, party_id)])
+            self.assertEqual(response[0]['list']['title'], 'fruit')
+            self.assertGreater(response[0]['score'], response[1]['score'])
+
+            statements = []
+
+            def count_statement(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', count_statement)
+            try:
+                self.search(access_token, 'aple')
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count_statement)
+            # the user and the context of the matches, the index is reused
+            self.assertEqual(len([statement for statement in statements
+                                  if 'groceryitem' in statement]), 1)
+
+            # writes drop the index so that new items are found
+            self.add_item(access_token, party_id, 'bananas')
+            status, response = self.search(access_token, 'bananas')
+            self.assertEqual(response[0]['item']['name'], 'bananas')
+
+            status, response = self.search(access_token, '')
+            self.assertEqual(status, 400)
+
+    def test_scoring_is_bounded_by_shared_trigrams(self):
+        """
+        Candidates without a trigram in common are not scored
+        """
+        index = CandidateIndex([('item', 1, 'milk'), ('item', 2, 'coffee'),
+                                ('item', 3, 'Milk')])
+        self.assertEqual([(kind, row_id) for _, kind, row_id in index.search('mlik', 5, 0.1)],
+                         [('item', 1), ('item', 3)])
+        self.assertEqual(index.search('zzz', 5, 0.1), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
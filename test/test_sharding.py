@@ -0,0 +1,161 @@
+"""
+This module is for testing the sharding of the lists and items by user
+"""
+
+
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from app import db, User, GroceryList, GroceryItem
+from app.database import configure_shards, rebalance_user, SHARD_BIND
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class ShardingTestClass(GroceryParentTestClass):
+    """
+    All tests for the sharded database
+    """
+    transactional = False
+
+    def setUp(self):
+        GroceryParentTestClass.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        configure_shards(self.app, ['sqlite:///' + os.path.join(self.directory, 'shard%d.db' % shard)
+                                    for shard in range(2)])
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        GroceryParentTestClass.tearDown(self)
+        shutil.rmtree(self.directory)
+
+    def shard_list_ids(self, shard):
+        engine = db.get_engine(self.app, bind=SHARD_BIND % shard)
+        return sorted(row[0] for row in engine.execute('SELECT id FROM grocerylist'))
+
+    def test_rows_live_on_the_shard_of_their_user(self):
+        """
+        The lists of a user are written to and read from their shard,
+        with ids unique across the shards
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            first_id = self.create_grocery_list(access_token, {'title': 'first'})[0]
+            self.make_request('POST', '/grocerylists/{}/items/'.format(first_id),
+                              headers=dict(Authorization='Bearer ' + access_token),
+                              data=json.dumps({'name': 'eggs'}))
+            # user 1 lives on shard 1 of 2
+            self.assertEqual(self.shard_list_ids(1), [first_id])
+            self.assertEqual(self.shard_list_ids(0), [])
+            self.assertEqual(db.session.execute('SELECT count(*) FROM grocerylist').scalar(), 0)
+
+            moved = rebalance_user(db, User.query.get(1), 0)
+            self.assertEqual(moved, 2)
+            self.assertEqual(User.query.get(1).shard, 0)
+            self.assertEqual(self.shard_list_ids(0), [first_id])
+            self.assertEqual(self.shard_list_ids(1), [])
+
+            second_id = self.create_grocery_list(access_token, {'title': 'second'})[0]
+            self.assertGreater(second_id, first_id)
+            response = self.make_get_request('/grocerylists/', access_token)
+            self.assertEqual([grocery_list['id'] for grocery_list
+                              in json.loads(response.data.decode())], [first_id, second_id])
+            response = self.make_get_request('/grocerylists/{}/items/'.format(first_id),
+                                             access_token)
+            self.assertEqual([item['name'] for item in json.loads(response.data.decode())],
+                             ['eggs'])
+
+    def test_change_log_moves_with_the_user(self):
+        """
+        The change log is written on the shard of the user and a sync
+        watermark stays valid after the user is moved
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            first_id = self.create_grocery_list(access_token, {'title': 'first'})[0]
+            shard_log = db.get_engine(self.app, bind=SHARD_BIND % 1)
+            self.assertEqual([tuple(row) for row in shard_log.execute(
+                'SELECT entity, entity_id FROM changelog')], [('grocerylist', first_id)])
+            self.assertEqual(db.session.execute('SELECT count(*) FROM changelog').scalar(), 0)
+            self.app.config['SYNC_WATERMARK_LAG'] = 0
+            watermark = json.loads(self.make_get_request(
+                '/sync', access_token).data.decode())['watermark']
+
+            rebalance_user(db, User.query.get(1), 0)
+            second_id = self.create_grocery_list(access_token, {'title': 'second'})[0]
+            response = self.make_get_request('/sync?since=%d' % watermark, access_token)
+            changes = json.loads(response.data.decode())['changes']
+            self.assertEqual([change['id'] for change in changes], [second_id])
+
+    def test_writes_wait_for_the_move(self):
+        """
+        The writes of a user being moved are refused so that none is
+        left behind on the old shard, the reads still work
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            first_id = self.create_grocery_list(access_token, {'title': 'first'})[0]
+            user = User.query.get(1)
+            user.moving = True
+            db.session.commit()
+            response = self.make_request('POST', '/grocerylists/',
+                                         headers=dict(Authorization='Bearer ' + access_token),
+                                         data=json.dumps({'title': 'second'}))
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('Retry-After', response.headers)
+            response = self.make_get_request('/grocerylists/', access_token)
+            self.assertEqual([grocery_list['id'] for grocery_list
+                              in json.loads(response.data.decode())], [first_id])
+
+            rebalance_user(db, User.query.get(1), 0)
+            self.assertFalse(User.query.get(1).moving)
+            response = self.create_grocery_list(access_token, {'title': 'second'})[1]
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(self.shard_list_ids(0)), 2)
+            self.assertEqual(self.shard_list_ids(1), [])
+
+    def test_unit_backfill_visits_the_shards(self):
+        """
+        The base units of the items are filled in on the shards
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+            self.add_item(access_token, grocery_list_id, 'eggs')
+            shard_items = db.get_engine(self.app, bind=SHARD_BIND % 1)
+            shard_items.execute('UPDATE groceryitem SET base_unit = NULL, base_quantity = NULL')
+            self.assertEqual(GroceryItem.backfill_base_units(), 1)
+            self.assertEqual([tuple(row) for row in shard_items.execute(
+                'SELECT base_unit FROM groceryitem')], [('units',)])
+
+    def test_sharded_tables_only_reference_sharded_tables(self):
+        """
+        No foreign key of a shard points at a table that is not on the shard
+        """
+        for table in db.sharded_tables():
+            for foreign_key in table.foreign_keys:
+                self.assertTrue(foreign_key.column.table.info.get('sharded'), foreign_key)
+
+    def test_ids_continue_after_existing_rows(self):
+        """
+        The first block of ids starts after the ids already used
+        """
+        with self.app.app_context():
+            user = User('john doe', 'john@example.com', 'password', 'john')
+            user.save()
+            with db.using_shard(0):
+                db.session.execute(GroceryList.__table__.insert(),
+                                   {'id': 41, 'title': 'old', 'user_id': user.id})
+                db.session.commit()
+                grocery_list = GroceryList('new', owner=user)
+                grocery_list.save()
+                self.assertEqual(grocery_list.id, 42)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+This module is for testing the slow query log
+"""
+
+
+import unittest
+import os
+import shutil
+import tempfile
+from app import db
+from app.slowquery import SlowQueryLog, parameter_shape, read_slow_queries, start_slow_query_log
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class SlowQueryTestClass(GroceryParentTestClass):
+    """
+    All tests for the slow query log
+    """
+    transactional = False
+
+    def setUp(self):
+        GroceryParentTestClass.setUp(self)
+        # the plans are fetched on another connection, which needs a database file
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.directory = tempfile.mkdtemp()
+        self.app.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + self.path,
+                               SLOW_QUERY_ENABLED=True, SLOW_QUERY_THRESHOLD_MS=0,
+                               SLOW_QUERY_MAX_ENTRIES=5, SLOW_QUERY_DIR=self.directory)
+        with self.app.app_context():
+            db.create_all()
+        self.slow_queries = start_slow_query_log(self.app)
+
+    def tearDown(self):
+        self.slow_queries.stop()
+        GroceryParentTestClass.tearDown(self)
+        os.remove(self.path)
+        shutil.rmtree(self.directory)
+
+    def test_statements_of_a_request_are_explained(self):
+        """
+        The slowest statements are kept with their route, parameter shapes
+        and plan, and written to the file of the process
+        """
+        access_token = self.get_default_token()
+        grocery_list_id = self.create_grocery_list(access_token)[0]
+        self.slow_queries.clear()
+        response = self.make_get_request('/grocerylists/{}'.format(grocery_list_id), access_token)
+        self.assertEqual(response.status_code, 200)
+        self.slow_queries.wait()
+
+        entries = self.slow_queries.entries()
+        self.assertTrue(entries)
+        self.assertLessEqual(len(entries), 5)
+        durations = [entry['duration_ms'] for entry in entries]
+        self.assertEqual(durations, sorted(durations, reverse=True))
+        selects = [entry for entry in entries if 'FROM grocerylist' in entry['statement']]
+        self.assertTrue(selects)
+        self.assertEqual(selects[0]['route'], 'GET /grocerylists/<int:id>')
+        self.assertIn('int', selects[0]['parameters'])
+        self.assertIsInstance(selects[0]['plan'], list)
+        self.assertIn('grocerylist', ' '.join(' '.join(row) for row in selects[0]['plan']))
+        logged = read_slow_queries(self.directory)
+        self.assertEqual([entry['statement'] for entry in logged],
+                         [entry['statement'] for entry in entries])
+
+    def test_only_the_slowest_are_kept(self):
+        """
+        A full log replaces its fastest statement with a slower one
+        """
+        slow_queries = SlowQueryLog(self.app, max_entries=3)
+        for duration in (5, 1, 9, 3, 7, 2):
+            slow_queries.record({'duration_ms': duration})
+        self.assertEqual([entry['duration_ms'] for entry in slow_queries.entries()], [9, 7, 5])
+        self.assertEqual(parameter_shape({'id': 1, 'name': 'eggs'}), {'id': 'int', 'name': 'str'})
+        self.assertEqual(parameter_shape([(1, 'a'), (2, 'b')], executemany=True),
+                         {'rows': 2, 'row': ['int', 'str']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+This module is for testing the pragmas set on the sqlite connections
+"""
+
+
+import unittest
+import os
+import tempfile
+from app import db
+from app.database import sqlite_pragmas
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class SqliteProfileTestClass(GroceryParentTestClass):
+    """
+    All tests for the sqlite engine profile
+    """
+    transactional = False
+
+    def setUp(self):
+        GroceryParentTestClass.setUp(self)
+        # WAL needs a database file, it does not apply to memory databases
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.path
+
+    def tearDown(self):
+        GroceryParentTestClass.tearDown(self)
+        with self.app.app_context():
+            db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def pragma(self, name):
+        return db.engine.execute('PRAGMA %s' % name).scalar()
+
+    def test_pragmas_are_set_on_connect(self):
+        """
+        Every connection gets the pragmas of the configuration
+        """
+        with self.app.app_context():
+            self.assertEqual(self.pragma('journal_mode'), 'wal')
+            self.assertEqual(self.pragma('busy_timeout'), 5000)
+            self.assertEqual(self.pragma('cache_size'), -20000)
+            # synchronous is OFF in the testing configuration
+            self.assertEqual(self.pragma('synchronous'), 0)
+
+    def test_profile_can_be_disabled(self):
+        """
+        Without the profile the sqlite defaults are kept
+        """
+        self.app.config['SQLITE_PROFILE_ENABLED'] = False
+        with self.app.app_context():
+            self.assertEqual(self.pragma('journal_mode'), 'delete')
+
+    def test_invalid_values_are_rejected(self):
+        """
+        The values are checked before they are put in the PRAGMA statements
+        """
+        with self.assertRaises(ValueError):
+            sqlite_pragmas({'SQLITE_JOURNAL_MODE': 'WAL; DROP TABLE users'})
+        self.assertEqual(sqlite_pragmas({'SQLITE_BUSY_TIMEOUT': 100}), [('busy_timeout', 100)])
+
+
+if __name__ == '__main__':
+    unittest.main()
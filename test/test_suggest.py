@@ -0,0 +1,95 @@
+"""
+This module is for testing the item name suggestions
+"""
+
+
+import unittest
+import json
+from app.suggest import NameIndex, SuggestionCache
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class SuggestTestClass(GroceryParentTestClass):
+    """
+    All tests for GET /items/suggest
+    """
+
+    def suggest(self, access_token, prefix):
+        response = self.make_get_request('/items/suggest?prefix=' + prefix, access_token)
+        return [(row['name'], row['uses']) for row in json.loads(response.data.decode())]
+
+    def test_index_follows_the_writes(self):
+        """
+        The index is built once and kept up to date by inserts, renames and deletes
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+            for name in ('milk', 'milk', 'mint', 'eggs'):
+                self.add_item(access_token, grocery_list_id, name)
+            self.assertEqual(self.suggest(access_token, 'mi'), [('milk', 2), ('mint', 1)])
+
+            cache = self.app.extensions['suggest']
+            builds = []
+            build = cache.build
+            cache.build = lambda user_id: builds.append(user_id) or build(user_id)
+            try:
+                mango_id = self.add_item(access_token, grocery_list_id, 'mango')
+                self.make_request('PUT', '/grocerylists/{}/items/{}'.format(
+                    grocery_list_id, mango_id),
+                    headers=dict(Authorization='Bearer ' + access_token),
+                    data=json.dumps({'name': 'mint'}))
+                self.assertEqual(self.suggest(access_token, 'm'),
+                                 [('milk', 2), ('mint', 2)])
+                self.make_request('DELETE', '/grocerylists/{}/items/{}'.format(
+                    grocery_list_id, mango_id),
+                    headers=dict(Authorization='Bearer ' + access_token))
+                self.assertEqual(self.suggest(access_token, 'MIN'), [('mint', 1)])
+            finally:
+                cache.build = build
+            self.assertEqual(builds, [])
+
+            self.make_request('DELETE', '/grocerylists/{}'.format(grocery_list_id),
+                              headers=dict(Authorization='Bearer ' + access_token))
+            self.assertEqual(self.suggest(access_token, 'm'), [])
+
+    def test_prefix_is_required(self):
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            response = self.make_get_request('/items/suggest?prefix=', access_token)
+            self.assertEqual(response.status_code, 400)
+
+
+class SuggestionCacheTestClass(unittest.TestCase):
+    """
+    All tests for the in-memory indexes
+    """
+
+    def test_least_recently_used_users_are_dropped(self):
+        cache = SuggestionCache(max_users=2)
+        cache.build = lambda user_id: NameIndex({'bread': user_id})
+        for user_id in (1, 2, 1, 3):
+            cache.suggest(user_id, 'b', 5)
+        self.assertEqual(list(cache.indexes), [1, 3])
+        self.assertEqual(cache.suggest(3, 'br', 5), [('bread', 3)])
+
+    def test_old_indexes_are_rebuilt(self):
+        """
+        An index older than max_age is built again, so that the writes
+        handled by other workers show up
+        """
+        cache = SuggestionCache(max_users=2, max_age=60)
+        builds = []
+        cache.build = lambda user_id: builds.append(user_id) or NameIndex({'bread': len(builds)})
+        self.assertEqual(cache.suggest(1, 'b', 5), [('bread', 1)])
+        self.assertEqual(cache.suggest(1, 'b', 5), [('bread', 1)])
+        cache.indexes[1].created -= 61
+        self.assertEqual(cache.suggest(1, 'b', 5), [('bread', 2)])
+        self.assertEqual(builds, [1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+This module is for testing the sync blueprint in app
+"""
+
+
+import unittest
+import json
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class SyncTestClass(GroceryParentTestClass):
+    """
+    All tests for the delta sync
+    """
+
+    def setUp(self):
+        GroceryParentTestClass.setUp(self)
+        # the watermark moves past the entries right away
+        self.app.config['SYNC_WATERMARK_LAG'] = 0
+
+    def sync(self, access_token, query_string=''):
+        response = self.make_get_request('/sync' + query_string, access_token)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode())
+
+    def test_sync_since_watermark(self):
+        """
+        A sync returns only the changes after the watermark,
+        collapsed to the last operation of each list and item
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+            eggs_id = self.add_item(access_token, grocery_list_id, 'eggs')
+
+            first_sync = self.sync(access_token)
+            self.assertFalse(first_sync['has_more'])
+            self.assertEqual([(change['type'], change['op']) for change in first_sync['changes']],
+                             [('list', 'create'), ('item', 'create')])
+            self.assertEqual(first_sync['changes'][1]['data']['name'], 'eggs')
+
+            # nothing changed since the last sync
+            watermark = first_sync['watermark']
+            self.assertEqual(self.sync(access_token, '?since=%d' % watermark),
+                             {'changes': [], 'watermark': watermark, 'has_more': False})
+
+            milk_id = self.add_item(access_token, grocery_list_id, 'milk')
+            self.make_request('PUT', '/grocerylists/{}/items/{}'.format(grocery_list_id, milk_id),
+                              headers=dict(Authorization='Bearer ' + access_token),
+                              data=json.dumps({'name': 'oat milk', 'quantity': 2}))
+            self.make_request('DELETE', '/grocerylists/{}/items/{}'.format(grocery_list_id, eggs_id),
+                              headers=dict(Authorization='Bearer ' + access_token))
+
+            second_sync = self.sync(access_token, '?since=%d' % watermark)
+            changes = dict((change['id'], change) for change in second_sync['changes'])
+            self.assertEqual(len(changes), 2)
+            self.assertEqual(changes[milk_id]['op'], 'update')
+            self.assertEqual(changes[milk_id]['data']['name'], 'oat milk')
+            self.assertEqual(changes[eggs_id]['op'], 'delete')
+            self.assertGreater(second_sync['watermark'], watermark)
+
+    def test_sync_pages(self):
+        """
+        A sync returns at most limit entries and says when there are more
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            for title in ('first', 'second', 'third'):
+                self.create_grocery_list(access_token, {'title': title})
+            first_page = self.sync(access_token, '?limit=2')
+            self.assertTrue(first_page['has_more'])
+            self.assertEqual(len(first_page['changes']), 2)
+            second_page = self.sync(access_token, '?limit=2&since=%d' % first_page['watermark'])
+            self.assertFalse(second_page['has_more'])
+            self.assertEqual(second_page['changes'][0]['data']['title'], 'third')
+
+    def test_watermark_waits_for_older_commits(self):
+        """
+        The watermark does not move past recent entries, which are sent
+        again until they are old enough
+        """
+        self.app.config['SYNC_WATERMARK_LAG'] = 60
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+            first_sync = self.sync(access_token)
+            self.assertEqual(first_sync['watermark'], 0)
+            self.assertEqual([change['id'] for change in first_sync['changes']], [grocery_list_id])
+            self.assertEqual(self.sync(access_token, '?since=0')['changes'],
+                             first_sync['changes'])
+
+            self.app.config['SYNC_WATERMARK_LAG'] = 0
+            second_sync = self.sync(access_token)
+            self.assertGreater(second_sync['watermark'], 0)
+            self.assertEqual(self.sync(access_token, '?since=%d' % second_sync['watermark'])
+                             ['changes'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+This module is for testing the tracing of the requests
+"""
+
+
+import unittest
+import json
+import os
+import tempfile
+from app.tracing import read_traces, span, start_tracing, summarize_traces
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class TracingTestClass(GroceryParentTestClass):
+    """
+    All tests for app.tracing
+    """
+
+    def setUp(self):
+        GroceryParentTestClass.setUp(self)
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.app.config.update(TRACING_ENABLED=True, TRACE_SAMPLE_RATE=1, TRACE_FILE=self.path)
+        self.tracer = start_tracing(self.app)
+
+    def tearDown(self):
+        GroceryParentTestClass.tearDown(self)
+        os.remove(self.path)
+
+    def test_spans_of_the_traced_views(self):
+        """
+        The spans of login and of the lists view are linked to their
+        parent and summarized per route
+        """
+        self.create_user()
+        # buffered, so that the test client closes the responses like a server
+        with self.app.app_context():
+            client = self.client()
+            response = client.post('/auth/login', buffered=True, data=json.dumps(
+                {'username': self.user_data['username'], 'password': self.user_data['password']}))
+            access_token = json.loads(response.data.decode())['access_token']
+            headers = dict(Authorization='Bearer ' + access_token)
+            client.post('/grocerylists/', headers=headers, buffered=True,
+                        data=json.dumps(self.grocery_list_data))
+            response = client.get('/grocerylists/', headers=headers, buffered=True)
+        self.assertEqual(response.status_code, 200)
+
+        traces = dict((traced['route'], traced) for traced in read_traces(self.path))
+        self.assertEqual(set(traces), {'POST /auth/login', 'POST /grocerylists/',
+                                       'GET /grocerylists/'})
+        login = traces['POST /auth/login']
+        self.assertEqual(login['status'], 200)
+        self.assertEqual([traced['name'] for traced in login['spans']],
+                         ['request', 'auth.user_lookup', 'auth.password_check',
+                          'auth.token_encode', 'db.refresh_token', 'serialize',
+                          'response.write'])
+        listed = dict((traced['name'], traced) for traced in traces['GET /grocerylists/']['spans'])
+        self.assertIsNone(listed['request']['parent_id'])
+        self.assertEqual(listed['db.query']['parent_id'], listed['request']['id'])
+        self.assertEqual(listed['serialize']['attributes'], {'rows': 1})
+        for traced in listed.values():
+            self.assertLessEqual(traced['start_ms'] + traced['duration_ms'],
+                                 traces['GET /grocerylists/']['duration_ms'] + 0.01)
+
+        summary = summarize_traces(read_traces(self.path))
+        self.assertEqual(summary['GET /grocerylists/']['requests'], 1)
+        self.assertIn('untraced', summary['GET /grocerylists/']['spans'])
+        self.assertIn('auth.password_check', summary['POST /auth/login']['spans'])
+
+    def test_requests_not_sampled(self):
+        """
+        Nothing is recorded for the requests left out by the sample rate
+        """
+        self.tracer.sample_rate = 0
+        self.get_default_token()
+        with self.app.app_context():
+            with span('db.query') as opened:
+                self.assertIsNone(opened)
+        self.assertEqual(list(read_traces(self.path)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
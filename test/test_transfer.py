@@ -0,0 +1,149 @@
+"""
+This module is for testing the transfer blueprint in app
+"""
+
+
+import unittest
+import gzip
+import json
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class ImportTestClass(GroceryParentTestClass):
+    """
+    All tests for the bulk import
+    """
+
+    def import_data(self, access_token, data, content_type, query_string=''):
+        with self.app.app_context():
+            return self.client().post('/grocerylists/import' + query_string,
+                                      headers=dict(Authorization='Bearer ' + access_token),
+                                      content_type=content_type,
+                                      data=data)
+
+    def test_csv_import(self):
+        """
+        A CSV upload creates the missing lists and all the valid items
+        and reports the invalid rows
+        """
+        self.app.config['IMPORT_BATCH_SIZE'] = 2
+        data = ('list_title,list_description,name,quantity,unit\n'
+                'Weekly,food,eggs,12,units\n'
+                'Weekly,food,milk,2,l\n'
+                'Party,,chips,three,packs\n'
+                'Party,,soda,6,\n'
+                ',,no list,1,units\n')
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            response = self.import_data(access_token, data, 'text/csv')
+            self.assertEqual(response.status_code, 200)
+            result = json.loads(response.data.decode())
+            self.assertEqual(result['rows'], 5)
+            self.assertEqual(result['imported'], 3)
+            self.assertEqual(result['errors'], 2)
+            self.assertEqual(result['batches'], 2)
+            self.assertEqual(result['lists_created'], 2)
+            self.assertEqual([error['row'] for error in result['error_details']], [3, 5])
+
+            response = self.make_get_request('/grocerylists/?q=Weekly', access_token)
+            weekly = json.loads(response.data.decode())
+            self.assertEqual(len(weekly), 1)
+            response = self.make_get_request(
+                '/grocerylists/{}/items/'.format(weekly[0]['id']), access_token)
+            names = [item['name'] for item in json.loads(response.data.decode())]
+            self.assertEqual(sorted(names), ['eggs', 'milk'])
+
+    def test_ndjson_import_with_progress(self):
+        """
+        An NDJSON upload adds items to an existing list and streams
+        the progress events
+        """
+        self.app.config['IMPORT_BATCH_SIZE'] = 1
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            self.create_grocery_list(access_token, {'title': 'Existing'})
+            data = '\n'.join([
+                json.dumps({'list_title': 'Existing', 'name': 'rice', 'quantity': 1}),
+                'not json',
+                json.dumps({'list_title': 'Existing', 'name': 'beans'}),
+            ])
+            response = self.import_data(access_token, data, 'application/x-ndjson',
+                                        '?progress=stream')
+            self.assertEqual(response.status_code, 200)
+            events = [json.loads(line) for line in response.data.decode().splitlines()]
+            self.assertEqual([event['event'] for event in events],
+                             ['progress', 'error', 'progress', 'done'])
+            self.assertEqual(events[-1]['imported'], 2)
+            self.assertEqual(events[-1]['lists_created'], 0)
+
+    def test_ndjson_values_of_the_wrong_type(self):
+        """
+        A row whose text fields are not strings is reported alone
+        instead of failing the import
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            data = '\n'.join([
+                json.dumps({'list_title': 5, 'name': 'rice'}),
+                json.dumps({'list_title': 'Weekly', 'name': ['rice']}),
+                json.dumps({'list_title': 'Weekly', 'name': 'rice', 'unit': 2}),
+                json.dumps({'list_title': 'Weekly', 'name': 'rice', 'list_description': {}}),
+                json.dumps({'list_title': 'Weekly', 'name': 'beans'}),
+            ])
+            response = self.import_data(access_token, data, 'application/x-ndjson')
+            self.assertEqual(response.status_code, 200)
+            result = json.loads(response.data.decode())
+            self.assertEqual(result['imported'], 1)
+            self.assertEqual([error['row'] for error in result['error_details']], [1, 2, 3, 4])
+            self.assertEqual(result['error_details'][0]['message'],
+                             'list_title should be a string')
+
+    def test_import_without_data(self):
+        """
+        An empty upload is rejected
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            response = self.import_data(access_token, '', 'text/csv')
+            self.assertEqual(response.status_code, 400)
+
+
+class ExportTestClass(GroceryParentTestClass):
+    """
+    All tests for the account export
+    """
+
+    def test_export(self):
+        """
+        Every list is followed by its items, and empty lists are included
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            first_list_id = self.create_grocery_list(access_token, {'title': 'First'})[0]
+            second_list_id = self.create_grocery_list(access_token, {'title': 'Second'})[0]
+            for name in ('eggs', 'milk'):
+                self.make_request('POST', '/grocerylists/{}/items/'.format(first_list_id),
+                                  headers=dict(Authorization='Bearer ' + access_token),
+                                  data=json.dumps({'name': name, 'quantity': 2}))
+            response = self.make_get_request('/export', access_token)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            lines = [json.loads(line) for line in response.data.decode().splitlines()]
+            self.assertEqual([(line['type'], line.get('name') or line.get('title'))
+                              for line in lines],
+                             [('list', 'First'), ('item', 'eggs'), ('item', 'milk'),
+                              ('list', 'Second')])
+            self.assertEqual(lines[1]['list_id'], first_list_id)
+            self.assertEqual(lines[3]['id'], second_list_id)
+
+            # the same export as a gzip archive
+            response = self.make_get_request('/export?compress=gzip', access_token)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(gzip.decompress(response.data).decode().splitlines()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
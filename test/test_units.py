@@ -0,0 +1,123 @@
+"""
+This module is for testing the unit registry and the normalized quantities
+"""
+
+
+import unittest
+import json
+from app import db, GroceryItem
+from app.models import units
+try:
+    from .common_functions import GroceryParentTestClass
+except (ImportError, SystemError):
+    from common_functions import GroceryParentTestClass
+
+
+class UnitRegistryTestClass(unittest.TestCase):
+    """
+    All tests for the unit registry
+    """
+
+    def test_lookup_and_conversion(self):
+        """
+        Aliases, case and plurals resolve to the same unit
+        """
+        registry = units.registry
+        for text in ('kg', 'Kg', ' KILOS ', 'kilogram'):
+            self.assertEqual(registry.lookup(text).name, 'kg')
+        self.assertEqual(registry.lookup('grams').name, 'g')
+        self.assertIsNone(registry.lookup('baskets'))
+        self.assertEqual(registry.to_base(1.5, 'kg'), ('g', 1500))
+        self.assertEqual(registry.to_base(2, 'dozen'), ('units', 24))
+        self.assertEqual(registry.to_base(3, 'Baskets'), ('baskets', 3))
+        self.assertEqual(registry.convert(500, 'ml', 'l'), 0.5)
+        self.assertRaises(ValueError, registry.convert, 1, 'kg', 'l')
+
+    def check_many(self):
+        base_units, quantities = units.registry.to_base_many(
+            [1, 250, 2, 3], ['kg', 'g', 'L', 'packs'])
+        self.assertEqual(base_units, ['g', 'g', 'ml', 'packs'])
+        self.assertEqual(list(quantities), [1000, 250, 2000, 3])
+        self.assertEqual(list(units.registry.convert_many([1000, 500], 'g', 'kg')), [1, 0.5])
+
+    @unittest.skipIf(units.numpy is None, 'numpy is not installed')
+    def test_many_with_numpy(self):
+        """
+        Arrays of quantities are converted with NumPy
+        """
+        self.check_many()
+
+    def test_many_without_numpy(self):
+        """
+        Arrays of quantities are converted with the array fallback
+        """
+        numpy = units.numpy
+        units.numpy = None
+        try:
+            self.check_many()
+        finally:
+            units.numpy = numpy
+
+
+class NormalizedQuantityTestClass(GroceryParentTestClass):
+    """
+    All tests for the base unit and quantity of the items
+    """
+
+    def test_writes_store_the_base_quantity(self):
+        """
+        Creating and editing an item keeps its base unit and quantity up to date
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+            response = self.make_request('POST', '/grocerylists/{}/items/'.format(grocery_list_id),
+                                         headers=dict(Authorization='Bearer ' + access_token),
+                                         data=json.dumps({'name': 'flour', 'quantity': 2,
+                                                          'unit': 'Kg'}))
+            item_id = json.loads(response.data.decode())['id']
+            item = GroceryItem.query.get(item_id)
+            self.assertEqual((item.unit, item.base_unit, item.base_quantity), ('Kg', 'g', 2000))
+
+            item.set_unit('lbs')
+            self.assertEqual(item.base_unit, 'g')
+            self.assertAlmostEqual(item.base_quantity, 907.18474)
+            item.set_quantity(1)
+            self.assertAlmostEqual(item.base_quantity, 453.59237)
+
+    def test_unit_that_is_not_a_string(self):
+        """
+        A number sent as the unit is saved as before instead of failing the insert
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+            response = self.make_request('POST', '/grocerylists/{}/items/'.format(grocery_list_id),
+                                         headers=dict(Authorization='Bearer ' + access_token),
+                                         data=json.dumps({'name': 'milk', 'unit': 5,
+                                                          'quantity': 2}))
+            self.assertEqual(response.status_code, 201)
+            item = GroceryItem.query.get(json.loads(response.data.decode())['id'])
+            self.assertEqual((item.base_unit, item.base_quantity), ('5', 2))
+
+    def test_backfill(self):
+        """
+        Items saved without a base unit get one from the backfill
+        """
+        with self.app.app_context():
+            access_token = self.get_default_token()
+            grocery_list_id = self.create_grocery_list(access_token)[0]
+            for unit in ('l', 'cups', 'baskets'):
+                self.make_request('POST', '/grocerylists/{}/items/'.format(grocery_list_id),
+                                  headers=dict(Authorization='Bearer ' + access_token),
+                                  data=json.dumps({'name': 'milk', 'quantity': 2, 'unit': unit}))
+            db.session.query(GroceryItem).update({'base_unit': None, 'base_quantity': None})
+            db.session.commit()
+            self.assertEqual(GroceryItem.backfill_base_units(batch_size=2), 3)
+            self.assertEqual([(item.base_unit, item.base_quantity)
+                              for item in GroceryItem.query.order_by(GroceryItem.id)],
+                             [('ml', 2000), ('ml', 480), ('baskets', 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()